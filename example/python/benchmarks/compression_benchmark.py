@@ -0,0 +1,46 @@
+"""
+Throughput (MB/s of uncompressed text) and compression ratio of compressed line files
+written by `ContentHandler.write_iterator` and read by `iterate_lines` / `iterate_lines_parallel`.
+
+The bundled sample data is small, so it is repeated `REPEAT` times. This overstates the ratio
+of formats with a large window (xz), which find the repetitions.
+"""
+import time
+
+import cbc.content as content
+
+REPEAT = 20
+WORKERS = 4
+BLOCK_SIZE = 1024 * 1024
+
+sample_handler = content.FileSystemContentHandler(base_prefix="../../sample_data")
+h = content.FileSystemContentHandler(base_prefix="../../../temp/benchmark")
+
+lines = list(sample_handler.iterate_lines("dewiki_simple_short.txt")) + \
+    list(sample_handler.iterate_lines("rss_tokens.txt"))
+lines = lines * REPEAT
+size_mb = sum(len(line.encode("utf-8")) for line in lines) / 1e6
+print("input: %i lines, %.1f MB" % (len(lines), size_mb))
+print("%-6s %10s %10s %12s %14s" % ("", "ratio", "write MB/s", "read MB/s", "par. read MB/s"))
+
+for compression in (None, "gzip", "bz2", "xz"):
+    key = "compression_benchmark.txt"
+    start = time.time()
+    h.write_iterator(iter(lines), key, compression=compression, compression_workers=WORKERS,
+                     compression_block_size=BLOCK_SIZE)
+    t_write = time.time() - start
+    compressed_mb = h.get_full_path(key).stat().st_size / 1e6
+
+    start = time.time()
+    n = sum(1 for _ in h.iterate_lines(key, compression=compression))
+    t_read = time.time() - start
+    assert n == len(lines)
+
+    start = time.time()
+    n = sum(1 for _ in h.iterate_lines_parallel(key, compression=compression, workers=WORKERS))
+    t_read_parallel = time.time() - start
+    assert n == len(lines)
+
+    print("%-6s %10.2f %10.1f %12.1f %14.1f" % (
+        compression, size_mb / compressed_mb, size_mb / t_write, size_mb / t_read, size_mb / t_read_parallel
+    ))
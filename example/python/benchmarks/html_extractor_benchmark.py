@@ -0,0 +1,65 @@
+"""
+Pages per second of the BeautifulSoup extractor of `example/python/rss_scraper/extract_spiegel_fs.py`
+and of the precompiled `cbc.nlp.html_extractors.SPIEGEL_EXTRACTOR` on the raw pages saved by the scraper.
+
+Reads the .raw files in `RAW_FOLDER`/`PREFIX` (written by extract_spiegel_fs.py). If there are none,
+generated article pages are used.
+"""
+import time
+
+from bs4 import BeautifulSoup as bs
+
+import cbc.content as content
+from cbc.nlp.html_extractors import SPIEGEL_EXTRACTOR
+
+RAW_FOLDER = "../../../temp/raw"
+PREFIX = "spiegel"
+MAX_PAGES = 500
+REPEAT = 3
+
+
+def spiegel_extractor(html):
+    soup = bs(html, "lxml")
+    for c in soup.find_all('div'):
+        if c.has_attr('class'):
+            if "article-copyright" in c['class']:
+                c.clear()
+    text = "\n\n".join([p.get_text() for p in soup.find_all(['p', 'h', 'h1', 'h2', 'h3', 'title'])])
+
+    return text.strip()
+
+
+def generated_pages(n):
+    navigation = "".join("<li><a href='/r/%i'>Ressort %i</a></li>" % (i, i) for i in range(200))
+    for i in range(n):
+        paragraphs = "".join("<p>Absatz %i des Artikels %i mit <b>etwas</b> Text.</p>" % (j, i) for j in range(30))
+        yield (
+            "<html><head><title>Artikel %i</title><script>var x = %i;</script></head><body>"
+            "<nav><ul>%s</ul></nav><article><h1>Artikel %i</h1><div class='article-section'>%s</div>"
+            "<div class='article-copyright'><p>(c) 2022</p></div></article></body></html>"
+            % (i, i, navigation, i, paragraphs)
+        ).encode("utf-8")
+
+
+h = content.FileSystemContentHandler(base_prefix=RAW_FOLDER)
+keys = [k for k in h.list(PREFIX) if k.endswith(".raw")][:MAX_PAGES] if h.exists(PREFIX) else []
+if keys:
+    pages = [h.get_bytes(k, prefix=PREFIX) for k in keys]
+    source = "%s/%s" % (RAW_FOLDER, PREFIX)
+else:
+    pages = list(generated_pages(MAX_PAGES))
+    source = "generated"
+size_mb = sum(len(p) for p in pages) / 1e6
+print("%i pages (%s), %.1f MB" % (len(pages), source, size_mb))
+
+different = sum(1 for p in pages if spiegel_extractor(p) != SPIEGEL_EXTRACTOR(p))
+print("pages with different text: %i" % different)
+
+print("%-14s %10s %10s" % ("", "pages/s", "MB/s"))
+for name, extractor in (("BeautifulSoup", spiegel_extractor), ("lxml", SPIEGEL_EXTRACTOR)):
+    start = time.time()
+    for _ in range(REPEAT):
+        for p in pages:
+            extractor(p)
+    t = time.time() - start
+    print("%-14s %10.0f %10.1f" % (name, REPEAT * len(pages) / t, REPEAT * size_mb / t))
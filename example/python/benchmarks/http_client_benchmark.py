@@ -0,0 +1,69 @@
+"""
+Requests per second of `urllib.request.urlopen` (one connection per request) and of the pooled
+keep-alive `cbc.nlp.http_client.HttpClient`, serially and with a thread pool, against a local http server.
+
+A local server has almost no connection setup cost. Against remote hosts (in particular https) the
+saving of the pooled client per request is a TCP (and TLS) handshake, i.e. one or more round trips.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+from cbc.nlp.http_client import HttpClient
+
+REQUESTS = 1000
+WORKERS = 8
+BODY = b"<html><body>" + b"<p>paragraph</p>" * 500 + b"</body></html>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+server.daemon_threads = True
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base_url = "http://127.0.0.1:%i/page/" % server.server_address[1]
+urls = [base_url + str(i) for i in range(REQUESTS)]
+
+
+def get_urllib(url):
+    with urlopen(Request(url, headers={'User-Agent': 'Mozilla/5.0'}), timeout=30) as response:
+        return len(response.read())
+
+
+client = HttpClient(max_connections_per_host=WORKERS)
+
+
+def get_pooled(url):
+    return len(client.get(url).body)
+
+
+print("%i requests of %i bytes, %i threads" % (REQUESTS, len(BODY), WORKERS))
+print("%-8s %12s %12s" % ("", "serial r/s", "threads r/s"))
+for name, get in (("urllib", get_urllib), ("pooled", get_pooled)):
+    start = time.time()
+    assert all(get(url) == len(BODY) for url in urls)
+    t_serial = time.time() - start
+
+    start = time.time()
+    with ThreadPoolExecutor(WORKERS) as executor:
+        assert all(n == len(BODY) for n in executor.map(get, urls))
+    t_threads = time.time() - start
+    print("%-8s %12.0f %12.0f" % (name, REQUESTS / t_serial, REQUESTS / t_threads))
+
+print("pooled client: %s" % client.stats)
+server.shutdown()
@@ -0,0 +1,62 @@
+"""
+Overhead of `cbc.instrumentation.PipelineInstrumentation` on pipelines of three item modifiers, for stages
+spending different times per item (a busy loop), and the overhead per item and stage in microseconds.
+
+Usage: python instrumentation_benchmark.py [<number of items>]
+
+The overhead per item and stage is constant (two clock reads and the call of the wrapper), so the relative
+overhead falls with the work done per item.
+"""
+import sys
+from time import perf_counter
+
+import cbc.pipeline as pipeline
+from cbc.instrumentation import PipelineInstrumentation
+
+NUMBER_OF_ITEMS = 20000
+STAGES = 3
+REPEAT = 5
+
+
+def work(microseconds):
+    def f(x):
+        end = perf_counter() + microseconds * 1e-6
+        while perf_counter() < end:
+            pass
+        return x
+
+    return f
+
+
+def build(n, microseconds):
+    p = pipeline.ListGenerator(list(range(n)))
+    for _ in range(STAGES):
+        p = pipeline.ItemModifier(f=work(microseconds)) ** p
+    return p
+
+
+def best_time(n, microseconds, instrumented):
+    times = []
+    for _ in range(REPEAT):
+        if instrumented:
+            with PipelineInstrumentation():
+                p = build(n, microseconds)
+        else:
+            p = build(n, microseconds)
+        start = perf_counter()
+        for _ in p:
+            pass
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER_OF_ITEMS
+    print("%i items, %i item modifiers" % (n, STAGES))
+    for microseconds in (0, 10, 100, 1000):
+        items = n if microseconds < 100 else n // 10
+        plain = best_time(items, microseconds, False)
+        instrumented = best_time(items, microseconds, True)
+        print("%6i us/item and stage: overhead %6.1f%%, %5.2f us per item and stage" % (
+            microseconds, 100 * (instrumented - plain) / plain, (instrumented - plain) / items / (STAGES + 1) * 1e6
+        ))
@@ -0,0 +1,82 @@
+"""
+Time of a full and of an incremental update of `cbc.nlp.wiki_incremental.IncrementalWikiText` with a second
+dump in which a share of the pages is changed, added or deleted, and check that the incremental result equals
+a full rebuild.
+
+Usage: python wiki_incremental_benchmark.py [<number of pages> [<share of changed pages>]]
+
+Generated dumps are written to temp/benchmark.
+"""
+import bz2
+import filecmp
+import os
+import random
+import sys
+import time
+
+from cbc.nlp.wiki_incremental import IncrementalWikiText
+
+NUMBER_OF_PAGES = 20000
+CHANGED = 0.03
+FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../temp/benchmark")
+WORDS = ("Stadt Fluss Jahr Geschichte Einwohner Bahnhof Kirche Schule Berg Land Gemeinde Kreis Straße "
+         "wurde liegt hatte gehört nach gegen unter über zwischen").split()
+HEADER = ('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="de">\n'
+          '  <siteinfo>\n    <sitename>Wikipedia</sitename>\n  </siteinfo>\n')
+PAGE = ('  <page>\n    <title>%s</title>\n    <ns>0</ns>\n    <id>%i</id>\n    <revision>\n'
+        '      <id>%i</id>\n      <text xml:space="preserve">%s</text>\n    </revision>\n  </page>\n')
+
+
+def page_text(r):
+    return "\n\n".join(
+        "'''%s''' " % r.choice(WORDS) + " ".join(
+            "[[%s]]" % w if r.random() < 0.1 else w for w in (r.choice(WORDS) for _ in range(r.randint(20, 80)))
+        ) + "{{Quelle|%s}}" % r.choice(WORDS)
+        for _ in range(r.randint(3, 15))
+    )
+
+
+def write_dump(fname, pages):
+    with bz2.open(fname, "wt", encoding="utf-8") as f:
+        f.write(HEADER)
+        for pageid, text in sorted(pages.items()):
+            f.write(PAGE % ("Seite %i" % pageid, pageid, pageid, text))
+        f.write("</mediawiki>\n")
+
+
+def timed_update(store, fname, **kwargs):
+    start = time.time()
+    report = store.update(fname, **kwargs)
+    print("%-12s %6.1f s  new=%i changed=%i unchanged=%i deleted=%i" % (
+        os.path.basename(store.folder), time.time() - start,
+        report["new"], report["changed"], report["unchanged"], report["deleted"]))
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER_OF_PAGES
+    share = float(sys.argv[2]) if len(sys.argv) > 2 else CHANGED
+    r = random.Random(1)
+    os.makedirs(FOLDER, exist_ok=True)
+    pages = {pageid: page_text(r) for pageid in range(1, n + 1)}
+    dump_1 = os.path.join(FOLDER, "incremental-1.xml.bz2")
+    write_dump(dump_1, pages)
+    for pageid in r.sample(sorted(pages), int(n * share)):
+        x = r.random()
+        if x < 0.2:
+            del pages[pageid]
+        elif x < 0.4:
+            pages[n + pageid] = page_text(r)
+        else:
+            pages[pageid] = page_text(r)
+    dump_2 = os.path.join(FOLDER, "incremental-2.xml.bz2")
+    write_dump(dump_2, pages)
+
+    incremental = IncrementalWikiText(os.path.join(FOLDER, "incremental"))
+    timed_update(incremental, dump_1, rebuild=True)
+    timed_update(incremental, dump_2)
+    full = IncrementalWikiText(os.path.join(FOLDER, "full"))
+    timed_update(full, dump_2, rebuild=True)
+    print("incremental result equals full rebuild: %s" % (
+        filecmp.cmp(incremental.articles_file, full.articles_file, shallow=False)
+        and filecmp.cmp(incremental.index_file, full.index_file, shallow=False)
+    ))
@@ -0,0 +1,107 @@
+"""
+Compare the single pass markup stripper (`strip_markup`) with the regex cascade (`remove_markup`) of
+`cbc.nlp.wikitools.filter_wiki`: share of articles with identical output, share with identical tokens and
+throughput in MB/s.
+
+Usage: python wiki_markup_benchmark.py [<pages-articles.xml.bz2> [<number of articles>]]
+
+Without a dump, generated articles with typical markup (nested templates, references, comments, tables,
+links, files with links in the caption, categories, language links) are used. The default engine of `filter_wiki`
+is "regex", "single_pass" is used with `markup_engine="single_pass"`.
+"""
+import bz2
+import random
+import sys
+import time
+
+from gensim import utils
+
+from cbc.nlp.wikitools import extract_pages, filter_wiki
+
+NUMBER_OF_ARTICLES = 2000
+WORDS = ("Stadt Fluss Jahr Geschichte Einwohner Bahnhof Kirche Schule Berg Land Gemeinde Kreis Straße "
+         "wurde liegt hatte gehört nach gegen unter über zwischen").split()
+
+
+def words(r, n):
+    return " ".join(r.choice(WORDS) for _ in range(n))
+
+
+def generated_article(r):
+    parts = ["{{Infobox Ort|Name=%s|Einwohner={{Formatnum:%i}}|Karte={{Lageplan|x=1|y={{Wert|2}}}}}}\n"
+             % (r.choice(WORDS), r.randint(100, 100000))]
+    for _ in range(r.randint(3, 12)):
+        p = []
+        for _ in range(r.randint(3, 10)):
+            x = r.random()
+            if x < 0.25:
+                p.append("[[%s]]" % r.choice(WORDS))
+            elif x < 0.4:
+                p.append("[[%s|%s]]" % (r.choice(WORDS), words(r, 2)))
+            elif x < 0.5:
+                p.append("'''%s'''" % r.choice(WORDS))
+            elif x < 0.6:
+                p.append('<ref name="q%i">{{Internetquelle|url=http://example.org/%i|titel=%s}}</ref>'
+                         % (r.randint(1, 9), r.randint(1, 999), words(r, 3)))
+            elif x < 0.65:
+                p.append('<ref name="q%i" />' % r.randint(1, 9))
+            elif x < 0.7:
+                p.append("[http://example.org/%i %s]" % (r.randint(1, 999), words(r, 2)))
+            elif x < 0.75:
+                p.append("<!-- %s -->" % words(r, 3))
+            elif x < 0.8:
+                p.append("{{lang|en|%s}}" % words(r, 2))
+            p.append(words(r, r.randint(3, 15)) + ".")
+        parts.append(" ".join(p) + "\n\n")
+        if r.random() < 0.3:
+            parts.append("== %s ==\n" % words(r, 2))
+        if r.random() < 0.2:
+            parts.append("[[Datei:Bild%i.jpg|mini|%s]]\n" % (r.randint(1, 99), words(r, 4)))
+        if r.random() < 0.2:
+            parts.append("[[File:Image%i.png|thumb|200px|%s]]\n" % (r.randint(1, 99), words(r, 4)))
+        if r.random() < 0.1:
+            # captions with links
+            parts.append("[[Datei:Bild%i.jpg|mini|%s [[%s]] %s]]\n" % (r.randint(1, 99), words(r, 2),
+                                                                     r.choice(WORDS), words(r, 2)))
+            parts.append("[[File:Image%i.png|thumb|%s [[%s|%s]]]]\n" % (r.randint(1, 99), words(r, 2),
+                                                                      r.choice(WORDS), words(r, 1)))
+        if r.random() < 0.15:
+            rows = "".join("|-\n| %s || %s || [[%s]]\n" % (words(r, 1), words(r, 2), r.choice(WORDS))
+                           for _ in range(r.randint(2, 8)))
+            parts.append('{| class="wikitable"\n! Name !! Wert !! Link\n%s|}\n' % rows)
+    parts.append("\n[[Category:%s]]\n[[Kategorie:%s]]" % (r.choice(WORDS), r.choice(WORDS)))
+    parts.append("\n[[en:%s]]\n[[fr:%s]]" % (r.choice(WORDS), r.choice(WORDS)))
+    return "".join(parts)
+
+
+if len(sys.argv) > 1:
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else NUMBER_OF_ARTICLES
+    articles = []
+    for title, text, pageid in extract_pages(bz2.BZ2File(sys.argv[1]), ('0',)):
+        if text:
+            articles.append(text)
+        if len(articles) >= n:
+            break
+    source = sys.argv[1]
+else:
+    rnd = random.Random(1)
+    articles = [generated_article(rnd) for _ in range(NUMBER_OF_ARTICLES)]
+    source = "generated"
+
+size_mb = sum(len(a.encode("utf-8")) for a in articles) / 1e6
+print("%i articles (%s), %.1f MB" % (len(articles), source, size_mb))
+
+results = {}
+for engine in ("regex", "single_pass"):
+    start = time.time()
+    results[engine] = [filter_wiki(a, markup_engine=engine) for a in articles]
+    t = time.time() - start
+    print("%-12s %8.2f MB/s %8.0f articles/s" % (engine, size_mb / t, len(articles) / t))
+
+same_text = sum(1 for a, b in zip(results["regex"], results["single_pass"]) if a == b)
+same_tokens = sum(
+    1 for a, b in zip(results["regex"], results["single_pass"])
+    if list(utils.tokenize(a, lower=True)) == list(utils.tokenize(b, lower=True))
+)
+print("identical text: %.1f%%, identical tokens: %.1f%%" % (
+    100.0 * same_text / len(articles), 100.0 * same_tokens / len(articles)))
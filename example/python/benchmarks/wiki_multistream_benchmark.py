@@ -0,0 +1,72 @@
+"""
+Pages per second of the sequential `cbc.nlp.wikitools.extract_pages` on a bz2 dump and of the parallel
+`extract_pages_multistream` (ordered and unordered) on the same pages as a multistream dump with index.
+
+Usage: python wiki_multistream_benchmark.py [<pages-articles-multistream.xml.bz2> <multistream-index.txt.bz2>]
+
+Without a dump a multistream dump of generated pages is written to temp/benchmark. The speedup of the
+multistream reader grows with the number of cpus, bz2 decompression dominates the sequential reader.
+"""
+import bz2
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from cbc.nlp.wikitools import extract_pages, extract_pages_multistream
+
+NUMBER_OF_PAGES = 20000
+PAGES_PER_STREAM = 100
+FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../temp/benchmark")
+WORDS = ("Stadt Fluss Jahr Geschichte Einwohner Bahnhof Kirche Schule Berg Land Gemeinde Kreis Straße "
+         "wurde liegt hatte gehört nach gegen unter über zwischen").split()
+HEADER = ('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="de">\n'
+          '  <siteinfo>\n    <sitename>Wikipedia</sitename>\n  </siteinfo>\n')
+PAGE = ('  <page>\n    <title>%s</title>\n    <ns>0</ns>\n    <id>%i</id>\n    <revision>\n'
+        '      <id>%i</id>\n      <text xml:space="preserve">%s</text>\n    </revision>\n  </page>\n')
+
+
+def write_multistream_dump(fname, index_fname, n):
+    r = random.Random(1)
+    with open(fname, "wb") as dump, bz2.open(index_fname, "wt", encoding="utf-8") as index:
+        dump.write(bz2.compress(HEADER.encode("utf-8")))
+        for first in range(1, n + 1, PAGES_PER_STREAM):
+            offset = dump.tell()
+            pages = []
+            for pageid in range(first, min(n + 1, first + PAGES_PER_STREAM)):
+                title = "Seite %i" % pageid
+                text = "\n\n".join(
+                    " ".join(r.choice(WORDS) for _ in range(r.randint(20, 80))) for _ in range(r.randint(3, 15))
+                )
+                pages.append(PAGE % (title, pageid, pageid, text))
+                index.write("%i:%i:%s\n" % (offset, pageid, title))
+            dump.write(bz2.compress("".join(pages).encode("utf-8")))
+        dump.write(bz2.compress(b"</mediawiki>\n"))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        dump_fname, index_fname = sys.argv[1], sys.argv[2]
+    else:
+        os.makedirs(FOLDER, exist_ok=True)
+        dump_fname = os.path.join(FOLDER, "multistream.xml.bz2")
+        index_fname = os.path.join(FOLDER, "multistream-index.txt.bz2")
+        write_multistream_dump(dump_fname, index_fname, NUMBER_OF_PAGES)
+    print("%s, %.1f MB, %i cpus" % (dump_fname, os.path.getsize(dump_fname) / 1e6, multiprocessing.cpu_count()))
+
+    start = time.time()
+    sequential = [pageid for title, text, pageid in extract_pages(bz2.BZ2File(dump_fname))]
+    t = time.time() - start
+    print("%-24s %8.0f pages/s" % ("extract_pages", len(sequential) / t))
+
+    for ordered in (True, False):
+        start = time.time()
+        pages = [pageid for title, text, pageid in extract_pages_multistream(dump_fname, index_fname, ordered=ordered)]
+        t = time.time() - start
+        name = "multistream (%s)" % ("ordered" if ordered else "unordered")
+        print("%-24s %8.0f pages/s" % (name, len(pages) / t))
+        if ordered:
+            print("same pages in same order: %s" % (pages == sequential))
+        else:
+            print("same pages: %s" % (sorted(pages) == sorted(sequential)))
@@ -0,0 +1,59 @@
+"""
+CPU time of the parent process of `cbc.nlp.wikitools.wiki_to_simple_text_sharded` against the wall time, compared
+with writing the shards from the articles of `WikiCorpus.get_texts` (formatted and written one by one by the
+parent). The parent limits the speedup to about 1 / (share of the parent) processes.
+
+Usage: python wiki_sharded_benchmark.py [<pages-articles-multistream.xml.bz2> <multistream-index.txt.bz2>]
+
+Without a dump a multistream dump of generated pages is written to temp/benchmark (see
+wiki_multistream_benchmark.py). The share is only meaningful on a single cpu (wall time = cpu time of all
+processes), with more cpus the wall time shrinks.
+"""
+import multiprocessing
+import os
+import sys
+import time
+import zlib
+
+from cbc.nlp.wikitools import WikiCorpus, format_article, wiki_to_simple_text_sharded
+from wiki_multistream_benchmark import FOLDER, write_multistream_dump
+
+NUMBER_OF_PAGES = 20000
+SHARDS = 8
+
+
+def write_from_texts(dump_fname, index_fname, key):
+    files = [open("%s.%05i.txt" % (key, n), "wb") for n in range(SHARDS)]
+    index = []
+    for text, title, pageid in WikiCorpus(dump_fname, dictionary={}, index_fname=index_fname).get_texts():
+        n = zlib.crc32(str(pageid).encode('utf-8')) % SHARDS
+        article = format_article(pageid, title, text).encode('utf-8')
+        index.append((pageid, title, files[n].tell(), len(article)))
+        files[n].write(article)
+    for f in files:
+        f.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        dump_fname, index_fname = sys.argv[1], sys.argv[2]
+    else:
+        os.makedirs(FOLDER, exist_ok=True)
+        dump_fname = os.path.join(FOLDER, "multistream.xml.bz2")
+        index_fname = os.path.join(FOLDER, "multistream-index.txt.bz2")
+        if not os.path.exists(dump_fname):
+            write_multistream_dump(dump_fname, index_fname, NUMBER_OF_PAGES)
+    folder = os.path.join(FOLDER, "shards")
+    os.makedirs(folder, exist_ok=True)
+    print("%s, %.1f MB, %i cpus" % (dump_fname, os.path.getsize(dump_fname) / 1e6, multiprocessing.cpu_count()))
+
+    for name, function in (
+            ("parent writes texts", lambda: write_from_texts(dump_fname, index_fname, os.path.join(folder, "texts"))),
+            ("wiki_to_simple_text_sharded", lambda: wiki_to_simple_text_sharded(
+                dump_fname, os.path.join(folder, "wiki"), shards=SHARDS, index_fname=index_fname
+            ))
+    ):
+        start, start_cpu = time.time(), time.process_time()
+        function()
+        t, t_cpu = time.time() - start, time.process_time() - start_cpu
+        print("%-28s %6.2f s, parent cpu %5.2f s (%4.1f%%)" % (name, t, t_cpu, 100 * t_cpu / t))
@@ -0,0 +1,46 @@
+"""
+Words per second of `cbc.nlp.word2vec_tools.Word2VecWrap` trained from a pipeline iterator and from a
+corpus file (gensim's `corpus_file` mode), for an increasing number of workers.
+
+Usage: python word2vec_corpus_file_benchmark.py [<number of documents>]
+
+The corpus consists of generated documents with Zipf distributed words. In iterator mode the words per second
+stop growing at a few workers (one python thread feeds all workers), in corpus file mode they grow with the
+number of cpus.
+"""
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+import cbc.pipeline as pipeline
+from cbc.nlp.word2vec_tools import Word2VecWrap
+
+NUMBER_OF_DOCUMENTS = 20000
+FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../temp/benchmark")
+
+
+def generated_documents(n, vocabulary_size=20000, seed=1):
+    random_state = np.random.RandomState(seed)
+    words = ["w%i" % i for i in range(vocabulary_size)]
+    for _ in range(n):
+        ids = np.minimum(random_state.zipf(1.2, size=random_state.randint(50, 300)), vocabulary_size) - 1
+        yield [words[i] for i in ids]
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER_OF_DOCUMENTS
+    os.makedirs(FOLDER, exist_ok=True)
+    documents = list(generated_documents(n))
+    print("%i documents, %i words, %i cpus" % (
+        len(documents), sum(len(d) for d in documents), multiprocessing.cpu_count()))
+    for workers in sorted({1, 2, 4, multiprocessing.cpu_count()}):
+        for corpus_file in (None, "w2v_benchmark_corpus.txt"):
+            w2v = Word2VecWrap(
+                os.path.join(FOLDER, "w2v_benchmark"), corpus_file=corpus_file, base_folder=FOLDER,
+                reuse_corpus_file=True, workers=workers, epochs=2
+            )
+            w2v ** pipeline.ListGenerator(documents)
+            print("workers=%2i %-12s %10.0f words/s" % (
+                workers, w2v.stats["mode"], w2v.stats["words_per_second"]))
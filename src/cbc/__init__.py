@@ -1,7 +1,7 @@
 import importlib
 from  . import data
 
-EXAMPLE_LIST = ["bw_rs_feed.xml", "rki_rs_feed.xml", "dewiki_simple_short.txt"]
+EXAMPLE_LIST = ["bw_rs_feed.xml", "rki_rs_feed.xml", "dewiki_simple_short.txt", "dewiki_markup_sample.xml"]
 
 def get_example_list():
     """Function to list all available examples."""
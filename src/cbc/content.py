@@ -4,13 +4,25 @@ Content sources of streaming data:
 Currently, the _file system_ and _AWS S3_ are used as content sources.
 
 Other content sources may be implemented by extending the abstract base class ``ContentHandler``
+
+Text streams may be compressed (gzip, bz2, xz). The compression is chosen by the suffix of the key
+(".gz", ".bz2", ".xz") or explicitly by the parameter `compression`. Compressed outputs are written
+as a sequence of independently compressed blocks ("members") by background threads. The positions
+of the members are stored in a sidecar file (key + ".members.json") which allows decompressing them in parallel.
 """
 
+import bz2
+import codecs
+import gzip
+import json
 import logging
+import lzma
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from os import listdir
-from os.path import isfile
+from os.path import isfile, splitext
 from typing import Optional, Union, Any
 
 import boto3
@@ -23,26 +35,116 @@ logger = logging.getLogger('cbc.nlp.content')
 
 DEFAULT_CHUNK_SIZE = 16384
 
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+
+COMPRESSION_OPEN = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+SMART_OPEN_COMPRESSION = {"gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+MEMBER_INDEX_SUFFIX = ".members.json"
+
+DEFAULT_COMPRESSION_BLOCK_SIZE = 4 * 1024 * 1024
+
+DEFAULT_COMPRESSION_WORKERS = 2
+
+
+def get_compression(key, compression="infer"):
+    """
+    Determine the compression of a key.
+
+    Args:
+        :key (str): the key (file name)
+        :compression (str, default="infer"): "infer" (determine from the suffix of `key`), None (no compression),
+            "gzip", "bz2" or "xz"
+    """
+    if compression == "infer":
+        return COMPRESSION_SUFFIXES.get(splitext(str(key))[1])
+    if compression is not None and compression not in COMPRESSION_OPEN:
+        raise ValueError("Unsupported compression '%s', use one of %s" % (compression, list(COMPRESSION_OPEN)))
+    return compression
+
+
+def compress_block(compression, data, level=None):
+    """
+    Compress `data` as a single, complete member of the given compression format.
+    """
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6 if level is None else level)
+    elif compression == "bz2":
+        return bz2.compress(data, compresslevel=9 if level is None else level)
+    elif compression == "xz":
+        return lzma.compress(data, preset=level)
+    raise ValueError("Unsupported compression '%s'" % compression)
+
+
+def decompress_block(compression, data):
+    if compression == "gzip":
+        return gzip.decompress(data)
+    elif compression == "bz2":
+        return bz2.decompress(data)
+    elif compression == "xz":
+        return lzma.decompress(data)
+    raise ValueError("Unsupported compression '%s'" % compression)
+
+
+class BlockCompressor:
+    """
+    Compresses blocks of bytes in background threads and returns the compressed
+    blocks in the order of submission.
+    zlib, bz2 and lzma release the GIL while compressing, so the threads run in parallel to the pipeline.
+    """
+
+    def __init__(self, compression, level=None, workers=DEFAULT_COMPRESSION_WORKERS, max_pending=None):
+        self.compression = compression
+        self.level = level
+        self.max_pending = max_pending if max_pending is not None else 2 * workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = deque()
+        self.members = []
+        self.offset = 0
+
+    def submit(self, block):
+        self.pending.append(
+            (len(block), self.executor.submit(compress_block, self.compression, block, self.level))
+        )
+
+    def is_full(self):
+        return len(self.pending) >= self.max_pending
+
+    def pop(self):
+        raw_length, future = self.pending.popleft()
+        data = future.result()
+        self.members.append([self.offset, len(data), raw_length])
+        self.offset += len(data)
+        return data
+
+    def member_index(self):
+        return json.dumps({"compression": self.compression, "members": self.members})
+
+    def close(self):
+        self.executor.shutdown()
+
 
 class IteratorReader(io.RawIOBase):
 
     def __init__(self, iterator, to_bytes_function=lambda x: x):
         self.iterator = iterator
         self.to_bytes_function = to_bytes_function
-        self.leftover = []
+        self.leftover = bytearray()
 
     def readinto(self, buffer: bytearray) -> Optional[int]:
         size = len(buffer)
         while len(self.leftover) < size:
             try:
-                self.leftover.extend(self.to_bytes_function(next(self.iterator)))
+                self.leftover += self.to_bytes_function(next(self.iterator))
             except StopIteration:
                 break
 
         if len(self.leftover) == 0:
             return None
 
-        output, self.leftover = self.leftover[:size], self.leftover[size:]
+        output = self.leftover[:size]
+        del self.leftover[:size]
         buffer[:len(output)] = output
         return len(output)
 
@@ -50,6 +152,113 @@ class IteratorReader(io.RawIOBase):
         return True
 
 
+class CompressingReader(io.RawIOBase):
+    """
+    Reads from `in_stream` and provides the compressed bytes. Blocks of `block_size` bytes
+    are compressed by a BlockCompressor in background threads.
+    """
+
+    def __init__(self, in_stream, compressor: BlockCompressor, block_size=DEFAULT_COMPRESSION_BLOCK_SIZE):
+        self.in_stream = in_stream
+        self.compressor = compressor
+        self.block_size = block_size
+        self.eof = False
+        self.output = b""
+        self.output_pos = 0
+
+    def read_block(self):
+        block = bytearray()
+        while len(block) < self.block_size:
+            r = self.in_stream.read(self.block_size - len(block))
+            if not r:
+                self.eof = True
+                break
+            block += r
+        return block
+
+    def readinto(self, buffer: bytearray) -> Optional[int]:
+        while self.output_pos >= len(self.output):
+            while not self.eof and not self.compressor.is_full():
+                block = self.read_block()
+                if len(block) > 0:
+                    self.compressor.submit(block)
+            if len(self.compressor.pending) == 0:
+                return None
+            self.output = self.compressor.pop()
+            self.output_pos = 0
+        n = min(len(buffer), len(self.output) - self.output_pos)
+        buffer[:n] = self.output[self.output_pos:self.output_pos + n]
+        self.output_pos += n
+        return n
+
+    def readable(self) -> bool:
+        return True
+
+
+class CompressingWriter(io.RawIOBase):
+    """
+    File like object compressing everything written to it in blocks of `block_size` bytes
+    (see BlockCompressor) and writing the compressed blocks to `fileobj`.
+    If `member_index_file` is given, the positions of the compressed blocks are written to it on close.
+    """
+
+    def __init__(self, fileobj, compressor: BlockCompressor, block_size=DEFAULT_COMPRESSION_BLOCK_SIZE,
+                 member_index_file=None):
+        self.fileobj = fileobj
+        self.compressor = compressor
+        self.block_size = block_size
+        self.member_index_file = member_index_file
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.buffer += b
+        while len(self.buffer) >= self.block_size:
+            self.compressor.submit(self.buffer[:self.block_size])
+            del self.buffer[:self.block_size]
+            while self.compressor.is_full():
+                self.fileobj.write(self.compressor.pop())
+        return len(b)
+
+    def close(self):
+        if not self.closed:
+            try:
+                if len(self.buffer) > 0:
+                    self.compressor.submit(self.buffer)
+                    self.buffer = bytearray()
+                while len(self.compressor.pending) > 0:
+                    self.fileobj.write(self.compressor.pop())
+            finally:
+                self.compressor.close()
+                self.fileobj.close()
+            if self.member_index_file is not None:
+                with open(self.member_index_file, "w") as f:
+                    f.write(self.compressor.member_index())
+        super().close()
+
+
+def open_text_writer(filename, encoding=None, compression="infer", compression_level=None,
+                     block_size=DEFAULT_COMPRESSION_BLOCK_SIZE, workers=DEFAULT_COMPRESSION_WORKERS):
+    """
+    Open a local file for writing text. If the file is compressed (see `get_compression`), the compression runs
+    in background threads and a member index (filename + ".members.json") is written on close.
+    """
+    compression_ = get_compression(filename, compression)
+    if compression_ is None:
+        if encoding is None:
+            return codecs.open(filename, 'w')
+        return codecs.open(filename, 'w', encoding)
+    writer = CompressingWriter(
+        open(filename, 'wb'),
+        BlockCompressor(compression_, level=compression_level, workers=workers),
+        block_size=block_size,
+        member_index_file=str(filename) + MEMBER_INDEX_SUFFIX
+    )
+    return io.TextIOWrapper(io.BufferedWriter(writer), encoding=encoding)
+
+
 class ContentHandler(ABC):
 
     def __init__(
@@ -84,9 +293,45 @@ class ContentHandler(ABC):
         pass
 
     @abstractmethod
-    def iterate_lines(self, key: str, prefix=""):
+    def iterate_lines(self, key: str, prefix="", compression="infer"):
         pass
 
+    def exists(self, key: str, prefix="") -> bool:
+        return key in self.list(prefix=prefix)
+
+    def get_byte_range(self, key: str, start: int, length: int, prefix="") -> bytes:
+        return self.get_bytes(key, prefix=prefix)[start:start + length]
+
+    def iterate_lines_parallel(self, key: str, prefix="", compression="infer", workers=4):
+        """
+        Iterate over the lines of a compressed text which has been written with a member index
+        (see `write_iterator`). The members are decompressed by `workers` threads in parallel.
+        Falls back to `iterate_lines` if there is no member index.
+        """
+        compression_ = get_compression(key, compression)
+        index_key = key + MEMBER_INDEX_SUFFIX
+        if compression_ is None or not self.exists(index_key, prefix=prefix):
+            yield from self.iterate_lines(key, prefix=prefix, compression=compression)
+            return
+        members = json.loads(self.get_text(index_key, prefix=prefix))["members"]
+
+        def decompress(member):
+            return decompress_block(compression_, self.get_byte_range(key, member[0], member[1], prefix=prefix))
+
+        def blocks():
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for member in members:
+                    pending.append(executor.submit(decompress, member))
+                    if len(pending) >= 2 * workers:
+                        yield pending.popleft().result()
+                while len(pending) > 0:
+                    yield pending.popleft().result()
+
+        with io.TextIOWrapper(io.BufferedReader(IteratorReader(blocks())), encoding=self.encoding) as file:
+            for line in file:
+                yield line
+
     @classmethod
     def append_prefix(cls, base_prefix: str, prefix: str) -> str:
         sep = ""
@@ -98,7 +343,9 @@ class ContentHandler(ABC):
     def write_input_stream(self, in_stream: io.RawIOBase, key: str, prefix=""):
         pass
 
-    def write_iterator(self, iterator, key: str, prefix="", to_bytes_function=None):
+    def write_iterator(self, iterator, key: str, prefix="", to_bytes_function=None, compression="infer",
+                       compression_level=None, compression_workers=DEFAULT_COMPRESSION_WORKERS,
+                       compression_block_size=DEFAULT_COMPRESSION_BLOCK_SIZE):
         if to_bytes_function is None:
             def to_bytes_function_(x: Any):
                 return str(x).encode(self.encoding)
@@ -106,7 +353,18 @@ class ContentHandler(ABC):
             to_bytes_function_ = to_bytes_function
 
         i_reader = IteratorReader(iterator, to_bytes_function=to_bytes_function_)
-        self.write_input_stream(i_reader, key, prefix=prefix)
+        compression_ = get_compression(key, compression)
+        if compression_ is None:
+            self.write_input_stream(i_reader, key, prefix=prefix)
+        else:
+            compressor = BlockCompressor(compression_, level=compression_level, workers=compression_workers)
+            try:
+                self.write_input_stream(
+                    CompressingReader(i_reader, compressor, block_size=compression_block_size), key, prefix=prefix
+                )
+            finally:
+                compressor.close()
+            self.save_text(key + MEMBER_INDEX_SUFFIX, compressor.member_index(), prefix=prefix)
 
 
 class FileSystemContentHandler(ContentHandler, ABC):
@@ -151,12 +409,25 @@ class FileSystemContentHandler(ContentHandler, ABC):
         bytes_ = self.get_full_path(key, prefix=prefix).read_bytes()
         return bytes_
 
-    def iterate_lines(self, key, prefix=""):
-        with open(self.get_full_path(key, prefix=prefix), 'r', encoding=self.encoding) as file:
+    def iterate_lines(self, key, prefix="", compression="infer"):
+        compression_ = get_compression(key, compression)
+        if compression_ is None:
+            file = open(self.get_full_path(key, prefix=prefix), 'r', encoding=self.encoding)
+        else:
+            file = COMPRESSION_OPEN[compression_](self.get_full_path(key, prefix=prefix), 'rt', encoding=self.encoding)
+        with file:
             for line in file:
                 yield line
             file.close()
 
+    def exists(self, key, prefix=""):
+        return self.get_full_path(key, prefix=prefix).is_file()
+
+    def get_byte_range(self, key, start, length, prefix=""):
+        with open(self.get_full_path(key, prefix=prefix), 'rb') as file:
+            file.seek(start)
+            return file.read(length)
+
     def write_input_stream(self, in_stream: io.RawIOBase, key: str, prefix=""):
         with open(self.get_full_path(key, prefix=prefix), 'wb') as fout:
             while True:
@@ -225,16 +496,42 @@ class AwsS3ContentHandler(ContentHandler, ABC):
         bytes_ = response['Body'].read()
         return bytes_
 
-    def iterate_lines(self, key, prefix=""):
-        with s3_open(
+    def iterate_lines(self, key, prefix="", compression="infer"):
+        compression_ = get_compression(key, compression)
+        if compression_ is None:
+            file = s3_open(
                 "s3://" + self.bucket + "/" + self.get_full_key(key, prefix=prefix),
                 boto_session=boto3.session.Session(),
                 deserializer=deserialize.string
-        ) as file:
+            )
+        else:
+            file = smart_open.open(
+                "s3://" + self.bucket + "/" + self.get_full_key(key, prefix=prefix),
+                'r',
+                encoding=self.encoding,
+                compression=SMART_OPEN_COMPRESSION[compression_],
+                transport_params={'client': self.client}
+            )
+        with file:
             for line in file:
                 yield line
             file.close()
 
+    def exists(self, key, prefix=""):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.get_full_key(key, prefix=prefix))
+            return True
+        except self.client.exceptions.ClientError:
+            return False
+
+    def get_byte_range(self, key, start, length, prefix=""):
+        response = self.client.get_object(
+            Bucket=self.bucket,
+            Key=self.get_full_key(key, prefix=prefix),
+            Range="bytes=%i-%i" % (start, start + length - 1)
+        )
+        return response['Body'].read()
+
     def write_input_stream(self, in_stream: io.RawIOBase, key: str, prefix=""):
         full_prefix = self.append_prefix(self.base_prefix, prefix)
         full_key = self.append_prefix(full_prefix, key)
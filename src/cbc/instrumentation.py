@@ -0,0 +1,584 @@
+"""
+Instrumentation of pipelines:
+
+Records for every stage of a pipeline the number of items read and produced, the wall and cpu time
+spent and - for sources reading from a ContentHandler - the number of bytes read.
+
+The instrumentation is opt-in. It applies to all pipelines which are *built* (using the operator `**`)
+while it is enabled. Pipelines built without instrumentation are not affected at all. The stages of an
+instrumented pipeline are still `pipeline.Iterator` instances.
+
+Example:
+
+::
+
+    >>> import cbc.pipeline as pipeline
+    >>> from cbc.instrumentation import PipelineInstrumentation
+    >>> with PipelineInstrumentation() as instrumentation:
+    ...     p = pipeline.ItemModifier(f=lambda x: x if x % 2 == 0 else None) ** pipeline.ListGenerator(range(10))
+    ...     l_ = list(p)
+    >>> print(instrumentation.json_report())
+    >>> instrumentation.write_prometheus("/var/lib/node_exporter/pipeline.prom")
+
+The times of a stage are measured *inclusive* of the stages it reads from. The report contains
+the inclusive times as well as the times of the stage itself ("self_wall_time", "self_cpu_time").
+
+Overhead:
+
+Every item produced by a stage costs two clock reads (wall and thread cpu time), about 1-2 microseconds per
+item and stage. This is less than 2% for stages spending 0.1 ms or more per item (e.g. parsing or tokenizing
+texts), but dominates stages doing almost nothing per item. See
+`example/python/benchmarks/instrumentation_benchmark.py`.
+
+Memory:
+
+`PipelineMemoryInstrumentation` additionally attributes memory allocations (traced by `tracemalloc`)
+to the stages: the memory retained by a stage (allocated and not freed) and its peak memory.
+`MemoryMonitor` measures the memory of the rounds of long running jobs (e.g. `RssScraper.poll`) and
+warns if the memory grows monotonically. `check_memory_budget` fails if the steady-state memory of a
+pipeline exceeds a budget and can be used in unit tests.
+
+Tracing memory slows down python considerably, so use the memory instrumentation for diagnosis only.
+The attribution of memory to stages assumes that the pipeline runs in a single thread.
+"""
+import json
+import logging
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter, thread_time
+
+from . import content
+from . import pipeline
+
+logger = logging.getLogger('cbc.instrumentation')
+
+SOURCE = "source"
+ITEM_MODIFIER = "item_modifier"
+ITERATOR_MODIFIER = "iterator_modifier"
+CONSUMER = "consumer"
+
+PROMETHEUS_PREFIX = "cbc_pipeline"
+
+PROMETHEUS_METRICS = (
+    ("items_in", "items_in_total", "counter", "Items read by a pipeline stage."),
+    ("items_out", "items_out_total", "counter", "Items produced by a pipeline stage."),
+    ("dropped", "items_dropped_total", "counter", "Items dropped (None) by an item modifier."),
+    ("wall_time", "wall_seconds_total", "counter", "Wall time of a stage including its inputs."),
+    ("cpu_time", "cpu_seconds_total", "counter", "CPU time of a stage including its inputs."),
+    ("self_wall_time", "self_wall_seconds_total", "counter", "Wall time of a stage excluding its inputs."),
+    ("self_cpu_time", "self_cpu_seconds_total", "counter", "CPU time of a stage excluding its inputs."),
+    ("bytes_read", "bytes_read_total", "counter", "Bytes read from content handlers by a source."),
+    ("items_per_second", "items_per_second", "gauge", "Items produced per second (wall time)."),
+)
+
+
+class StageMetrics:
+    """
+    The measurements of a single pipeline stage.
+    """
+
+    def __init__(self, name, kind, inputs=()):
+        self.name = name
+        self.kind = kind
+        self.inputs = list(inputs)
+        self.items_out = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.bytes_read = 0
+
+    @property
+    def items_in(self):
+        return sum(i.items_out for i in self.inputs)
+
+    def to_dict(self):
+        wall_in = sum(i.wall_time for i in self.inputs)
+        cpu_in = sum(i.cpu_time for i in self.inputs)
+        result = {
+            "name": self.name,
+            "type": self.kind,
+            "inputs": [i.name for i in self.inputs],
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "self_wall_time": max(0.0, self.wall_time - wall_in),
+            "self_cpu_time": max(0.0, self.cpu_time - cpu_in),
+            "bytes_read": self.bytes_read,
+            "items_per_second": self.items_out / self.wall_time if self.wall_time > 0 else 0.0
+        }
+        if self.kind == ITEM_MODIFIER:
+            result["dropped"] = result["items_in"] - result["items_out"]
+        if self.kind == CONSUMER:
+            result["items_out"] = 0
+            result["items_per_second"] = result["items_in"] / self.wall_time if self.wall_time > 0 else 0.0
+        return result
+
+
+class InstrumentedIterator(pipeline.Iterator):
+    """
+    Wraps an iterator (or generator) of a pipeline and measures the calls of `__next__`.
+    """
+
+    def __init__(self, iterator, metrics):
+        # no call of Iterator.__init__, the wrapped iterator creates its generator itself
+        self.iterator = iterator
+        self.metrics = metrics
+
+    @property
+    def is_tagged(self):
+        return self.iterator.is_tagged
+
+    def __getattr__(self, name):
+        if name == "iterator":
+            raise AttributeError(name)
+        return getattr(self.iterator, name)
+
+    def __iter__(self):
+        self.iterator.__iter__()
+        return self
+
+    def __next__(self):
+        metrics = self.metrics
+        wall = perf_counter()
+        cpu = thread_time()
+        try:
+            result = next(self.iterator)
+        finally:
+            metrics.wall_time += perf_counter() - wall
+            metrics.cpu_time += thread_time() - cpu
+        metrics.items_out += 1
+        return result
+
+
+class CountingContentHandler:
+    """
+    A proxy of the content handler of a source counting the bytes read through it into the metrics of the source.
+    Sources sharing a content handler get a proxy each, the handler itself is not modified.
+    """
+
+    def __init__(self, handler, metrics):
+        self.handler = handler
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        if name == "handler":
+            raise AttributeError(name)
+        return getattr(self.handler, name)
+
+    def get_text(self, key, *args, **kwargs):
+        result = self.handler.get_text(key, *args, **kwargs)
+        self.metrics.bytes_read += len(result.encode(self.handler.encoding))
+        return result
+
+    def get_bytes(self, key, *args, **kwargs):
+        result = self.handler.get_bytes(key, *args, **kwargs)
+        self.metrics.bytes_read += len(result)
+        return result
+
+    def count_lines(self, lines):
+        encoding = self.handler.encoding
+        for line in lines:
+            self.metrics.bytes_read += len(line.encode(encoding))
+            yield line
+
+    def iterate_lines(self, key, *args, **kwargs):
+        return self.count_lines(self.handler.iterate_lines(key, *args, **kwargs))
+
+    def iterate_lines_parallel(self, key, *args, **kwargs):
+        return self.count_lines(self.handler.iterate_lines_parallel(key, *args, **kwargs))
+
+
+class PipelineInstrumentation:
+    """
+    Collects the metrics of all pipeline stages built while the instrumentation is enabled.
+    """
+    iterator_class = InstrumentedIterator
+    metrics_class = StageMetrics
+    prometheus_metrics = PROMETHEUS_METRICS
+
+    def __init__(self):
+        self.stages = []
+
+    def enable(self):
+        if pipeline._instrumentation is not None and pipeline._instrumentation is not self:
+            raise Exception("Another instrumentation is already enabled")
+        pipeline._instrumentation = self
+        return self
+
+    def disable(self):
+        if pipeline._instrumentation is self:
+            pipeline._instrumentation = None
+        return self
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disable()
+
+    def new_stage(self, obj, kind, inputs=()):
+        metrics = self.metrics_class("%i:%s" % (len(self.stages), type(obj).__name__), kind, inputs)
+        self.stages.append(metrics)
+        return metrics
+
+    def wrap_input(self, x):
+        """
+        Wrap the input(s) of a stage. Sources which are not yet instrumented become stages on their own.
+        Merge gets tuples / lists of iterators or (iterator, weight) as input.
+        """
+        if isinstance(x, (tuple, list)):
+            return type(x)(self.wrap_input(i) for i in x)
+        if isinstance(x, InstrumentedIterator) or not hasattr(x, "__next__"):
+            return x
+        metrics = self.new_stage(x, SOURCE)
+        self.watch_content_handler(x, metrics)
+        return self.iterator_class(x, metrics)
+
+    @staticmethod
+    def input_metrics(x):
+        if isinstance(x, (tuple, list)):
+            return [m for i in x for m in PipelineInstrumentation.input_metrics(i)]
+        if isinstance(x, InstrumentedIterator):
+            return [x.metrics]
+        return []
+
+    def apply(self, stage, f, iterator):
+        """
+        Apply the operation `f` of the pipeline object `stage` (called by the operator `**`).
+        """
+        wrapped = self.wrap_input(iterator)
+        inputs = PipelineInstrumentation.input_metrics(wrapped)
+        if isinstance(stage, pipeline.IteratorConsumer):
+            metrics = self.new_stage(stage, CONSUMER, inputs)
+            return self.call_consumer(metrics, f, wrapped)
+        kind = ITEM_MODIFIER if isinstance(stage, pipeline.ItemModifier) else ITERATOR_MODIFIER
+        metrics = self.new_stage(stage, kind, inputs)
+        return self.iterator_class(f(wrapped), metrics)
+
+    def call_consumer(self, metrics, f, iterator):
+        wall = perf_counter()
+        cpu = thread_time()
+        try:
+            return f(iterator)
+        finally:
+            metrics.wall_time += perf_counter() - wall
+            metrics.cpu_time += thread_time() - cpu
+
+    def watch_content_handler(self, source, metrics):
+        """
+        Count the bytes read through the content handler of a source (e.g. FileSourceGenerator,
+        LineSourceIterator) by replacing the handler of the source by a `CountingContentHandler`.
+        The counting goes on as long as the source is used, also after the instrumentation is disabled.
+        """
+        for name in ("contentHandler", "content_handler"):
+            handler = getattr(source, name, None)
+            if isinstance(handler, CountingContentHandler):
+                handler = handler.handler
+            if isinstance(handler, content.ContentHandler):
+                setattr(source, name, CountingContentHandler(handler, metrics))
+                return
+
+    def report(self):
+        return {"stages": [s.to_dict() for s in self.stages]}
+
+    def json_report(self):
+        return json.dumps(self.report(), indent=1)
+
+    def write_json(self, filename):
+        with open(filename, "w") as f:
+            f.write(self.json_report())
+
+    def prometheus_report(self, labels=None):
+        """
+        The metrics in the Prometheus text exposition format.
+
+        Kwargs:
+            :labels (dict, default=None): additional labels added to every sample (e.g. {"job": "wiki"})
+        """
+        def escape(v):
+            return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+        stages = self.report()["stages"]
+        lines = []
+        for key, name, kind, help_text in self.prometheus_metrics:
+            full_name = "%s_%s" % (PROMETHEUS_PREFIX, name)
+            lines.append("# HELP %s %s" % (full_name, help_text))
+            lines.append("# TYPE %s %s" % (full_name, kind))
+            for s in stages:
+                if key in s:
+                    label_map = dict(labels or {})
+                    label_map.update({"stage": s["name"], "type": s["type"]})
+                    label_str = ",".join('%s="%s"' % (k, escape(v)) for k, v in label_map.items())
+                    lines.append("%s{%s} %s" % (full_name, label_str, repr(float(s[key]))))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename, labels=None):
+        with open(filename, "w") as f:
+            f.write(self.prometheus_report(labels=labels))
+
+    def log_report(self, level=logging.INFO):
+        for s in self.report()["stages"]:
+            logger.log(level, "%-30s in=%-9i out=%-9i self wall=%9.3f s, self cpu=%9.3f s, bytes=%i" % (
+                s["name"], s["items_in"], s["items_out"], s["self_wall_time"], s["self_cpu_time"], s["bytes_read"]
+            ))
+
+
+MEMORY_PROMETHEUS_METRICS = PROMETHEUS_METRICS + (
+    ("retained_memory", "retained_bytes", "gauge", "Memory allocated and not freed by a stage including inputs."),
+    ("self_retained_memory", "self_retained_bytes", "gauge", "Memory allocated and not freed by a stage itself."),
+    ("peak_memory", "peak_bytes", "gauge", "Maximal memory used during a single call of a stage."),
+)
+
+
+class MemoryTracker:
+    """
+    Measures the traced memory retained and the peak memory of (nested) calls.
+    `tracemalloc` has only one global peak, so the peak is propagated to all open calls before it is reset.
+    """
+
+    def __init__(self):
+        self.frames = []
+
+    def _update_peaks(self):
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self.frames:
+            if peak > frame[1]:
+                frame[1] = peak
+        tracemalloc.reset_peak()
+        return current
+
+    def enter(self):
+        current = self._update_peaks()
+        frame = [current, current]
+        self.frames.append(frame)
+        return frame
+
+    def exit(self, frame):
+        """
+        Returns (retained, peak) of the call started by `enter`, both relative to the memory at the start of the call.
+        """
+        current = self._update_peaks()
+        self.frames.remove(frame)
+        return current - frame[0], frame[1] - frame[0]
+
+
+MEMORY_TRACKER = MemoryTracker()
+
+
+class MemoryStageMetrics(StageMetrics):
+    def __init__(self, name, kind, inputs=()):
+        super(MemoryStageMetrics, self).__init__(name, kind, inputs)
+        self.retained_memory = 0
+        self.peak_memory = 0
+
+    def add_memory(self, retained, peak):
+        self.retained_memory += retained
+        if peak > self.peak_memory:
+            self.peak_memory = peak
+
+    def to_dict(self):
+        result = super(MemoryStageMetrics, self).to_dict()
+        result["retained_memory"] = self.retained_memory
+        result["self_retained_memory"] = self.retained_memory - sum(
+            i.retained_memory for i in self.inputs if isinstance(i, MemoryStageMetrics)
+        )
+        result["peak_memory"] = self.peak_memory
+        return result
+
+
+class MemoryInstrumentedIterator(InstrumentedIterator):
+    def __next__(self):
+        frame = MEMORY_TRACKER.enter()
+        try:
+            return super(MemoryInstrumentedIterator, self).__next__()
+        finally:
+            self.metrics.add_memory(*MEMORY_TRACKER.exit(frame))
+
+
+class PipelineMemoryInstrumentation(PipelineInstrumentation):
+    """
+    Pipeline instrumentation which additionally measures the memory retained and the peak memory of every stage.
+    Starts `tracemalloc` when enabled (if it is not running yet) and stops it when disabled.
+    """
+    iterator_class = MemoryInstrumentedIterator
+    metrics_class = MemoryStageMetrics
+    prometheus_metrics = MEMORY_PROMETHEUS_METRICS
+
+    def __init__(self, frames=1):
+        self.frames = frames
+        self.started_tracing = False
+        super(PipelineMemoryInstrumentation, self).__init__()
+
+    def enable(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started_tracing = True
+        return super(PipelineMemoryInstrumentation, self).enable()
+
+    def disable(self):
+        super(PipelineMemoryInstrumentation, self).disable()
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        return self
+
+    def call_consumer(self, metrics, f, iterator):
+        frame = MEMORY_TRACKER.enter()
+        try:
+            return super(PipelineMemoryInstrumentation, self).call_consumer(metrics, f, iterator)
+        finally:
+            metrics.add_memory(*MEMORY_TRACKER.exit(frame))
+
+    def log_report(self, level=logging.INFO):
+        super(PipelineMemoryInstrumentation, self).log_report(level=level)
+        for s in self.report()["stages"]:
+            logger.log(level, "%-30s retained=%i, self retained=%i, peak=%i" % (
+                s["name"], s["retained_memory"], s["self_retained_memory"], s["peak_memory"]
+            ))
+
+
+class MemoryMonitor:
+    """
+    Measures the memory of the rounds of a long running job, e.g. the rounds of `RssScraper.poll`:
+
+    ::
+
+        >>> monitor = MemoryMonitor()
+        >>> scraper = RssScraper(..., memory_monitor=monitor)
+
+    or
+
+    ::
+
+        >>> with monitor.round("my round"):
+        ...     do_something()
+
+    If the memory after a round has grown in each of the last `growth_rounds` rounds by more
+    than `min_growth` bytes in total, a warning listing the allocation sites with the largest growth is logged.
+
+    Kwargs:
+        :growth_rounds (int, default=5): number of consecutive rounds with growing memory considered as a leak
+        :min_growth (int, default=1MB): minimal growth (bytes) over `growth_rounds` rounds considered as a leak
+        :top_stats (int, default=10): number of allocation sites reported
+        :frames (int, default=1): number of frames stored by tracemalloc for each allocation
+    """
+
+    def __init__(self, growth_rounds=5, min_growth=1024 * 1024, top_stats=10, frames=1):
+        self.growth_rounds = growth_rounds
+        self.min_growth = min_growth
+        self.top_stats = top_stats
+        self.frames = frames
+        self.rounds = []
+        self.snapshots = []
+        self.started_tracing = False
+
+    def stop(self):
+        """
+        Stop tracing memory (if it has been started by this monitor).
+        """
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        self.snapshots = []
+
+    @contextmanager
+    def round(self, name=""):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started_tracing = True
+        frame = MEMORY_TRACKER.enter()
+        try:
+            yield self
+        finally:
+            retained, peak = MEMORY_TRACKER.exit(frame)
+            current = tracemalloc.get_traced_memory()[0]
+            self.rounds.append({"name": name, "retained": retained, "peak": peak, "memory": current})
+            self.snapshots = (self.snapshots + [tracemalloc.take_snapshot()])[-(self.growth_rounds + 1):]
+            logger.info("memory round '%s': retained=%i, peak=%i, memory=%i" % (name, retained, peak, current))
+            if self.is_growing():
+                self.warn_growth()
+
+    def is_growing(self):
+        """
+        True if the memory grew in each of the last `growth_rounds` rounds and by more than `min_growth` in total.
+        """
+        if len(self.rounds) <= self.growth_rounds:
+            return False
+        memory = [r["memory"] for r in self.rounds[-(self.growth_rounds + 1):]]
+        return all(memory[i] < memory[i + 1] for i in range(len(memory) - 1)) and \
+            memory[-1] - memory[0] > self.min_growth
+
+    def growth_statistics(self):
+        """
+        The allocation sites with the largest growth during the last `growth_rounds` rounds.
+        """
+        if len(self.snapshots) < 2:
+            return []
+        return self.snapshots[-1].compare_to(self.snapshots[0], "lineno")[0:self.top_stats]
+
+    def warn_growth(self):
+        stats = "\n".join(str(s) for s in self.growth_statistics())
+        logger.warning("memory grew in the last %i rounds, largest growth:\n%s" % (self.growth_rounds, stats))
+
+    def report(self):
+        return {"rounds": self.rounds, "is_growing": self.is_growing()}
+
+
+class MemoryBudgetExceeded(AssertionError):
+    pass
+
+
+def check_memory_budget(iterator, budget, warmup_items=100, max_items=None, check_freq=10):
+    """
+    Iterate over `iterator` and fail if its steady-state memory exceeds the budget.
+
+    The memory is measured relative to the memory after the first `warmup_items` items (so that caches,
+    models, etc. loaded lazily do not count). Can be used in unit tests:
+
+    ::
+
+        >>> check_memory_budget(base.Lower() ** pipeline.LineSourceIterator("tokens.txt"), budget=1024 * 1024)
+
+    Args:
+        :iterator (Iterator): the pipeline
+        :budget (int): the maximal growth of the memory in bytes after the warm-up
+
+    Kwargs:
+        :warmup_items (int, default=100): items read before the baseline is measured
+        :max_items (int, default=None): stop after this number of items (None: read all items)
+        :check_freq (int, default=10): the memory is checked every `check_freq` items
+
+    Returns:
+        dict with the number of items, the baseline and the maximal growth of the memory
+
+    Raises:
+        MemoryBudgetExceeded: if the growth of the memory exceeds `budget`
+    """
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        n = 0
+        baseline = None
+        max_growth = 0
+        for _ in iterator:
+            n += 1
+            if n == warmup_items:
+                baseline = tracemalloc.get_traced_memory()[0]
+            elif baseline is not None and n % check_freq == 0:
+                max_growth = max(max_growth, tracemalloc.get_traced_memory()[0] - baseline)
+            if max_items is not None and n >= max_items:
+                break
+        if baseline is not None:
+            max_growth = max(max_growth, tracemalloc.get_traced_memory()[0] - baseline)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    result = {"items": n, "baseline": baseline, "max_growth": max_growth, "budget": budget}
+    if baseline is None:
+        logger.warning("check_memory_budget: only %i items, less than the warm-up (%i)" % (n, warmup_items))
+    if max_growth > budget:
+        raise MemoryBudgetExceeded(
+            "memory grew by %i bytes after %i warm-up items, budget is %i bytes" % (max_growth, warmup_items, budget)
+        )
+    return result
@@ -1,5 +1,4 @@
 import ast
-import codecs
 import string
 from collections import Counter
 
@@ -7,6 +6,8 @@ import spacy
 import nltk
 import re
 
+from cbc.content import open_text_writer
+from cbc.nlp.token_counts import save_counts
 from cbc.pipeline import \
     ItemModifier, IteratorModifier, Iterator, IteratorConsumer, LineSourceIterator, STANDARD_SEPARATOR
 from nltk.tokenize import TreebankWordTokenizer
@@ -376,18 +377,29 @@ class MinMaxTokens(IteratorModifier):
 
 
 class TokensToFile(IteratorConsumer):
+    """
+    Write the items of an iterator to a file, one line per item.
+
+    The file is compressed if its name ends with ".gz", ".bz2" or ".xz" or if `compression`
+    is one of "gzip", "bz2", "xz" (see `cbc.content.get_compression`).
+    """
+
     def __init__(self,
                  filename,
                  output_tag=True,
                  tag_separator=STANDARD_SEPARATOR,
                  output_encoding='utf-8',
-                 input_type=list
+                 input_type=list,
+                 compression="infer",
+                 compression_level=None
                  ):
         self.filename = filename
         self.output_tag = output_tag
         self.tag_separator = tag_separator
         self.output_encoding = output_encoding
         self.input_type = input_type
+        self.compression = compression
+        self.compression_level = compression_level
 
     def __call__(self, iterator):
         if iterator.is_tagged:
@@ -420,15 +432,18 @@ class TokensToFile(IteratorConsumer):
                 raise (TypeError, "Unsupported input type %i" % str(self.input_type))
         n = 0
         try:
-            if self.output_encoding is None:
-                file = codecs.open(self.filename, 'w')
-            else:
-                file = codecs.open(self.filename, 'w', self.output_encoding)
-            for t in iterator:
-                n += 1
-                file.write(to_str(t))
-                file.write("\n")
-            file.close()
+            # closed if the iterator fails, too: the lines written so far (and for compressed files the member
+            # index) are complete and the compression threads end
+            with open_text_writer(
+                self.filename,
+                encoding=self.output_encoding,
+                compression=self.compression,
+                compression_level=self.compression_level
+            ) as file:
+                for t in iterator:
+                    n += 1
+                    file.write(to_str(t))
+                    file.write("\n")
         except IOError:
             s = "could not write to file '%s'" % self.filename
             logger.error(s, exc_info=True)
@@ -446,6 +461,7 @@ class CountTokens(IteratorConsumer):
             self.tagged_counter = Counter()
         else:
             self.tagged_counter = tagged_counter
+        self.document_count = 0
 
     def __call__(self, iterator):
         if iterator.is_tagged:
@@ -457,4 +473,11 @@ class CountTokens(IteratorConsumer):
                 self.word_counter.update(tokens_)
         for tokens in iterator:
             count(tokens)
+            self.document_count += 1
         return self
+
+    def save(self, key, **kwargs):
+        """
+        Save the word counts and the number of documents, see `cbc.nlp.token_counts.save_counts`.
+        """
+        save_counts(self.word_counter, key, document_count=self.document_count, **kwargs)
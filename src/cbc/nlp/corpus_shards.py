@@ -0,0 +1,294 @@
+"""
+cbc.nlp.corpus_shards
+========================
+
+Binary, memory mappable storage of tokenized corpora.
+
+Reading back text files written by "cbc.nlp.base.TokensToFile" means decoding and splitting
+every line again. For corpora which are read many times (e.g. once per word2vec epoch) the tokens
+can instead be stored as integer ids. A corpus stored under the key `<key>` consists of:
+
+    :<key>.json: the manifest (number of documents and tokens, list of shards)
+    :<key>.vocab.json: the vocabulary as json list, the position of a token is its id
+    :<key>.<n>.tokens: the token ids of shard n as flat array (int32, little endian)
+    :<key>.<n>.offsets: the start of each document of shard n within the token array
+        (int64, little endian, number of documents + 1 entries)
+    :<key>.<n>.tags: optional, the tags of the documents of shard n, one per line
+
+Example:
+
+    ::
+
+        >>> import cbc.pipeline as pipeline
+        >>> from cbc.nlp.corpus_shards import CorpusShardWriter, CorpusShardIterator
+        >>> g = pipeline.ListGenerator([["a", "b"], ["b", "c", "d"]], is_tagged=True)
+        >>> CorpusShardWriter("corpus", base_folder="/tmp") ** g
+        >>> list(CorpusShardIterator("corpus", base_folder="/tmp"))
+        [(['a', 'b'], [0]), (['b', 'c', 'd'], [1])]
+"""
+import ast
+import json
+import logging
+from array import array
+
+import numpy as np
+
+import cbc.content as content
+import cbc.pipeline as pipeline
+
+logger = logging.getLogger('cbc.nlp.corpus_shards')
+
+FORMAT_NAME = "cbc-corpus-shards"
+FORMAT_VERSION = 1
+
+TOKEN_DTYPE = np.dtype('<i4')
+OFFSET_DTYPE = np.dtype('<i8')
+
+DEFAULT_MAX_TOKENS_PER_SHARD = 50000000
+
+
+def manifest_key(key):
+    return key + ".json"
+
+
+def vocab_key(key):
+    return key + ".vocab.json"
+
+
+def shard_keys(key, n):
+    base = "%s.%05i" % (key, n)
+    return base + ".tokens", base + ".offsets", base + ".tags"
+
+
+def _content_handler(content_handler, base_folder):
+    if content_handler is None:
+        return content.FileSystemContentHandler(base_prefix=base_folder)
+    return content_handler
+
+
+class CorpusShardWriter(pipeline.IteratorConsumer):
+    """
+    Write an iterator of token lists (tagged or not) as binary corpus (see module documentation).
+
+    Args:
+        :key (str): the common key of all files of the corpus
+
+    Kwargs:
+        :prefix (str, default=""): prefix used with the content handler
+        :content_handler (ContentHandler, default=None): the target of the files, if None a
+            FileSystemContentHandler for `base_folder` is used
+        :base_folder (str, default="."): see `content_handler`
+        :max_tokens_per_shard (int): a new shard is started when a shard contains more tokens
+        :output_tag (boolean, default=True): store the tags of a tagged iterator
+        :vocab (list of str, default=None): initial vocabulary, e.g. for sharing ids between corpora
+    """
+
+    def __init__(self,
+                 key,
+                 prefix="",
+                 content_handler=None,
+                 base_folder=".",
+                 max_tokens_per_shard=DEFAULT_MAX_TOKENS_PER_SHARD,
+                 output_tag=True,
+                 vocab=None
+                 ):
+        self.key = key
+        self.prefix = prefix
+        self.content_handler = _content_handler(content_handler, base_folder)
+        self.max_tokens_per_shard = max_tokens_per_shard
+        self.output_tag = output_tag
+        self.vocab = {}
+        if vocab is not None:
+            for w in vocab:
+                self.vocab.setdefault(w, len(self.vocab))
+        self.number = 0
+        self.number_of_tokens = 0
+        self.shards = []
+
+    def _write_shard(self, token_ids, offsets, tags):
+        tokens_key, offsets_key, tags_key = shard_keys(self.key, len(self.shards))
+        self.content_handler.save_bytes(
+            tokens_key, np.frombuffer(token_ids, dtype=np.int32).astype(TOKEN_DTYPE, copy=False).tobytes(),
+            prefix=self.prefix
+        )
+        self.content_handler.save_bytes(
+            offsets_key, np.asarray(offsets, dtype=OFFSET_DTYPE).tobytes(), prefix=self.prefix
+        )
+        if tags is not None:
+            self.content_handler.save_text(tags_key, "\n".join(tags), prefix=self.prefix)
+        else:
+            tags_key = None
+        self.shards.append({
+            "tokens": tokens_key,
+            "offsets": offsets_key,
+            "tags": tags_key,
+            "first_document": self.number - (len(offsets) - 1),
+            "documents": len(offsets) - 1,
+            "number_of_tokens": len(token_ids)
+        })
+        logger.debug("written shard %s, documents=%i, tokens=%i" % (tokens_key, len(offsets) - 1, len(token_ids)))
+
+    def __call__(self, iterator):
+        write_tags = iterator.is_tagged and self.output_tag
+        vocab = self.vocab
+        token_ids = array('i')
+        offsets = [0]
+        tags = [] if write_tags else None
+        self.number = 0
+        self.number_of_tokens = 0
+        self.shards = []
+        for t in iterator:
+            if iterator.is_tagged:
+                tokens = t[0]
+                if write_tags:
+                    tags.append(str(t[1]))
+            else:
+                tokens = t
+            token_ids.extend([vocab.setdefault(w, len(vocab)) for w in tokens])
+            offsets.append(len(token_ids))
+            self.number += 1
+            self.number_of_tokens += len(tokens)
+            if len(token_ids) >= self.max_tokens_per_shard:
+                self._write_shard(token_ids, offsets, tags)
+                token_ids = array('i')
+                offsets = [0]
+                tags = [] if write_tags else None
+        if len(offsets) > 1 or len(self.shards) == 0:
+            self._write_shard(token_ids, offsets, tags)
+        words = [None] * len(vocab)
+        for w, i in vocab.items():
+            words[i] = w
+        self.content_handler.save_text(vocab_key(self.key), json.dumps(words, ensure_ascii=False), prefix=self.prefix)
+        manifest = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "documents": self.number,
+            "number_of_tokens": self.number_of_tokens,
+            "is_tagged": write_tags,
+            "vocab": vocab_key(self.key),
+            "shards": self.shards
+        }
+        self.content_handler.save_text(manifest_key(self.key), json.dumps(manifest, indent=1), prefix=self.prefix)
+        logger.info("written corpus '%s': documents=%i, tokens=%i, shards=%i, vocabulary=%i" % (
+            self.key, self.number, self.number_of_tokens, len(self.shards), len(vocab)))
+        return self
+
+
+class CorpusShardIterator(pipeline.BaseGenerator):
+    """
+    Read a corpus written by `CorpusShardWriter`.
+
+    If the corpus is stored in the file system, the shards are memory mapped and the documents are
+    views into the mapped files (no copy). Otherwise the shards are read into memory using the content handler.
+
+    Args:
+        :key (str): the common key of all files of the corpus
+
+    Kwargs:
+        :prefix (str, default=""): prefix used with the content handler
+        :content_handler (ContentHandler, default=None): the source of the files, if None a
+            FileSystemContentHandler for `base_folder` is used
+        :base_folder (str, default="."): see `content_handler`
+        :output (str, default="tokens"): "tokens" yields lists of str, "ids" yields numpy arrays of token ids
+        :output_tag (boolean, default=True): yield tagged items if the corpus contains tags
+        :document_from (int, default=0): first document (inclusive) to read
+        :document_until (int, default=None): last document (exclusive) to read, None is the end of the corpus
+    """
+
+    def __init__(self,
+                 key,
+                 prefix="",
+                 content_handler=None,
+                 base_folder=".",
+                 output="tokens",
+                 output_tag=True,
+                 document_from=0,
+                 document_until=None
+                 ):
+        if output not in ("tokens", "ids"):
+            raise Exception("CorpusShardIterator: 'output' must be 'tokens' or 'ids', not '%s'" % output)
+        self.key = key
+        self.prefix = prefix
+        self.content_handler = _content_handler(content_handler, base_folder)
+        self.output = output
+        self.output_tag = output_tag
+        self.manifest = json.loads(self.content_handler.get_text(manifest_key(key), prefix=prefix))
+        if self.manifest.get("format") != FORMAT_NAME:
+            raise Exception("'%s' is not a corpus written by CorpusShardWriter" % manifest_key(key))
+        self.number_of_documents = self.manifest["documents"]
+        self.document_from = max(0, document_from)
+        if document_until is None:
+            self.document_until = self.number_of_documents
+        else:
+            self.document_until = min(document_until, self.number_of_documents)
+        self._vocab = None
+        super(CorpusShardIterator, self).__init__(is_tagged=self.manifest["is_tagged"] and output_tag)
+
+    def __len__(self):
+        return max(0, self.document_until - self.document_from)
+
+    @property
+    def vocab(self):
+        """
+        The vocabulary as numpy array (of objects), i.e. `vocab[i]` is the token with id `i`.
+        """
+        if self._vocab is None:
+            words = json.loads(self.content_handler.get_text(self.manifest["vocab"], prefix=self.prefix))
+            self._vocab = np.array(words, dtype=object)
+        return self._vocab
+
+    def _load_array(self, key, dtype):
+        if isinstance(self.content_handler, content.FileSystemContentHandler):
+            path = self.content_handler.get_full_path(key, prefix=self.prefix)
+            if path.stat().st_size == 0:
+                return np.empty(0, dtype=dtype)
+            return np.memmap(path, dtype=dtype, mode='r')
+        return np.frombuffer(self.content_handler.get_bytes(key, prefix=self.prefix), dtype=dtype)
+
+    def _load_tags(self, key):
+        return self.content_handler.get_text(key, prefix=self.prefix).split("\n")
+
+    def split(self, number_of_parts):
+        """
+        Split the document range of this iterator into `number_of_parts` iterators of (almost) equal size,
+        e.g. for reading the corpus in parallel.
+        """
+        n = len(self)
+        bounds = [self.document_from + (n * i) // number_of_parts for i in range(number_of_parts + 1)]
+        return [
+            CorpusShardIterator(
+                self.key,
+                prefix=self.prefix,
+                content_handler=self.content_handler,
+                output=self.output,
+                output_tag=self.output_tag,
+                document_from=bounds[i],
+                document_until=bounds[i + 1]
+            )
+            for i in range(number_of_parts)
+        ]
+
+    def __call__(self):
+        if self.output == "tokens":
+            vocab = self.vocab
+
+            def to_output(ids_):
+                return vocab[ids_].tolist()
+        else:
+            def to_output(ids_):
+                return ids_
+        for shard in self.manifest["shards"]:
+            first = shard["first_document"]
+            start = max(self.document_from, first) - first
+            end = min(self.document_until, first + shard["documents"]) - first
+            if start >= end:
+                continue
+            tokens = self._load_array(shard["tokens"], TOKEN_DTYPE)
+            offsets = self._load_array(shard["offsets"], OFFSET_DTYPE)
+            if self.is_tagged:
+                tags = self._load_tags(shard["tags"])
+                for j in range(start, end):
+                    yield to_output(tokens[offsets[j]:offsets[j + 1]]), ast.literal_eval(tags[j])
+            else:
+                for j in range(start, end):
+                    yield to_output(tokens[offsets[j]:offsets[j + 1]])
@@ -0,0 +1,127 @@
+"""
+cbc.nlp.extraction
+=====================
+
+Extraction of text from html in a pool of processes, separated from the download of the html.
+
+Parsing html (e.g. with BeautifulSoup) is cpu bound and holds the GIL, so done on the threads which download
+the articles, it stalls the downloads. An `ExtractionPool` runs the extractors in worker processes, at most
+`max_pending` extractions are submitted at once (the producer waits when this bound is reached).
+
+The extractors are sent to the worker processes, i.e. they must be picklable (functions defined
+at module level, not lambdas or local functions).
+
+Example:
+
+    ::
+
+        >>> from cbc.nlp.rss_scraping import RssScraper
+        >>> pool = ExtractionPool(max_workers=4)
+        >>> scraper = RssScraper(urls, extractor=spiegel_extractor, extraction_pool=pool, max_workers=8, ...)
+        >>> scraper.pull_once()
+        >>> scraper.regenerate_content(from_raw=True)   # re-extract all stored .raw files
+"""
+import logging
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger('cbc.nlp.extraction')
+
+
+def extract_all(extractors, html):
+    """
+    Apply all extractors to `html`, returns a dict language -> text.
+    """
+    return {language: extractor(html) for language, extractor in extractors.items()}
+
+
+def check_picklable(extractors):
+    for language, extractor in extractors.items():
+        try:
+            pickle.dumps(extractor)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            raise Exception(
+                "extractor '%s' (%r) can not be sent to the extraction processes, use a function defined "
+                "at module level" % (language, extractor)
+            )
+
+
+class ExtractionPool:
+    """
+    Process pool for html extraction with a bounded number of pending jobs. May be shared by several scrapers.
+
+    Kwargs:
+        :max_workers (int, default=None): number of processes, if None the number of cpus
+        :max_pending (int, default=None): maximal number of submitted and not finished extractions,
+            if None 4 * max_workers
+        :mp_context (multiprocessing context, default=None): context used to start the processes
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, mp_context=None):
+        self.max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+        self.max_pending = max_pending if max_pending is not None else 4 * self.max_workers
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=mp_context)
+        self.pending = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.Lock()
+        self.stats = {"submitted": 0, "failed": 0}
+
+    def _done(self, future):
+        self.pending.release()
+        if future.cancelled() or future.exception() is not None:
+            with self.lock:
+                self.stats["failed"] += 1
+
+    def submit(self, extractors, html):
+        """
+        Submit the extraction of `html` with all `extractors` (dict language -> extractor), waits while
+        `max_pending` extractions are pending.
+
+        Returns:
+            :concurrent.futures.Future: the future of the dict language -> text
+        """
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(extract_all, extractors, html)
+        except BaseException:
+            self.pending.release()
+            raise
+        with self.lock:
+            self.stats["submitted"] += 1
+        future.add_done_callback(self._done)
+        return future
+
+    def map_unordered(self, extractors, items):
+        """
+        Extract the html of all `items`, i.e. pairs (key, html), yields (key, dict language -> text) in the
+        order of completion. The items are consumed lazily. If the extraction of an item fails, the error is
+        logged and (key, None) is yielded.
+        """
+        futures = {}
+
+        def done_items(return_when):
+            done, _ = wait(futures, return_when=return_when)
+            for future in done:
+                key = futures.pop(future)
+                try:
+                    yield key, future.result()
+                except Exception:
+                    logger.error("could not extract content of %s" % key, exc_info=True)
+                    yield key, None
+
+        for key, html in items:
+            if len(futures) >= self.max_pending:
+                yield from done_items(FIRST_COMPLETED)
+            futures[self.submit(extractors, html)] = key
+        while futures:
+            yield from done_items(FIRST_COMPLETED)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
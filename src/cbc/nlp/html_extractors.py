@@ -0,0 +1,147 @@
+"""
+cbc.nlp.html_extractors
+==========================
+
+Declarative extractors of the text of html articles, for `cbc.nlp.rss_scraping.RssScraper(extractor=...)`.
+
+An extractor is configured by rules (tags and classes to include and to exclude), which are compiled once
+into XPath expressions. The html is parsed by lxml (in C) and the text is collected by the compiled expressions,
+no python object is created per html element (as with BeautifulSoup).
+
+The text of an element is extracted if its tag is in `include_tags` or one of its classes is in `include_classes`
+(elements within an extracted element are not extracted again). Text within an element with a tag in
+`exclude_tags` or a class in `exclude_classes` is skipped. The texts of the extracted elements are joined
+by `separator`.
+
+The extractors are picklable, i.e. they can be used with a `cbc.nlp.extraction.ExtractionPool`.
+
+Example:
+
+    ::
+
+        >>> extractor = LxmlExtractor(include_tags=("p", "h1", "h2"), exclude_classes=("article-copyright",))
+        >>> extractor(b"<html><body><h1>Title</h1><p>Text</p><div class='article-copyright'><p>(c)</p></div></body>")
+        'Title\\n\\nText'
+"""
+import logging
+
+from lxml import etree
+from lxml import html as lxml_html
+
+logger = logging.getLogger('cbc.nlp.html_extractors')
+
+DEFAULT_INCLUDE_TAGS = ("p", "h", "h1", "h2", "h3", "title")
+DEFAULT_EXCLUDE_TAGS = ("script", "style", "noscript", "template")
+
+
+def _any_of(tags, classes):
+    conditions = ["self::%s" % t for t in tags] + [
+        "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % c for c in classes
+    ]
+    return " or ".join(conditions) if conditions else "false()"
+
+
+class LxmlExtractor:
+    """
+    Extract the text of html with precompiled XPath expressions (see module documentation).
+
+    Kwargs:
+        :include_tags (tuple of str): tags of the elements whose text is extracted
+        :include_classes (tuple of str, default=()): classes of the elements whose text is extracted
+        :exclude_tags (tuple of str): tags of the elements whose text is skipped
+        :exclude_classes (tuple of str, default=()): classes of the elements whose text is skipped
+        :xpath (str, default=None): XPath selecting the extracted elements, replaces `include_tags`
+            and `include_classes`
+        :separator (str, default="\\n\\n"): joins the texts of the extracted elements
+        :skip_empty (boolean, default=True): skip elements without (non whitespace) text
+    """
+
+    def __init__(self,
+                 include_tags=DEFAULT_INCLUDE_TAGS,
+                 include_classes=(),
+                 exclude_tags=DEFAULT_EXCLUDE_TAGS,
+                 exclude_classes=(),
+                 xpath=None,
+                 separator="\n\n",
+                 skip_empty=True
+                 ):
+        self.include_tags = tuple(include_tags)
+        self.include_classes = tuple(include_classes)
+        self.exclude_tags = tuple(exclude_tags)
+        self.exclude_classes = tuple(exclude_classes)
+        self.xpath = xpath
+        self.separator = separator
+        self.skip_empty = skip_empty
+        self._compile()
+
+    def _compile(self):
+        excluded = _any_of(self.exclude_tags, self.exclude_classes)
+        if self.xpath is None:
+            included = _any_of(self.include_tags, self.include_classes)
+            elements = "//*[%s][not(ancestor::*[%s])][not(ancestor-or-self::*[%s])]" % (included, included, excluded)
+        else:
+            elements = "(%s)[not(ancestor-or-self::*[%s])]" % (self.xpath, excluded)
+        self.elements_xpath = etree.XPath(elements)
+        self.text_xpath = etree.XPath(".//text()[not(ancestor::*[%s])]" % excluded)
+        self.parser = lxml_html.HTMLParser(remove_comments=True, remove_pis=True)
+        self.utf8_parser = lxml_html.HTMLParser(remove_comments=True, remove_pis=True, encoding="utf-8")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for compiled in ("elements_xpath", "text_xpath", "parser", "utf8_parser"):
+            del state[compiled]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    def parse(self, html):
+        """
+        Parse html (bytes or str), returns the root element or None if the document is empty.
+        Bytes which are valid utf-8 are parsed as utf-8, others in the encoding declared by the document
+        (latin-1 if there is none).
+        """
+        if isinstance(html, str):
+            html = html.encode("utf-8")
+        if not html.strip():
+            return None
+        try:
+            html.decode("utf-8")
+            parser = self.utf8_parser
+        except UnicodeDecodeError:
+            parser = self.parser
+        return etree.fromstring(html, parser)
+
+    def extract_texts(self, root):
+        """
+        The texts of the extracted elements of a parsed document.
+        """
+        texts = []
+        for element in self.elements_xpath(root):
+            text = "".join(self.text_xpath(element)).strip()
+            if text or not self.skip_empty:
+                texts.append(text)
+        return texts
+
+    def __call__(self, html):
+        try:
+            root = self.parse(html)
+        except (etree.ParserError, ValueError):
+            logger.warning("could not parse html", exc_info=True)
+            return ""
+        if root is None:
+            return ""
+        return self.separator.join(self.extract_texts(root)).strip()
+
+
+ARTICLE_EXTRACTOR = LxmlExtractor()
+"""
+Text of the title, headings and paragraphs.
+"""
+
+SPIEGEL_EXTRACTOR = LxmlExtractor(exclude_classes=("article-copyright",))
+"""
+The extractor of `example/python/rss_scraper/extract_spiegel_fs.py` (title, headings and paragraphs
+without the copyright notes).
+"""
@@ -0,0 +1,242 @@
+"""
+cbc.nlp.http_client
+=======================
+
+A small HTTP client for scraping which keeps the connections to each host open (keep-alive)
+and reuses them for subsequent requests, instead of paying a new TCP and TLS handshake per request.
+
+Responses are requested compressed (gzip, deflate), redirects are followed, failed requests are retried
+and the size of responses is limited.
+
+Example:
+
+    ::
+
+        >>> client = HttpClient(timeout=10)
+        >>> response = client.get("https://www.spiegel.de/schlagzeilen/tops/index.rss")
+        >>> response.status, len(response.body)
+"""
+import http.client
+import logging
+import ssl
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, urljoin
+
+logger = logging.getLogger('cbc.nlp.http_client')
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0'
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_RESPONSE_SIZE = 32 * 1024 * 1024
+READ_CHUNK_SIZE = 65536
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class ResponseTooLarge(IOError):
+    pass
+
+
+class HttpResponse:
+    def __init__(self, url, status, headers, body):
+        """
+        Args:
+            :url (str): the url of the response (after redirects)
+            :status (int): the http status
+            :headers (http.client.HTTPMessage): the response headers (case insensitive)
+            :body (bytes): the (decompressed) body
+        """
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class HttpClient:
+    """
+    Thread safe http client with a pool of persistent connections per host.
+
+    Kwargs:
+        :timeout (float, default=30): timeout of connecting and reading in seconds
+        :retries (int, default=2): number of retries after connection errors and server errors (status >= 500)
+        :backoff (float, default=0.5): wait before the first retry in seconds, doubled for each further retry
+        :max_response_size (int, default=32MB): maximal size of a response body (compressed and uncompressed)
+        :max_connections_per_host (int, default=8): maximal number of idle connections kept per host
+        :max_redirects (int, default=5): maximal number of redirects followed
+        :user_agent (str, default='Mozilla/5.0'): the user agent sent with each request
+        :ssl_context (ssl.SSLContext, default=None): context for https connections, if None a default
+            context (`ssl.create_default_context`) is used
+    """
+
+    def __init__(self,
+                 timeout=DEFAULT_TIMEOUT,
+                 retries=2,
+                 backoff=0.5,
+                 max_response_size=DEFAULT_MAX_RESPONSE_SIZE,
+                 max_connections_per_host=8,
+                 max_redirects=5,
+                 user_agent=DEFAULT_USER_AGENT,
+                 ssl_context=None
+                 ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_response_size = max_response_size
+        self.max_connections_per_host = max_connections_per_host
+        self.max_redirects = max_redirects
+        self.user_agent = user_agent
+        self.ssl_context = ssl_context
+        self.pool = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "retries": 0}
+
+    def new_connection(self, scheme, netloc, timeout):
+        with self.lock:
+            self.stats["connections"] += 1
+        if scheme == "https":
+            if self.ssl_context is None:
+                self.ssl_context = ssl.create_default_context()
+            return http.client.HTTPSConnection(netloc, timeout=timeout, context=self.ssl_context)
+        elif scheme == "http":
+            return http.client.HTTPConnection(netloc, timeout=timeout)
+        raise IOError("unsupported scheme '%s'" % scheme)
+
+    def get_connection(self, scheme, netloc, timeout):
+        """
+        Returns (connection, is_reused)
+        """
+        with self.lock:
+            idle = self.pool.get((scheme, netloc))
+            if idle:
+                connection = idle.pop()
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+        return self.new_connection(scheme, netloc, timeout), False
+
+    def release_connection(self, scheme, netloc, connection):
+        with self.lock:
+            idle = self.pool.setdefault((scheme, netloc), [])
+            if len(idle) < self.max_connections_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        with self.lock:
+            pool, self.pool = self.pool, {}
+        for idle in pool.values():
+            for connection in idle:
+                connection.close()
+
+    def read_body(self, response):
+        length = response.getheader("Content-Length")
+        if length is not None and length.isdigit() and int(length) > self.max_response_size:
+            raise ResponseTooLarge("response of %s bytes exceeds %i bytes" % (length, self.max_response_size))
+        chunks = []
+        size = 0
+        while True:
+            chunk = response.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > self.max_response_size:
+                raise ResponseTooLarge("response exceeds %i bytes" % self.max_response_size)
+            chunks.append(chunk)
+        return self.decode_body(b"".join(chunks), response.getheader("Content-Encoding"))
+
+    def decode_body(self, body, content_encoding):
+        if content_encoding is None or len(body) == 0:
+            return body
+        content_encoding = content_encoding.strip().lower()
+        if content_encoding in ("gzip", "x-gzip"):
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif content_encoding == "deflate":
+            # "deflate" is sent with and without zlib header
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS if (body[0] & 0x0f) == 8 else -zlib.MAX_WBITS)
+        else:
+            return body
+        result = decompressor.decompress(body, self.max_response_size + 1)
+        if len(result) > self.max_response_size:
+            raise ResponseTooLarge("decompressed response exceeds %i bytes" % self.max_response_size)
+        return result
+
+    def request_once(self, url, headers, timeout):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path = path + "?" + parts.query
+        request_headers = {
+            "User-Agent": self.user_agent,
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive"
+        }
+        request_headers.update(headers)
+        attempt = 0
+        while True:
+            connection, is_reused = self.get_connection(parts.scheme, parts.netloc, timeout)
+            try:
+                connection.request("GET", path, headers=request_headers)
+                response = connection.getresponse()
+                body = self.read_body(response)
+            except ResponseTooLarge:
+                connection.close()
+                raise
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                if attempt >= self.retries:
+                    raise
+                # a reused connection may have been closed by the server while idle, retry at once
+                if not is_reused or attempt > 0:
+                    time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                with self.lock:
+                    self.stats["retries"] += 1
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self.release_connection(parts.scheme, parts.netloc, connection)
+            if response.status >= 500 and attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                with self.lock:
+                    self.stats["retries"] += 1
+                continue
+            with self.lock:
+                self.stats["requests"] += 1
+            return HttpResponse(url, response.status, response.headers, body)
+
+    def get(self, url, headers=None, timeout=None):
+        """
+        GET an url, following redirects.
+
+        Args:
+            :url (str): the url
+
+        Kwargs:
+            :headers (dict, default=None): additional request headers
+            :timeout (float, default=None): timeout of this request, if None the timeout of the client is used
+
+        Returns:
+            :HttpResponse: the response (of any status)
+
+        Raises:
+            IOError: the url could not be read (after retries), the response is too large
+                (ResponseTooLarge) or there are too many redirects
+        """
+        if timeout is None:
+            timeout = self.timeout
+        headers = dict(headers or {})
+        for _ in range(self.max_redirects + 1):
+            response = self.request_once(url, headers, timeout)
+            location = response.headers.get("Location")
+            if response.status in REDIRECT_CODES and location:
+                url = urljoin(url, location)
+                continue
+            return response
+        raise IOError("too many redirects, last url: %s" % url)
@@ -0,0 +1,337 @@
+"""
+cbc.nlp.near_duplicates
+==========================
+
+Detection of near duplicate documents (e.g. the same agency article in several feeds under different urls).
+
+Documents are compared by the Jaccard similarity of their sets of word shingles (k consecutive words),
+estimated by MinHash signatures. Signatures are stored in a `SignatureIndex` (SQLite, in memory or in a file).
+Locality sensitive hashing (the signature is split into `bands`, documents sharing the hash of any band are
+candidates) finds the candidates without comparing a document to all indexed documents.
+
+The detector is used
+
+    * by the scraper: `RssScraper(near_duplicates=NearDuplicateDetector(...))` tags or drops new items
+      whose content is a near duplicate of an already saved item
+    * in pipelines: `NearDuplicates(...) ** iterator` drops near duplicates or tags each item with the
+      id of the document it duplicates
+
+Example:
+
+    ::
+
+        >>> detector = NearDuplicateDetector(threshold=0.8)
+        >>> detector.check("a", "the quick brown fox jumps over the lazy dog near the river bank today")
+        >>> detector.check("b", "the quick brown fox jumps over the lazy dog near the river bank today!")
+        ('a', 1.0)
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+import cbc.pipeline as pipeline
+
+logger = logging.getLogger('cbc.nlp.near_duplicates')
+
+PRIME = 4294967311
+"""
+Smallest prime > 2^32, modulus of the hash permutations
+"""
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 16
+DEFAULT_SHINGLE_SIZE = 5
+DEFAULT_THRESHOLD = 0.8
+COMMIT_EVERY = 1000
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def words(text):
+    return WORD_PATTERN.findall(text.lower())
+
+
+class MinHasher:
+    """
+    MinHash signatures of texts or token lists.
+
+    Kwargs:
+        :num_perm (int, default=128): length of the signatures
+        :shingle_size (int, default=5): number of consecutive words of a shingle
+        :seed (int, default=1): seed of the hash permutations, signatures are only comparable for the same seed
+    """
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        random_state = np.random.RandomState(seed)
+        # a < 2^31 and x < 2^32, so a * x + b does not overflow uint64
+        self.a = random_state.randint(1, 2 ** 31, size=num_perm, dtype=np.uint64)
+        self.b = random_state.randint(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+
+    def shingle_hashes(self, tokens):
+        k = self.shingle_size
+        if len(tokens) < k:
+            shingles = [" ".join(tokens)] if tokens else []
+        else:
+            shingles = [" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)]
+        return np.fromiter(
+            {zlib.crc32(s.encode("utf-8")) for s in shingles}, dtype=np.uint64
+        )
+
+    def signature(self, document):
+        """
+        The signature (numpy array of uint32) of a text or a list of tokens, None if the document has no words.
+        """
+        tokens = words(document) if isinstance(document, str) else [str(t) for t in document]
+        hashes = self.shingle_hashes(tokens)
+        if len(hashes) == 0:
+            return None
+        permuted = (np.outer(hashes, self.a) + self.b) % np.uint64(PRIME)
+        return (permuted.min(axis=0) & np.uint64(0xffffffff)).astype(np.uint32)
+
+
+def first_tag(tags):
+    """
+    The default id of a tagged document: its first tag (e.g. the key or the title), the string of the tags if
+    they are no list.
+    """
+    if isinstance(tags, (list, tuple)):
+        return str(tags[0]) if tags else ""
+    return str(tags)
+
+
+def similarity(signature_1, signature_2):
+    """
+    Estimated Jaccard similarity of the documents of two signatures.
+    """
+    return float(np.mean(signature_1 == signature_2))
+
+
+class SignatureIndex:
+    """
+    Signatures of documents with an LSH index, stored in SQLite. Thread safe.
+
+    Kwargs:
+        :path (str, default=":memory:"): the SQLite file, ":memory:" for an index which is not persisted
+        :num_perm (int, default=128): length of the signatures
+        :bands (int, default=16): number of LSH bands, must divide `num_perm`. Documents with a similarity `s`
+            are candidates with probability 1 - (1 - s^r)^b (r = num_perm / bands rows per band)
+    """
+
+    def __init__(self, path=":memory:", num_perm=DEFAULT_NUM_PERM, bands=DEFAULT_BANDS):
+        if num_perm % bands != 0:
+            raise ValueError("SignatureIndex: 'bands' must divide 'num_perm'")
+        self.path = str(path)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        if self.path != ":memory:" and os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.uncommitted = 0
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS signatures (id INTEGER PRIMARY KEY, doc_id TEXT UNIQUE, signature BLOB)"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS bands (h INTEGER, id INTEGER)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS bands_h ON bands (h)")
+        self.connection.commit()
+
+    def band_hashes(self, signature):
+        result = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(
+                signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8, person=b"band%i" % band
+            ).digest()
+            result.append(int.from_bytes(digest, 'little', signed=True))
+        return result
+
+    def query(self, signature, threshold=DEFAULT_THRESHOLD, exclude=None):
+        """
+        The indexed document most similar to `signature` with a similarity of at least `threshold`.
+
+        Kwargs:
+            :exclude (str, default=None): id of a document which is not returned (e.g. the document itself)
+
+        Returns:
+            :(doc_id, similarity): or None if there is no such document
+        """
+        hashes = self.band_hashes(signature)
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT doc_id, signature FROM signatures WHERE id IN "
+                "(SELECT id FROM bands WHERE h IN (%s))" % ",".join("?" * len(hashes)), hashes
+            ).fetchall()
+        best = None
+        for doc_id, blob in rows:
+            if doc_id == exclude:
+                continue
+            s = similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if s >= threshold and (best is None or s > best[1]):
+                best = (doc_id, s)
+        return best
+
+    def add(self, doc_id, signature):
+        """
+        Add the signature of a document, a document id which is already indexed is ignored.
+        """
+        hashes = self.band_hashes(signature)
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO signatures (doc_id, signature) VALUES (?, ?)",
+                (doc_id, signature.astype(np.uint32).tobytes())
+            )
+            if cursor.rowcount == 1:
+                self.connection.executemany(
+                    "INSERT INTO bands (h, id) VALUES (?, ?)", [(h, cursor.lastrowid) for h in hashes]
+                )
+                self.uncommitted += 1
+                if self.uncommitted >= COMMIT_EVERY:
+                    self.connection.commit()
+                    self.uncommitted = 0
+
+    def __contains__(self, doc_id):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM signatures WHERE doc_id = ?", (doc_id,)
+            ).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT count(*) FROM signatures").fetchone()[0]
+
+    def flush(self):
+        with self.lock:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.commit()
+                self.connection.close()
+                self.connection = None
+
+
+class NearDuplicateDetector:
+    """
+    Finds near duplicates of documents among the documents seen before.
+
+    Kwargs:
+        :threshold (float, default=0.8): minimal estimated Jaccard similarity of near duplicates
+        :index (SignatureIndex, default=None): the index of the signatures, if None a new index in memory
+        :path (str, default=None): if `index` is None: the SQLite file of a new index
+        :num_perm (int, default=128): length of the signatures
+        :bands (int, default=16): number of LSH bands
+        :shingle_size (int, default=5): number of consecutive words of a shingle
+        :min_words (int, default=None): documents with less words are not checked (and not indexed),
+            if None `shingle_size`
+    """
+
+    def __init__(self,
+                 threshold=DEFAULT_THRESHOLD,
+                 index=None,
+                 path=None,
+                 num_perm=DEFAULT_NUM_PERM,
+                 bands=DEFAULT_BANDS,
+                 shingle_size=DEFAULT_SHINGLE_SIZE,
+                 min_words=None
+                 ):
+        self.threshold = threshold
+        if index is None:
+            index = SignatureIndex(path=path if path is not None else ":memory:", num_perm=num_perm, bands=bands)
+        self.index = index
+        self.hasher = MinHasher(num_perm=index.num_perm, shingle_size=shingle_size)
+        self.min_words = min_words if min_words is not None else shingle_size
+
+    def check(self, doc_id, document, add=True):
+        """
+        Check whether a document (text or list of tokens) is a near duplicate of an indexed document.
+        A document which is not a near duplicate is added to the index (if `add`).
+
+        Returns:
+            :(doc_id, similarity): the id of the most similar indexed document, None if the document is not
+                a near duplicate (or too short to be checked)
+        """
+        n = len(words(document)) if isinstance(document, str) else len(document)
+        if n < self.min_words:
+            return None
+        signature = self.hasher.signature(document)
+        if signature is None:
+            return None
+        result = self.index.query(signature, threshold=self.threshold, exclude=doc_id)
+        if result is None and add:
+            self.index.add(doc_id, signature)
+        return result
+
+    def flush(self):
+        self.index.flush()
+
+    def close(self):
+        self.index.close()
+
+
+class NearDuplicates(pipeline.IteratorModifier):
+    """
+    Drop or tag near duplicates of an iterator of texts or token lists.
+
+    The id of a document is `id_function(tags)` for tagged items (by default its first tag, see `first_tag`) and
+    the number of the item otherwise. The first tag stays the same if tags are added to an item (e.g. by mode
+    "tag"), so the id is stable along a pipeline. As documents are compared with all documents indexed before
+    (but not with themselves), several passes over the same iterator with stable ids yield the same result.
+    Tagged documents with the same id are taken as the same document (a later one is never a near duplicate of
+    an earlier one), use an `id_function` combining several tags if the first tag is not unique.
+
+    Kwargs:
+        :detector (NearDuplicateDetector, default=None): if None a new detector (in memory) with `threshold`
+        :threshold (float, default=0.8): see `detector`
+        :mode (str, default="drop"): "drop" removes near duplicates, "tag" appends to the tags of each item the
+            id of the document it duplicates (None if it is no near duplicate), requires a tagged iterator
+        :id_function (function, default=None): id (str) of a document from its tags, if None `first_tag`
+    """
+
+    def __init__(self, detector=None, threshold=DEFAULT_THRESHOLD, mode="drop", id_function=None):
+        if mode not in ("drop", "tag"):
+            raise Exception("NearDuplicates: 'mode' must be 'drop' or 'tag', not '%s'" % mode)
+        self.detector = detector if detector is not None else NearDuplicateDetector(threshold=threshold)
+        self.mode = mode
+        self.id_function = id_function if id_function is not None else first_tag
+        self.stats = {"documents": 0, "duplicates": 0}
+        super(NearDuplicates, self).__init__()
+
+    def __call__(self, iterator):
+        if self.mode == "tag" and not iterator.is_tagged:
+            raise Exception("NearDuplicates: mode 'tag' requires a tagged iterator")
+
+        def generator():
+            self.stats = {"documents": 0, "duplicates": 0}
+            for n, x in enumerate(iterator):
+                if iterator.is_tagged:
+                    document, doc_id = x[0], self.id_function(x[1])
+                else:
+                    document, doc_id = x, str(n)
+                match = self.detector.check(doc_id, document)
+                self.stats["documents"] += 1
+                if match is not None:
+                    self.stats["duplicates"] += 1
+                if self.mode == "tag":
+                    yield x[0], x[1] + [match[0] if match is not None else None]
+                elif match is None:
+                    yield x
+            self.detector.flush()
+            logger.info("NearDuplicates: %i of %i documents are near duplicates (%.1f%%)" % (
+                self.stats["duplicates"], self.stats["documents"],
+                100.0 * self.stats["duplicates"] / max(1, self.stats["documents"])
+            ))
+
+        return pipeline.Iterator(generator, is_tagged=iterator.is_tagged)
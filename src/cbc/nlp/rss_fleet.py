@@ -0,0 +1,214 @@
+"""
+cbc.nlp.rss_fleet
+====================
+
+Run many scrapers in one process.
+
+A `ScraperFleet` hosts any number of `RssScraper` instances which share
+
+    * one thread pool downloading feeds and articles (its size is the global limit of concurrent requests)
+    * one `HttpClient` (pool of keep-alive connections) and one `HostRateLimiter`
+    * optionally one `ExtractionPool` (html extraction in worker processes)
+
+and are polled by one `FeedScheduler` loop. The known items of each scraper can be kept in a persistent
+`SeenItems` index per prefix (`seen_items_folder`) instead of in memory.
+
+Scrapers can be added and removed while the fleet is running. Two scrapers must not write to the same
+prefix (the fleet requires different prefixes).
+
+Example:
+
+    ::
+
+        >>> fleet = ScraperFleet(max_workers=32, seen_items_folder="/data/seen", min_interval=300)
+        >>> fleet.add(urls=spiegel_urls, prefix="spiegel", extractor=SPIEGEL_EXTRACTOR, content_handler=h)
+        >>> fleet.add(urls=tagesschau_urls, prefix="tagesschau", extractor=ARTICLE_EXTRACTOR, content_handler=h)
+        >>> fleet.start()
+        >>> ...
+        >>> fleet.report()
+        >>> fleet.stop()
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cbc.nlp.http_client import HttpClient
+from cbc.nlp.rss_scheduling import FeedScheduler
+from cbc.nlp.rss_scraping import RssScraper, HostRateLimiter
+from cbc.nlp.seen_items import SeenItems
+
+logger = logging.getLogger('cbc.nlp.rss_fleet')
+
+
+class ScraperFleet:
+    """
+    Scrapers sharing worker pools and one polling loop (see module documentation).
+
+    Kwargs:
+        :max_workers (int, default=16): threads downloading feeds and articles, i.e. the maximal number of
+            concurrent requests of all scrapers
+        :max_parallel_scrapers (int, default=4): number of scrapers pulling their feeds at the same time
+        :extraction_pool (ExtractionPool, default=None): shared pool for html extraction, if None the
+            extraction runs on the download threads
+        :http_client (HttpClient, default=None): shared http client, if None a new one
+        :rate_limiter (HostRateLimiter, default=None): shared limit of requests per host, if None one request
+            per second and host
+        :seen_items_folder (str, default=None): folder of the `SeenItems` index of each prefix, if None
+            the scrapers keep their known items in memory
+        :scheduler_kwargs: further arguments of the `FeedScheduler` (e.g. min_interval, max_interval)
+    """
+
+    def __init__(self,
+                 max_workers=16,
+                 max_parallel_scrapers=4,
+                 extraction_pool=None,
+                 http_client=None,
+                 rate_limiter=None,
+                 seen_items_folder=None,
+                 **scheduler_kwargs
+                 ):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fleet-fetch")
+        self.scraper_executor = ThreadPoolExecutor(max_workers=max_parallel_scrapers,
+                                                   thread_name_prefix="fleet-scraper")
+        self.extraction_pool = extraction_pool
+        self.http_client = http_client if http_client is not None else HttpClient(
+            max_connections_per_host=max_workers)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else HostRateLimiter(rate=1.0)
+        self.seen_items_folder = seen_items_folder
+        self.scheduler = FeedScheduler(executor=self.scraper_executor, **scheduler_kwargs)
+        self.scrapers = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.started = None
+
+    def add(self, **scraper_kwargs):
+        """
+        Create a scraper using the shared resources of the fleet and add it. The arguments are the arguments
+        of `RssScraper` (`executor`, `http_client`, `rate_limiter`, `extraction_pool` and - if the fleet has a
+        `seen_items_folder` - `seen_items` default to the fleet's).
+
+        Returns:
+            :RssScraper: the new scraper
+        """
+        kwargs = dict(
+            executor=self.executor,
+            http_client=self.http_client,
+            rate_limiter=self.rate_limiter,
+            extraction_pool=self.extraction_pool
+        )
+        prefix = scraper_kwargs.get("prefix", "")
+        if self.seen_items_folder is not None and scraper_kwargs.get("content_handler") is not None:
+            kwargs["seen_items"] = os.path.join(self.seen_items_folder, (prefix or "_root") + ".sqlite")
+        kwargs.update(scraper_kwargs)
+        self.check_prefix(prefix)
+        scraper = RssScraper(**kwargs)
+        return self.add_scraper(scraper)
+
+    def check_prefix(self, prefix):
+        """
+        Each scraper writes to its own prefix (the prefix also names its index of known items).
+        """
+        if prefix in self.scrapers:
+            raise Exception("ScraperFleet: a scraper with prefix '%s' is already added" % prefix)
+
+    def add_scraper(self, scraper):
+        """
+        Add an existing scraper. Its downloads use the fleet's thread pool.
+        """
+        with self.lock:
+            self.check_prefix(scraper.prefix)
+            self.scrapers[scraper.prefix] = scraper
+        scraper.executor = self.executor
+        self.scheduler.add_scraper(scraper)
+        logger.info("added scraper '%s' with %i feeds" % (scraper.prefix, len(scraper.urls)))
+        return scraper
+
+    def remove(self, prefix):
+        """
+        Remove the scraper of `prefix`, a running download of its feeds is finished.
+        """
+        with self.lock:
+            scraper = self.scrapers.pop(prefix)
+        self.scheduler.remove_scraper(scraper)
+        if isinstance(scraper.knownItems, SeenItems):
+            scraper.knownItems.flush()
+        logger.info("removed scraper '%s'" % prefix)
+        return scraper
+
+    def run(self, duration=None, max_rounds=None, reset=True):
+        """
+        Poll the feeds of all scrapers in the calling thread (see `FeedScheduler.run`).
+
+        Kwargs:
+            :reset (bool, default=True): poll even if the fleet was stopped before, if False a `stop` before
+                the call makes it return at once
+        """
+        if self.started is None:
+            self.started = time.time()
+        if reset:
+            self.scheduler.reset()
+        self.scheduler.run(duration=duration, max_rounds=max_rounds)
+
+    def start(self):
+        """
+        Poll the feeds of all scrapers in a background thread. A `stop` right after `start` is not lost even if
+        the thread has not started polling yet.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            raise Exception("ScraperFleet is already running")
+        self.scheduler.reset()
+        self.thread = threading.Thread(target=self.run, kwargs={"reset": False}, name="fleet", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop polling after the current round.
+        """
+        self.scheduler.stop()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def close(self):
+        """
+        Stop polling, shut down the thread pools and flush the indexes of known items.
+        """
+        self.stop()
+        self.scraper_executor.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+        for scraper in list(self.scrapers.values()):
+            if isinstance(scraper.knownItems, SeenItems):
+                scraper.knownItems.close()
+        self.http_client.close()
+
+    def report(self):
+        """
+        Returns:
+            :dict: the metrics of the scheduler, the elapsed time, the new items per second and per scraper
+                the number of feeds, feed downloads and new items
+        """
+        elapsed = time.time() - self.started if self.started is not None else 0.0
+        per_scraper = {}
+        for state in self.scheduler.states():
+            r = per_scraper.setdefault(state["prefix"], {"feeds": 0, "requests": 0, "new_items": 0})
+            r["feeds"] += 1
+            r["requests"] += state["fetches"]
+            r["new_items"] += state["new_items"]
+        result = self.scheduler.metrics()
+        result.update({
+            "scrapers": len(per_scraper),
+            "elapsed_seconds": elapsed,
+            "items_per_second": result["new_items"] / elapsed if elapsed > 0 else None,
+            "http": dict(self.http_client.stats),
+            "per_scraper": per_scraper
+        })
+        return result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
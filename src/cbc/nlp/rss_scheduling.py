@@ -0,0 +1,302 @@
+"""
+cbc.nlp.rss_scheduling
+=========================
+
+Adaptive polling of rss feeds.
+
+`RssScraper.poll` downloads all feeds of a scraper every `time_wait_seconds`. A `FeedScheduler` instead
+keeps a polling interval per feed, learned from the publication dates ("pubDate") of its items and
+the number of new items found:
+
+    * the interval is `fraction` times the median time between the recent publications of the feed
+    * if a feed has no publication dates, the interval is halved when new items are found
+    * if no new items are found, the interval is increased by the factor `backoff` (but not below the
+      interval from the publication dates)
+    * the interval is bounded by `min_interval` and `max_interval`
+
+The feeds of any number of scrapers are polled by one loop (`run`), each due feed is downloaded by its scraper
+(`RssScraper.pull_once(urls)`).
+
+Example:
+
+    ::
+
+        >>> scheduler = FeedScheduler([spiegel_scraper, tagesschau_scraper], min_interval=300, max_interval=6 * 3600)
+        >>> scheduler.run(duration=24 * 3600)
+        >>> scheduler.metrics()
+"""
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger('cbc.nlp.rss_scheduling')
+
+MAX_PUB_DATES = 20
+MAX_LATENCIES = 10000
+
+
+def parse_pub_date(pub_date):
+    """
+    Timestamp (seconds since the epoch) of a rss "pubDate" (RFC 822), None if it can not be parsed.
+    """
+    if pub_date is None:
+        return None
+    try:
+        d = parsedate_to_datetime(pub_date.strip())
+    except (TypeError, ValueError, IndexError):
+        return None
+    if d is None:
+        return None
+    return d.timestamp()
+
+
+class FeedState:
+    """
+    Polling state of a single feed.
+    """
+
+    def __init__(self, url, scraper, interval, next_fetch):
+        self.url = url
+        self.scraper = scraper
+        self.interval = interval
+        self.next_fetch = next_fetch
+        self.last_fetch = None
+        self.publication_interval = None
+        self.fetches = 0
+        self.new_items = 0
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "prefix": self.scraper.prefix,
+            "interval": self.interval,
+            "publication_interval": self.publication_interval,
+            "next_fetch": self.next_fetch,
+            "fetches": self.fetches,
+            "new_items": self.new_items
+        }
+
+
+class FeedScheduler:
+    """
+    Poll the feeds of several scrapers, each feed with its own adaptive interval (see module documentation).
+
+    Kwargs:
+        :scrapers (list of RssScraper, default=()): the scrapers, more can be added by `add_scraper`
+        :min_interval (float, default=300): minimal time between two downloads of a feed in seconds
+        :max_interval (float, default=86400): maximal time between two downloads of a feed in seconds
+        :initial_interval (float, default=None): interval of a new feed, if None `time_wait_seconds` of its scraper
+        :fraction (float, default=0.5): the interval as fraction of the median time between publications
+        :backoff (float, default=1.5): increase of the interval if no new items are found
+        :clock (function, default=time.time): the current time in seconds
+        :sleep (function, default=None): waits the given number of seconds, if None `wait` (which returns
+            early when a scraper is added or the scheduler is stopped)
+        :executor (concurrent.futures.Executor, default=None): if given, the feeds of different scrapers are
+            downloaded in parallel by this executor
+    """
+
+    def __init__(self,
+                 scrapers=(),
+                 min_interval=300,
+                 max_interval=86400,
+                 initial_interval=None,
+                 fraction=0.5,
+                 backoff=1.5,
+                 clock=time.time,
+                 sleep=None,
+                 executor=None
+                 ):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("FeedScheduler: 0 < min_interval <= max_interval is required")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.fraction = fraction
+        self.backoff = backoff
+        self.clock = clock
+        self.sleep = sleep if sleep is not None else self.wait
+        self.executor = executor
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.feeds = {}
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=MAX_LATENCIES)
+        self.baseline_requests = 0.0
+        self.requests = 0
+        self.new_items = 0
+        for s in scrapers:
+            self.add_scraper(s)
+
+    def clip(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def add_scraper(self, scraper):
+        """
+        Add the feeds of a scraper, they are due immediately.
+        """
+        now = self.clock()
+        interval = self.initial_interval if self.initial_interval is not None else scraper.timeWaitSeconds
+        with self.lock:
+            for url in scraper.urls:
+                self.feeds[(id(scraper), url)] = FeedState(url, scraper, self.clip(interval), now)
+        self.wake.set()
+
+    def remove_scraper(self, scraper):
+        with self.lock:
+            for key in [k for k, f in self.feeds.items() if f.scraper is scraper]:
+                del self.feeds[key]
+
+    def due(self, now=None):
+        """
+        The feeds to download now, as dict scraper -> list of FeedState.
+        """
+        if now is None:
+            now = self.clock()
+        result = {}
+        with self.lock:
+            for f in self.feeds.values():
+                if f.next_fetch <= now:
+                    result.setdefault(f.scraper, []).append(f)
+        return result
+
+    def next_due(self):
+        with self.lock:
+            return min((f.next_fetch for f in self.feeds.values()), default=None)
+
+    def update(self, feed, report, now):
+        """
+        Update the interval of a feed from the report of `RssScraper.pull_once`.
+        """
+        pub_dates = sorted(t for t in (parse_pub_date(d) for d in report.get("pub_dates", ())) if t is not None)
+        pub_dates = pub_dates[-MAX_PUB_DATES:]
+        if len(pub_dates) >= 2:
+            gaps = [b - a for a, b in zip(pub_dates, pub_dates[1:])]
+            feed.publication_interval = max(0.0, statistics.median(gaps))
+        new = report.get("new", 0)
+        if feed.publication_interval is not None:
+            base = self.fraction * feed.publication_interval
+            if new > 0:
+                interval = base
+            else:
+                interval = max(base, feed.interval * self.backoff)
+        elif new > 0:
+            interval = feed.interval / 2.0
+        else:
+            interval = feed.interval * self.backoff
+        if feed.last_fetch is not None:
+            self.baseline_requests += (now - feed.last_fetch) / feed.scraper.timeWaitSeconds
+        else:
+            self.baseline_requests += 1
+        feed.interval = self.clip(interval)
+        feed.last_fetch = now
+        feed.next_fetch = now + feed.interval
+        feed.fetches += 1
+        feed.new_items += new
+        self.new_items += new
+        if feed.fetches > 1:
+            # the new items of the first download are the backlog of the feed
+            for d in report.get("new_pub_dates", ()):
+                t = parse_pub_date(d)
+                if t is not None:
+                    self.latencies.append(max(0.0, now - t))
+
+    def pull(self, scraper, feeds):
+        """
+        Download the feeds of a scraper, returns (report of `RssScraper.pull_once`, time of completion).
+        """
+        try:
+            report = scraper.pull_once(urls=[f.url for f in feeds])
+        except Exception:
+            logger.error("%s : could not pull feeds" % scraper.prefix, exc_info=True)
+            report = {}
+        return report or {}, self.clock()
+
+    def run_once(self):
+        """
+        Download all due feeds (the feeds of different scrapers in parallel if the scheduler has an `executor`).
+        Returns the number of downloaded feeds.
+        """
+        due = self.due(self.clock())
+        if self.executor is not None:
+            futures = {scraper: self.executor.submit(self.pull, scraper, feeds) for scraper, feeds in due.items()}
+            results = ((scraper, feeds, futures[scraper].result()) for scraper, feeds in due.items())
+        else:
+            results = ((scraper, feeds, self.pull(scraper, feeds)) for scraper, feeds in due.items())
+        n = 0
+        for scraper, feeds, (report, finished) in results:
+            for f in feeds:
+                self.update(f, report.get(f.url, {}), finished)
+            self.requests += len(feeds)
+            n += len(feeds)
+        return n
+
+    def wait(self, seconds):
+        """
+        Wait `seconds`, or until a scraper is added or the scheduler is stopped.
+        """
+        self.wake.wait(seconds)
+
+    def stop(self):
+        """
+        Stop `run` (e.g. from another thread) after the current round. A stop before `run` is called makes
+        `run` return at once, the scheduler runs again after `reset`.
+        """
+        self.stopped.set()
+        self.wake.set()
+
+    def reset(self):
+        """
+        Allow `run` again after `stop`.
+        """
+        self.stopped.clear()
+
+    def run(self, duration=None, max_rounds=None):
+        """
+        Poll the feeds until `duration` seconds have passed or `max_rounds` rounds are done (forever if both are None).
+        """
+        start = self.clock()
+        rounds = 0
+        while (duration is None or self.clock() - start < duration) and (max_rounds is None or rounds < max_rounds) \
+                and not self.stopped.is_set():
+            n = self.run_once()
+            rounds += 1
+            logger.info("scheduler round %i: downloaded %i feeds, %s" % (rounds, n, self.metrics()))
+            # cleared before the wait is computed: scrapers added (or a stop) from now on end the wait
+            self.wake.clear()
+            if self.stopped.is_set() or (max_rounds is not None and rounds >= max_rounds):
+                break
+            next_due = self.next_due()
+            if next_due is None:
+                # no feeds (yet)
+                next_due = self.clock() + self.max_interval
+            wait = next_due - self.clock()
+            if duration is not None:
+                wait = min(wait, start + duration - self.clock())
+            if wait > 0:
+                self.sleep(wait)
+
+    def metrics(self):
+        """
+        Returns:
+            :dict: "requests" (feed downloads), "baseline_requests" (downloads of polling every
+                `time_wait_seconds` of the scrapers for the same time), "requests_saved", "new_items" and the
+                latency between publication and download of the new items ("latency_mean", "latency_median",
+                "latency_max" in seconds, of the last 10000 new items)
+        """
+        latencies = self.latencies
+        return {
+            "requests": self.requests,
+            "baseline_requests": int(round(self.baseline_requests)),
+            "requests_saved": int(round(self.baseline_requests)) - self.requests,
+            "new_items": self.new_items,
+            "latency_mean": statistics.mean(latencies) if latencies else None,
+            "latency_median": statistics.median(latencies) if latencies else None,
+            "latency_max": max(latencies) if latencies else None
+        }
+
+    def states(self):
+        with self.lock:
+            return [f.to_dict() for f in self.feeds.values()]
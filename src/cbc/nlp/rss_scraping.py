@@ -6,27 +6,104 @@ Read and store content from rss feeds
 """
 
 import hashlib
+import json
 import logging
 import random
 import re
+import threading
 import time
 import xml.etree.ElementTree as Et
-from urllib.request import Request, urlopen
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 from xml.etree.ElementTree import Element
 from xml.etree.ElementTree import ParseError
 from tika import parser as tk_parser
 import ssl
 import gc
 
+from cbc.nlp.extraction import check_picklable, extract_all
+from cbc.nlp.http_client import HttpClient
+from cbc.nlp.seen_items import SeenItems
+
 ssl._create_default_https_context = ssl._create_unverified_context
 
 logger = logging.getLogger('cbc.nlp.rss_scraping')
 
+DEFAULT_HTTP_CLIENT = HttpClient()
+"""
+The http client (pool of keep-alive connections) shared by all scrapers which are not given an own client
+"""
+
+FEED_CACHE_KEY = "_feed_cache.json"
+"""
+Key (within the prefix of a scraper) of the stored validators (ETag, Last-Modified) of the feeds
+"""
+
+
+class HostRateLimiter:
+    """
+    Politeness towards the scraped hosts: a token bucket per host allowing on average `rate` requests per second
+    and at most `burst` requests at once. Thread safe, may be shared by several scrapers.
+
+    Kwargs:
+        :rate (float, default=1.0): requests per second and host
+        :burst (int, default=1): maximal number of requests to a host without waiting
+    """
+
+    def __init__(self, rate=1.0, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url):
+        """
+        Wait until a request to the host of `url` is allowed.
+        """
+        host = urlparse(url).netloc
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                tokens, last = self.buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1.0:
+                    self.buckets[host] = (tokens - 1.0, now)
+                    return
+                self.buckets[host] = (tokens, now)
+                wait = (1.0 - tokens) / self.rate
+            time.sleep(wait)
+
 
 class RssScraper:
     """
     Class responsible for handling a list of rss feeds which are semantically related and which are handled
     the same was
+
+    Feeds and articles are fetched by `max_workers` threads (or by the threads of a given `executor`).
+    The requests to a single host are limited by `rate_limiter` (by default: one request per
+    `time_wait_between_items` seconds and host). New items are saved and registered as known by the
+    thread calling `pull_once`.
+
+    All requests use `http_client` (by default the shared `DEFAULT_HTTP_CLIENT`), which keeps the connections
+    to the hosts open between requests.
+
+    Feeds are requested conditionally ("If-None-Match", "If-Modified-Since") using the validators of
+    the last response. Unchanged feeds ("304 Not Modified") are not parsed. The validators are stored
+    by the content handler (key `FEED_CACHE_KEY`), so that they survive restarts.
+
+    The keys of the known items are by default listed from the content handler at startup and kept in memory.
+    With `seen_items` (a `cbc.nlp.seen_items.SeenItems` or the path of its SQLite file) they are kept in
+    a persistent index instead, which is filled from the content handler only once and updated with each
+    saved item.
+
+    With `extraction_pool` (a `cbc.nlp.extraction.ExtractionPool`) the text is extracted from the downloaded
+    html in worker processes while the downloads continue. The extractor must then be picklable.
+    The pool is also used by `regenerate_content(from_raw=True)` to re-extract the stored raw pages.
+
+    With `near_duplicates` (a `cbc.nlp.near_duplicates.NearDuplicateDetector`, which may be shared by several
+    scrapers) the content of each new item is compared with the items saved before. A near duplicate is
+    saved with the tag "duplicate_of" (the key of the similar item) or, if `drop_near_duplicates`, not saved
+    at all (but registered as known).
     """
 
     def __init__(
@@ -39,7 +116,16 @@ class RssScraper:
         content_handler=None,
         timeout=None,
         raw_content_handler=None,
-        num_of_loops=1
+        num_of_loops=1,
+        memory_monitor=None,
+        max_workers=1,
+        rate_limiter=None,
+        executor=None,
+        http_client=None,
+        seen_items=None,
+        extraction_pool=None,
+        near_duplicates=None,
+        drop_near_duplicates=False
     ):
         logger.info("Initializing scraper: '%s'" % prefix)
         self.urls = list(urls)
@@ -53,10 +139,51 @@ class RssScraper:
         self.raw_content_handler = raw_content_handler
         self.content_handler = content_handler
         self.num_of_loops = num_of_loops
+        self.memory_monitor = memory_monitor
+        self.max_workers = max_workers
+        if rate_limiter is None and time_wait_between_items is not None and time_wait_between_items > 0:
+            rate_limiter = HostRateLimiter(rate=1.0 / time_wait_between_items)
+        self.rate_limiter = rate_limiter
+        self.executor = executor
+        self.http_client = http_client if http_client is not None else DEFAULT_HTTP_CLIENT
+        if extraction_pool is not None:
+            check_picklable(self.extractors)
+        self.extraction_pool = extraction_pool
+        self.near_duplicates = near_duplicates
+        self.drop_near_duplicates = drop_near_duplicates
+        self.lock = threading.Lock()
+        self.feed_cache = {}
+        self.reset_feed_stats()
+        if isinstance(seen_items, str):
+            seen_items = SeenItems(seen_items)
         if self.content_handler is not None:
-            logger.info("Reading known items for '%s'." % prefix)
-            self.knownItems = {f: "x" for f in content_handler.list(self.prefix)}
-            logger.info("Ready: Reading known items for '%s', number: %i ." % (prefix, len(self.knownItems)))
+            if seen_items is not None:
+                if not seen_items.is_bootstrapped:
+                    logger.info("Bootstrapping index of known items for '%s'." % prefix)
+                    seen_items.bootstrap(content_handler.list(self.prefix))
+                self.knownItems = seen_items
+                # no count of the known items, it would scan the whole index
+                logger.info("Ready: known items for '%s' in %s ." % (prefix, seen_items.path))
+            else:
+                logger.info("Reading known items for '%s'." % prefix)
+                self.knownItems = {f: "x" for f in content_handler.list(self.prefix)}
+                logger.info("Ready: Reading known items for '%s', number: %i ." % (prefix, len(self.knownItems)))
+            self.load_feed_cache()
+
+    def load_feed_cache(self):
+        try:
+            if self.content_handler.exists(FEED_CACHE_KEY, prefix=self.prefix):
+                self.feed_cache = json.loads(self.content_handler.get_text(FEED_CACHE_KEY, prefix=self.prefix))
+        except (IOError, ValueError):
+            logger.warning("%s : could not read feed cache" % self.prefix, exc_info=True)
+            self.feed_cache = {}
+
+    def reset_feed_stats(self):
+        self.feed_stats = {"requests": 0, "not_modified": 0, "bytes_saved": 0, "bytes_read": 0, "modified_urls": []}
+
+    def save_feed_cache(self):
+        if self.content_handler is not None:
+            self.content_handler.save_text(FEED_CACHE_KEY, json.dumps(self.feed_cache), prefix=self.prefix)
 
     def get_item(self, a_key):
         """
@@ -84,37 +211,172 @@ class RssScraper:
                 prefix=self.prefix
             )
 
-    def pull_once(self):
+    def map_concurrent(self, f, args):
+        """
+        Apply `f` to all `args` using the executor (or `max_workers` threads), yields (arg, result)
+        in the order of completion.
+        """
+        if self.executor is None and self.max_workers <= 1:
+            for a in args:
+                yield a, f(a)
+            return
+        executor = self.executor if self.executor is not None else ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {executor.submit(f, a): a for a in args}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            if executor is not self.executor:
+                executor.shutdown(wait=True)
+
+    def fetch_raw(self, an_item):
+        """
+        Download the article of an item. Returns the raw bytes of the article (None if it could not be downloaded).
+        """
+        link_url = RssScraper.get_link_from_item(an_item)
+        if link_url is None:
+            return None
+        try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(link_url)
+            return RssScraper.read_doc_from_url(link_url, timeout=self.timeout, http_client=self.http_client)
+        except Exception:
+            logger.error("%s : could not read %s" % (self.prefix, link_url), exc_info=True)
+            return None
+
+    def fetch_content(self, an_item):
+        """
+        Download the article of an item and add its content for all extractors.
+        Returns the raw bytes of the article (None if it could not be downloaded).
+        """
+        raw_bytes = self.fetch_raw(an_item)
+        if raw_bytes is not None:
+            try:
+                for aLanguage, a_text in extract_all(self.extractors, raw_bytes).items():
+                    RssScraper.set_content_of_item(an_item, a_text, aLanguage)
+            except Exception:
+                logger.error("%s : could not add content from %s" % (
+                    self.prefix, RssScraper.get_link_from_item(an_item)), exc_info=True)
+                raw_bytes = None
+        return raw_bytes
+
+    def fetch_and_extract(self, items):
+        """
+        Download the articles of `items` (dict key -> item) and add their content using the extraction pool.
+        The extraction of downloaded articles runs while further articles are downloaded.
+        Yields (key, raw bytes of the article or None if it could not be downloaded or extracted).
+        """
+        raw = {}
+        failed = []
+
+        def fetched():
+            for key, raw_bytes in self.map_concurrent(lambda k: self.fetch_raw(items[k]), list(items)):
+                if raw_bytes is not None:
+                    raw[key] = raw_bytes
+                    yield key, raw_bytes
+                else:
+                    failed.append(key)
+
+        for key, texts in self.extraction_pool.map_unordered(self.extractors, fetched()):
+            raw_bytes = raw.pop(key)
+            if texts is not None:
+                for aLanguage, a_text in texts.items():
+                    RssScraper.set_content_of_item(items[key], a_text, aLanguage)
+                yield key, raw_bytes
+            else:
+                yield key, None
+        for key in failed:
+            yield key, None
+
+    def pull_once(self, urls=None):
+        """
+        Download the feeds and save their new items.
+
+        Kwargs:
+            :urls (list of str, default=None): the feeds to download, if None all feeds of the scraper
+
+        Returns:
+            :dict: for each feed url a dict with the number of "items" in the feed (0 if not modified),
+                the number of saved "new" items, the "pub_dates" (str) of all items and the "new_pub_dates"
+                of the saved new items
+        """
         num_all = 0
         num_new = 0
-        for i in self.get_all_items():
-            num_all = num_all + 1
-            l_ = RssScraper.get_link_from_item(i)
-            key = RssScraper.get_md5_hash(l_)
-            file_name =  key + ".xml"
-            raw_bytes = None
-            if file_name not in self.knownItems:
-                found_content = False
-                for aLanguage in self.extractors:
-                    raw_bytes_ = RssScraper.add_content_to_item(
-                        i,
-                        self.extractors[aLanguage],
-                        aLanguage,
-                        time_wait=self.timeWaitBetweenItems,
-                        timeout=self.timeout
-                    )
-                    if raw_bytes is None and raw_bytes_ is not None:
-                        raw_bytes = raw_bytes_
-                    found_content = found_content or (raw_bytes_ is not None)
-                if found_content:
-                    num_new = num_new + 1
-                    if self.content_handler is not None:
-                        self.knownItems[file_name] = "x"
-                    else:
-                        self.knownItems[file_name] = i
-                    self.save_item(i, file_name, item_url=l_)
-                    self.save_raw(raw_bytes, key + ".raw", item_url=l_)
+        num_failed = 0
+        num_duplicates = 0
+        new_items = {}
+        new_item_urls = {}
+        self.reset_feed_stats()
+        items_by_url = self.get_items_by_url(urls)
+        report = {url: {"items": len(items), "new": 0, "pub_dates": [], "new_pub_dates": []}
+                  for url, items in items_by_url.items()}
+        for url, items in items_by_url.items():
+            for i in items:
+                num_all = num_all + 1
+                report[url]["pub_dates"].append(RssScraper.get_pub_date_from_item(i))
+                l_ = RssScraper.get_link_from_item(i)
+                key = RssScraper.get_md5_hash(l_)
+                file_name =  key + ".xml"
+                if file_name not in self.knownItems and file_name not in new_items:
+                    new_items[file_name] = i
+                    new_item_urls[file_name] = url
+        if self.extraction_pool is not None:
+            fetched = self.fetch_and_extract(new_items)
+        else:
+            fetched = self.map_concurrent(lambda f: self.fetch_content(new_items[f]), list(new_items))
+        for file_name, raw_bytes in fetched:
+            if raw_bytes is not None:
+                i = new_items[file_name]
+                l_ = RssScraper.get_link_from_item(i)
+                if self.check_near_duplicate(i, file_name) and self.drop_near_duplicates:
+                    num_duplicates += 1
+                    self.knownItems[file_name] = "x"
+                    continue
+                num_new = num_new + 1
+                self.save_item(i, file_name, item_url=l_)
+                self.save_raw(raw_bytes, RssScraper.get_raw_key(file_name), item_url=l_)
+                if self.content_handler is not None:
+                    self.knownItems[file_name] = "x"
+                else:
+                    self.knownItems[file_name] = i
+                report[new_item_urls[file_name]]["new"] += 1
+                report[new_item_urls[file_name]]["new_pub_dates"].append(RssScraper.get_pub_date_from_item(i))
+            else:
+                num_failed += 1
+        if num_failed > 0:
+            # items without content are retried in the next round, so their feeds must be downloaded again
+            for url in self.feed_stats["modified_urls"]:
+                self.feed_cache.pop(url, None)
+        if isinstance(self.knownItems, SeenItems):
+            self.knownItems.flush()
+        if self.near_duplicates is not None:
+            self.near_duplicates.flush()
+        self.save_feed_cache()
         logger.info("%s : Inserted %i new items (from %i)" % (self.prefix, num_new, num_all))
+        if num_duplicates > 0:
+            logger.info("%s : Dropped %i near duplicates" % (self.prefix, num_duplicates))
+        logger.info("%s : feed requests=%i, not modified=%i, bytes read=%i, bytes saved=%i" % (
+            self.prefix, self.feed_stats["requests"], self.feed_stats["not_modified"],
+            self.feed_stats["bytes_read"], self.feed_stats["bytes_saved"]
+        ))
+        return report
+
+    def check_near_duplicate(self, an_item, a_key):
+        """
+        Check whether the content of an item is a near duplicate of an item saved before, and tag it if so.
+        Returns True for near duplicates.
+        """
+        if self.near_duplicates is None:
+            return False
+        text = "\n".join(c.text for c in an_item.findall('content') if c.text)
+        match = self.near_duplicates.check(self.prefix + "/" + a_key, text)
+        if match is None:
+            return False
+        duplicate_of = Element("duplicate_of")
+        duplicate_of.set("similarity", "%.3f" % match[1])
+        duplicate_of.text = match[0]
+        an_item.append(duplicate_of)
+        return True
 
     def poll(self, num_of_loops=None, time_wait_seconds=None):
         i = 0
@@ -124,51 +386,109 @@ class RssScraper:
             time_wait_seconds = self.timeWaitSeconds
         while i != num_of_loops:
             logger.info("Scraper %s, starting round %i / %i" % (self.prefix, i+1, num_of_loops))
-            self.pull_once()
+            if self.memory_monitor is not None:
+                with self.memory_monitor.round("%s %i" % (self.prefix, i+1)):
+                    self.pull_once()
+            else:
+                self.pull_once()
             logger.info("Scraper %s, round %i / %i, sleeping %i seconds" % (self.prefix, i+1, num_of_loops, time_wait_seconds))
             if i+1 == num_of_loops:
+                if isinstance(self.knownItems, SeenItems):
+                    self.knownItems.close()
                 del self.knownItems
                 gc.collect()
             time.sleep(time_wait_seconds)
             logger.info("Ready: Scraper %s, round %i / %i" % (self.prefix, i+1, num_of_loops))
             i = i+1
 
-    def get_all_items(self):
-        rss_docs = [
-            RssScraper.append_channel_info_to_items(
-                RssScraper.parse_xml_from_url(
-                    url,
-                    timeout=self.timeout
-                )
-            )
-            for url in self.urls
-        ]
-        result = [i for doc in rss_docs if doc is not None for i in doc.findall('./channel/item')]
-        return result
+    def get_feed(self, url):
+        """
+        Conditionally download and parse a feed. Returns None if the feed has not been modified since the last
+        download (or if it could not be read).
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(url)
+        cached = self.feed_cache.get(url, {})
+        headers = {}
+        if cached.get("etag") is not None:
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified") is not None:
+            headers["If-Modified-Since"] = cached["last_modified"]
+        status, doc, response_headers = RssScraper.fetch_url(
+            url, timeout=self.timeout, headers=headers, http_client=self.http_client
+        )
+        with self.lock:
+            self.feed_stats["requests"] += 1
+            if status == 304:
+                self.feed_stats["not_modified"] += 1
+                self.feed_stats["bytes_saved"] += cached.get("length", 0)
+            elif doc is not None:
+                self.feed_stats["bytes_read"] += len(doc)
+        if status == 304:
+            logger.debug("%s : feed not modified: %s" % (self.prefix, url))
+            return None
+        if doc is None:
+            logger.warning("Could not retrieve doc from url\n %s" % url)
+            return None
+        result = None
+        try:
+            result = Et.fromstring(doc)
+        except ParseError:
+            logger.error("Could not parse xml from '%s'" % url)
+        with self.lock:
+            if result is not None and (response_headers.get("ETag") or response_headers.get("Last-Modified")):
+                self.feed_cache[url] = {
+                    "etag": response_headers.get("ETag"),
+                    "last_modified": response_headers.get("Last-Modified"),
+                    "length": len(doc)
+                }
+                self.feed_stats["modified_urls"].append(url)
+            else:
+                self.feed_cache.pop(url, None)
+        return RssScraper.append_channel_info_to_items(result)
+
+    def get_items_by_url(self, urls=None):
+        """
+        Download the feeds `urls` (default: all feeds of the scraper), returns a dict url -> list of items
+        (empty if the feed has not been modified or could not be read), in the order of `urls`.
+        """
+        if urls is None:
+            urls = self.urls
+        docs = dict(self.map_concurrent(self.get_feed, urls))
+        return {url: docs[url].findall('./channel/item') if docs[url] is not None else [] for url in urls}
+
+    def get_all_items(self, urls=None):
+        return [i for items in self.get_items_by_url(urls).values() for i in items]
 
     def get_all_item_links(self):
         return [RssScraper.get_link_from_item(i) for i in self.get_all_items()]
 
     @staticmethod
-    def add_content_to_item(an_item, an_extractor, language='default', time_wait=0.0, timeout=None):
+    def add_content_to_item(an_item, an_extractor, language='default', time_wait=0.0, timeout=None,
+                            http_client=None):
         link_url = RssScraper.get_link_from_item(an_item)
-        content_ = None
         html = None
         if link_url is not None:
             time.sleep(time_wait)
-            html = RssScraper.read_doc_from_url(link_url, timeout=timeout)
+            html = RssScraper.read_doc_from_url(link_url, timeout=timeout, http_client=http_client)
             if html is not None:
-                old_content = an_item.find('content[@language="' + language + '"]')
-                if old_content is not None:
-                    an_item.remove(old_content)
-                a_text = an_extractor(html)
-                content_ = Element("content")
-                if language is not None:
-                    content_.set('language', language)
-                content_.text = a_text
-                an_item.append(content_)
+                RssScraper.set_content_of_item(an_item, an_extractor(html), language)
         return html
 
+    @staticmethod
+    def set_content_of_item(an_item, a_text, language='default'):
+        """
+        Add the tag "content" with the extracted text, replacing the content of the same language.
+        """
+        old_content = an_item.find('content[@language="' + language + '"]')
+        if old_content is not None:
+            an_item.remove(old_content)
+        content_ = Element("content")
+        if language is not None:
+            content_.set('language', language)
+        content_.text = a_text
+        an_item.append(content_)
+
     @staticmethod
     def get_link_from_item(an_item):
         link = an_item.find('link')
@@ -177,6 +497,11 @@ class RssScraper:
             link_url = link.text
         return link_url
 
+    @staticmethod
+    def get_pub_date_from_item(an_item):
+        pub_date = an_item.find('pubDate')
+        return pub_date.text if pub_date is not None else None
+
     @staticmethod
     def get_md5_hash(s):
         m = hashlib.md5()
@@ -203,44 +528,115 @@ class RssScraper:
         return a_doc
 
     @staticmethod
-    def read_doc_from_url(an_url, timeout=None):
-        result = None
+    def fetch_url(an_url, timeout=None, headers=None, http_client=None):
+        """
+        Read from an url.
+
+        Returns:
+            :(status, body, headers): the http status (None if the url could not be read), the body
+                (None if the status is not 2xx, e.g. 304) and the response headers
+        """
+        if http_client is None:
+            http_client = DEFAULT_HTTP_CLIENT
         try:
-            req = Request(an_url, headers={'User-Agent': 'Mozilla/5.0'})
-            if timeout is not None:
-                result = urlopen(req, timeout=timeout).read()
-            else:
-                result = urlopen(req).read()
+            response = http_client.get(an_url, headers=headers, timeout=timeout)
         except IOError:
-            logger.error("could not read from %s" % an_url)
+            logger.error("could not read from %s" % an_url, exc_info=True)
+            return None, None, {}
+        if 200 <= response.status < 300:
+            return response.status, response.body, response.headers
+        if response.status != 304:
+            logger.error("could not read from %s, status %i" % (an_url, response.status))
+        return response.status, None, response.headers
+
+    @staticmethod
+    def read_doc_from_url(an_url, timeout=None, http_client=None):
+        _, result, _ = RssScraper.fetch_url(an_url, timeout=timeout, http_client=http_client)
+        if result is None:
             print("could not read from %s" % an_url)
         return result
 
     @staticmethod
-    def parse_xml_from_url(an_url, timeout=None):
+    def parse_xml_from_url(an_url, timeout=None, http_client=None):
         result = None
         if an_url is not None:
-            doc = RssScraper.read_doc_from_url(an_url, timeout=timeout)
+            doc = RssScraper.read_doc_from_url(an_url, timeout=timeout, http_client=http_client)
             if doc is not None:
                 try:
-                    result = Et.fromstring(RssScraper.read_doc_from_url(an_url, timeout=timeout))
+                    result = Et.fromstring(doc)
                 except ParseError:
                     logger.error("Could not parse xml from '%s'" % an_url)
             else:
                 logger.warning("Could not retrieve doc from url\n %s" % an_url)
         return result
 
-    def reload_content(self, a_file_name):
+    @staticmethod
+    def get_raw_key(a_file_name):
+        return a_file_name[:-len(".xml")] + ".raw"
+
+    def get_raw(self, a_file_name):
+        """
+        The stored raw article of the item stored as `a_file_name`.
+        """
+        if self.raw_content_handler is None:
+            raise Exception("raw content is not stored for this scraper (raw_content_handler is None)")
+        return self.raw_content_handler.get_bytes(RssScraper.get_raw_key(a_file_name), prefix=self.prefix)
+
+    def reload_content(self, a_file_name, from_raw=False):
+        """
+        Read an item and extract its content again, from the article downloaded again or (`from_raw`)
+        from the stored raw article.
+        """
         the_item = self.get_item(a_file_name)
         if the_item is not None:
-            for aLanguage in self.extractors:
-                RssScraper.add_content_to_item(the_item, self.extractors[aLanguage], aLanguage)
+            if from_raw:
+                for aLanguage, a_text in extract_all(self.extractors, self.get_raw(a_file_name)).items():
+                    RssScraper.set_content_of_item(the_item, a_text, aLanguage)
+            else:
+                for aLanguage in self.extractors:
+                    RssScraper.add_content_to_item(the_item, self.extractors[aLanguage], aLanguage)
         return the_item
 
-    def regenerate_content(self, a_file_list):
-        for f in a_file_list:
-            item = self.reload_content(f)
-            self.save_item(item, f)
+    def regenerate_content(self, a_file_list=None, from_raw=False):
+        """
+        Extract the content of stored items again and save them, e.g. after a change of the extractor.
+
+        Kwargs:
+            :a_file_list (list of str, default=None): the keys of the items, if None all items of the prefix
+            :from_raw (boolean, default=False): extract from the stored raw articles (`raw_content_handler`)
+                instead of downloading them again. The extraction runs in the extraction pool (if any).
+
+        Returns:
+            :int: the number of regenerated items
+        """
+        if from_raw and self.raw_content_handler is None:
+            raise Exception("raw content is not stored for this scraper (raw_content_handler is None)")
+        if a_file_list is None:
+            a_file_list = [f for f in self.content_handler.list(self.prefix) if f.endswith(".xml")]
+        n = 0
+        if not from_raw or self.extraction_pool is None:
+            for f in a_file_list:
+                item = self.reload_content(f, from_raw=from_raw)
+                self.save_item(item, f)
+                n += 1
+            return n
+
+        def raw_pages():
+            for f_ in a_file_list:
+                try:
+                    yield f_, self.get_raw(f_)
+                except Exception:
+                    logger.error("%s : could not read raw content of %s" % (self.prefix, f_), exc_info=True)
+
+        for f, texts in self.extraction_pool.map_unordered(self.extractors, raw_pages()):
+            if texts is not None:
+                item = self.get_item(f)
+                for aLanguage, a_text in texts.items():
+                    RssScraper.set_content_of_item(item, a_text, aLanguage)
+                self.save_item(item, f)
+                n += 1
+        logger.info("%s : regenerated %i of %i items" % (self.prefix, n, len(a_file_list)))
+        return n
 
 
 def get_text_from_pdf_buffer(some_bytes):
@@ -0,0 +1,146 @@
+"""
+cbc.nlp.seen_items
+=====================
+
+Persistent set of the keys of already scraped items.
+
+Without an index a scraper has to list all stored keys of its prefix at startup, which takes time and memory
+proportional to the number of items ever scraped (and minutes with S3). `SeenItems` keeps the keys in a local
+SQLite file instead: opening it takes milliseconds, lookups are index searches on disk (the memory used is
+bounded by the SQLite page cache) and new keys are added incrementally.
+
+Keys are stored as 64 bit hashes (blake2b). The probability of a false "seen" among 10 million keys
+is about 3e-6.
+
+Example:
+
+    ::
+
+        >>> seen = SeenItems("/tmp/seen_items.sqlite")
+        >>> seen.add("0123456789abcdef0123456789abcdef.xml")
+        >>> "0123456789abcdef0123456789abcdef.xml" in seen
+        True
+        >>> seen.flush()
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger('cbc.nlp.seen_items')
+
+DEFAULT_FLUSH_SIZE = 10000
+DEFAULT_CACHE_SIZE_KB = 16 * 1024
+
+
+def key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+class SeenItems:
+    """
+    Set of strings persisted in a SQLite file. Thread safe.
+
+    Added keys are written in batches, i.e. when `flush_size` keys are pending and by `flush` (and `close`).
+    Pending keys are contained in the set immediately.
+
+    Supports `key in seen`, `len(seen)`, `add`, `update` and - so that it can replace the dict of
+    known items of a scraper - `seen[key] = value` (the value is not stored).
+
+    Args:
+        :path (str): the SQLite file, created if it does not exist
+
+    Kwargs:
+        :flush_size (int, default=10000): number of pending keys which triggers a write
+        :cache_size_kb (int, default=16MB): maximal size of the SQLite page cache
+    """
+
+    def __init__(self, path, flush_size=DEFAULT_FLUSH_SIZE, cache_size_kb=DEFAULT_CACHE_SIZE_KB):
+        self.path = str(path)
+        self.flush_size = flush_size
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA cache_size=-%i" % cache_size_kb)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS seen (h INTEGER PRIMARY KEY)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.connection.commit()
+
+    def __contains__(self, key):
+        h = key_hash(key)
+        with self.lock:
+            if h in self.pending:
+                return True
+            return self.connection.execute("SELECT 1 FROM seen WHERE h = ?", (h,)).fetchone() is not None
+
+    def add(self, key):
+        with self.lock:
+            self.pending.add(key_hash(key))
+            if len(self.pending) >= self.flush_size:
+                self._flush()
+
+    def __setitem__(self, key, value):
+        self.add(key)
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def __len__(self):
+        with self.lock:
+            self._flush()
+            return self.connection.execute("SELECT count(*) FROM seen").fetchone()[0]
+
+    def _flush(self):
+        if self.pending:
+            self.connection.executemany("INSERT OR IGNORE INTO seen (h) VALUES (?)", ((h,) for h in self.pending))
+            self.connection.commit()
+            self.pending = set()
+
+    def flush(self):
+        """
+        Write the pending keys.
+        """
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self._flush()
+                self.connection.close()
+                self.connection = None
+
+    def get_meta(self, name, default=None):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, name, value):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+            self.connection.commit()
+
+    @property
+    def is_bootstrapped(self):
+        return self.get_meta("bootstrapped") == "1"
+
+    def bootstrap(self, keys):
+        """
+        Add all `keys` (e.g. the keys listed by a content handler) once. Later calls do nothing,
+        afterwards the set is only updated incrementally.
+        """
+        if not self.is_bootstrapped:
+            n = 0
+            for key in keys:
+                self.add(key)
+                n += 1
+            self.flush()
+            self.set_meta("bootstrapped", "1")
+            logger.info("%s : bootstrapped with %i keys" % (self.path, n))
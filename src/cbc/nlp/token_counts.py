@@ -0,0 +1,110 @@
+"""
+cbc.nlp.token_counts
+=======================
+
+Storage of token counts (e.g. of `cbc.nlp.base.CountTokens`) together with the number of documents counted.
+
+A counts file is a text file with a header line `#documents<TAB><number of documents>` followed by one line
+`<token><TAB><count>` per token, in order of decreasing counts. Backslashes, tabs and line breaks in tokens are
+written as `\\\\`, `\\t`, `\\n` and `\\r`. Counts of parts of a corpus (e.g. counted in parallel) are summed up by
+loading several files at once.
+
+The counts are used to build the vocabulary of a word2vec model without a pass over the corpus
+(`cbc.nlp.word2vec_tools.Word2VecWrap(word_freq=...)`).
+
+Example:
+
+    ::
+
+        >>> counter = CountTokens() ** tokens_iterator
+        >>> counter.save("counts.tsv", base_folder="/tmp")
+        >>> word_counts, documents = load_counts("counts.tsv", base_folder="/tmp")
+"""
+import logging
+import re
+from collections import Counter
+
+import cbc.content as content
+
+logger = logging.getLogger('cbc.nlp.token_counts')
+
+DOCUMENTS_HEADER = "#documents"
+
+ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+UNESCAPES = {v[1]: k for k, v in ESCAPES.items()}
+ESCAPE_TABLE = str.maketrans(ESCAPES)
+ESCAPED = re.compile(r"\\(.)")
+
+
+def escape_token(token):
+    """
+    The token with backslashes, tabs and line breaks escaped (a token is written to a single field of a line).
+    """
+    return token.translate(ESCAPE_TABLE)
+
+
+def unescape_token(field):
+    """
+    Inverse of `escape_token`.
+    """
+    if "\\" not in field:
+        return field
+    return ESCAPED.sub(lambda m: UNESCAPES.get(m.group(1), m.group(0)), field)
+
+
+def _content_handler(content_handler, base_folder):
+    if content_handler is None:
+        return content.FileSystemContentHandler(base_prefix=base_folder)
+    return content_handler
+
+
+def save_counts(word_counts, key, document_count=None, prefix="", content_handler=None, base_folder="."):
+    """
+    Save token counts.
+
+    Args:
+        :word_counts (dict or Counter): token -> count
+        :key (str): the key of the counts file, compressed if it ends with ".gz", ".bz2" or ".xz"
+
+    Kwargs:
+        :document_count (int, default=None): number of documents counted (unknown if None)
+        :prefix (str, default=""): prefix used with the content handler
+        :content_handler (ContentHandler, default=None): the target of the file, if None a FileSystemContentHandler
+            for `base_folder` is used
+        :base_folder (str, default="."): see `content_handler`
+    """
+    content_handler = _content_handler(content_handler, base_folder)
+    counts = word_counts.most_common() if isinstance(word_counts, Counter) else \
+        sorted(word_counts.items(), key=lambda wc: -wc[1])
+    lines = ["%s\t%i\n" % (DOCUMENTS_HEADER, document_count if document_count is not None else -1)]
+    lines.extend("%s\t%i\n" % (escape_token(str(w)), c) for w, c in counts)
+    content_handler.write_iterator(iter(lines), key, prefix=prefix)
+    logger.info("saved counts of %i tokens (%i documents) to %s" % (len(counts), document_count or -1, key))
+
+
+def load_counts(keys, prefix="", content_handler=None, base_folder="."):
+    """
+    Load token counts, the counts of several files are summed up.
+
+    Args:
+        :keys (str or list of str): the key(s) of the counts file(s)
+
+    Returns:
+        :(Counter, int): the token counts and the number of documents (None if unknown for any file)
+    """
+    content_handler = _content_handler(content_handler, base_folder)
+    if isinstance(keys, str):
+        keys = [keys]
+    word_counts = Counter()
+    document_count = 0
+    for key in keys:
+        lines = content_handler.iterate_lines(key, prefix=prefix)
+        header, documents = next(lines).rstrip("\n").split("\t")
+        if header != DOCUMENTS_HEADER:
+            raise Exception("'%s' is no counts file" % key)
+        documents = int(documents)
+        document_count = None if document_count is None or documents < 0 else document_count + documents
+        for line in lines:
+            token, count = line.rstrip("\n").rsplit("\t", 1)
+            word_counts[unescape_token(token)] += int(count)
+    return word_counts, document_count
@@ -0,0 +1,259 @@
+"""
+cbc.nlp.wiki_incremental
+===========================
+
+Incremental processing of successive Wikipedia dumps.
+
+A folder holds the processed articles of the last dump (in the format of `wikitools.wiki_to_simple_text`,
+with the sidecar index of `wikitools.WikiFromTextIterator`) and a manifest with a hash of the raw title and
+text of each page. Updating the folder with a new dump only sends new or changed pages through `filter_wiki`
+(and an optional item modifier, e.g. a tokenizer), the articles of unchanged pages are copied byte by byte
+from the previous output. The merge writes a complete corpus in the order of the new dump, pages which are
+no longer in the dump are dropped.
+
+Files of the folder:
+
+    * `articles.txt` (and `articles.txt.idx`): the processed articles
+    * `manifest.tsv`: pageid, hash of the raw page (and "dropped" for pages dropped by the item modifier)
+    * `changes.tsv`: status ("new", "changed", "deleted"), pageid, title of each page changed by the last update
+    * `report.json`: counts of the last update
+
+Example:
+
+    ::
+
+        >>> store = IncrementalWikiText("wiki/dewiki")
+        >>> store.update("dewiki-20240101-pages-articles.xml.bz2")
+        {'new': 2811012, 'changed': 0, 'unchanged': 0, 'deleted': 0, ...}
+        >>> store.update("dewiki-20240201-pages-articles.xml.bz2")
+        {'new': 21325, 'changed': 160211, 'unchanged': 2648793, 'deleted': 3008, ...}
+        >>> texts = WikiFromTextIterator(store.articles_file, index_file=store.index_file)
+"""
+import bz2
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from cbc.nlp import wikitools
+
+logger = logging.getLogger('cbc.nlp.wiki_incremental')
+
+ARTICLES_FILE = "articles.txt"
+MANIFEST_FILE = "manifest.tsv"
+CHANGES_FILE = "changes.tsv"
+REPORT_FILE = "report.json"
+TMP_SUFFIX = ".tmp"
+DROPPED = "dropped"
+
+
+def page_hash(title, text):
+    return hashlib.blake2b((title + "\n" + text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def read_manifest(manifest_file):
+    """
+    The manifest as dict pageid -> (hash, dropped), empty if the file does not exist. `dropped` is True for
+    pages which have no article as the item modifier dropped them.
+    """
+    if not os.path.exists(manifest_file):
+        return {}
+    manifest = {}
+    with open(manifest_file, encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            manifest[fields[0]] = (fields[1], fields[2:] == [DROPPED])
+    return manifest
+
+
+def process_pages(pages):
+    """
+    Process the pages (title, text, pageid) of a chunk in a worker process: `filter_wiki` and the item
+    modifier of the worker. Pages with text None are not processed.
+
+    Returns:
+        :list of (pageid, title, processed, text): text None for pages which are not processed or which are
+            dropped by the item modifier
+    """
+    result = []
+    for title, text, pageid in pages:
+        processed = text is not None
+        if processed:
+            text = wikitools.filter_wiki(text)
+            if wikitools._worker_item_modifier is not None:
+                text = wikitools._worker_item_modifier(text)
+                if isinstance(text, list):
+                    text = " ".join(text)
+        result.append((pageid, title, processed, text))
+    return result
+
+
+class IncrementalWikiText:
+    """
+    Processed articles of the latest dump, updated incrementally (see module documentation).
+
+    Args:
+        :folder (str): the folder of the articles, the manifest and the reports
+
+    Kwargs:
+        :processes (int, default=None): number of worker processes, if None the number of cpus - 1
+        :filter_namespaces (tuple of str, default=('0',)): pages of other namespaces are kept with empty text
+        :item_modifier (ItemModifier, default=None): applied to the filtered text of new and changed pages within
+            the workers, a list result (tokens) is joined by spaces. Changing it requires a full rebuild
+            (see `update`)
+        :chunksize (int, default=10): number of pages per task
+    """
+
+    def __init__(self, folder, processes=None, filter_namespaces=('0',), item_modifier=None, chunksize=10):
+        self.folder = folder
+        if processes is None:
+            processes = max(1, multiprocessing.cpu_count() - 1)
+        self.processes = processes
+        self.filter_namespaces = filter_namespaces
+        self.item_modifier = item_modifier
+        self.chunksize = chunksize
+        self.articles_file = os.path.join(folder, ARTICLES_FILE)
+        self.index_file = self.articles_file + wikitools.INDEX_SUFFIX
+        self.manifest_file = os.path.join(folder, MANIFEST_FILE)
+        self.changes_file = os.path.join(folder, CHANGES_FILE)
+        self.report_file = os.path.join(folder, REPORT_FILE)
+        os.makedirs(folder, exist_ok=True)
+
+    def pages(self, fname, index_fname=None):
+        if index_fname is not None:
+            return wikitools.extract_pages_multistream(
+                fname, index_fname, self.filter_namespaces, processes=self.processes
+            )
+        return wikitools.extract_pages(bz2.BZ2File(fname), self.filter_namespaces)
+
+    def previous(self, rebuild):
+        """
+        The manifest and the index entries (pageid -> (title, offset, length)) of the previous update.
+        """
+        if rebuild or not (os.path.exists(self.articles_file) and os.path.exists(self.index_file)):
+            return {}, {}
+        entries = {
+            pageid: (title, offset, length)
+            for pageid, title, offset, length in wikitools.read_article_index(self.index_file)
+        }
+        return read_manifest(self.manifest_file), entries
+
+    def update(self, fname, index_fname=None, rebuild=False):
+        """
+        Update the folder with a new dump. The new files are written next to the current ones and replace them
+        when the update is complete, an interrupted update leaves the previous state intact.
+
+        Args:
+            :fname (str): the dump (\\*pages-articles.xml.bz2 or a multistream dump)
+
+        Kwargs:
+            :index_fname (str, default=None): the index of a multistream dump
+            :rebuild (boolean, default=False): process all pages (e.g. after changing the item modifier)
+
+        Returns:
+            :dict: the report (counts of new, changed, unchanged and deleted pages, and of the pages skipped as
+                their page id occurs before in the dump)
+        """
+        start_time = time.time()
+        manifest, entries = self.previous(rebuild)
+        counts = {"new": 0, "changed": 0, "unchanged": 0, "deleted": 0, "duplicates": 0}
+        seen = set()
+        hashes = {}
+        index = []
+        tmp = dict(
+            (name, name + TMP_SUFFIX)
+            for name in (self.articles_file, self.manifest_file, self.changes_file, self.report_file)
+        )
+
+        def tasks(f_changes):
+            # unchanged pages are passed with text None to keep the order of the dump
+            pages = iter(self.pages(fname, index_fname))
+            while True:
+                chunk = []
+                for title, text, pageid in pages:
+                    if pageid in seen:
+                        # only the first page of an id is kept
+                        counts["duplicates"] += 1
+                        logger.warning("skipping page '%s', the page id %s occurs more than once" % (title, pageid))
+                        continue
+                    h = page_hash(title, text)
+                    hashes[pageid] = h
+                    seen.add(pageid)
+                    if pageid not in manifest:
+                        status = "new"
+                    elif manifest[pageid][0] != h or (not manifest[pageid][1] and pageid not in entries):
+                        status = "changed"
+                    else:
+                        status = "unchanged"
+                        text = None
+                    counts[status] += 1
+                    if status != "unchanged":
+                        f_changes.write("%s\t%s\t%s\n" % (status, pageid, title))
+                    chunk.append((title, text, pageid))
+                    if len(chunk) >= self.chunksize:
+                        break
+                if not chunk:
+                    return
+                yield chunk
+
+        old = open(self.articles_file, "rb") if entries else None
+        try:
+            with open(tmp[self.articles_file], "wb") as f_articles, \
+                    open(tmp[self.manifest_file], "w", encoding="utf-8") as f_manifest, \
+                    open(tmp[self.changes_file], "w", encoding="utf-8") as f_changes:
+                results = wikitools.iterate_tasks(
+                    process_pages, tasks(f_changes), self.processes,
+                    mp_context=wikitools.fork_context(), initializer=wikitools.init_tokenize_worker,
+                    initargs=(self.item_modifier,)
+                )
+                for pageid, title, processed, text in itertools.chain.from_iterable(results):
+                    # an unchanged page without article was dropped by the item modifier before
+                    dropped = text is None and (processed or pageid not in entries)
+                    f_manifest.write("%s\t%s%s\n" % (pageid, hashes.pop(pageid), "\t" + DROPPED if dropped else ""))
+                    if dropped:
+                        continue
+                    if not processed:
+                        _, offset, length = entries[pageid]
+                        old.seek(offset)
+                        article = old.read(length)
+                    else:
+                        article = wikitools.format_article(pageid, title, text).encode("utf-8")
+                    index.append((pageid, title, f_articles.tell(), len(article)))
+                    f_articles.write(article)
+                for pageid in manifest:
+                    if pageid not in seen:
+                        counts["deleted"] += 1
+                        f_changes.write("deleted\t%s\t%s\n" % (pageid, entries.get(pageid, ("",))[0]))
+        finally:
+            if old is not None:
+                old.close()
+        report = dict(counts, dump=fname, processed=counts["new"] + counts["changed"],
+                      seconds=round(time.time() - start_time, 1))
+        with open(tmp[self.report_file], "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        wikitools.write_article_index(self.index_file + TMP_SUFFIX, index)
+        # the manifest is replaced after the articles: if the update is interrupted in between, the pages
+        # changed since the previous manifest are processed again instead of reusing outdated articles
+        os.replace(tmp[self.articles_file], self.articles_file)
+        os.replace(self.index_file + TMP_SUFFIX, self.index_file)
+        for name in (self.manifest_file, self.changes_file, self.report_file):
+            os.replace(tmp[name], name)
+        logger.info("updated %s from %s: %s" % (self.folder, fname, report))
+        return report
+
+    def changes(self, status=None):
+        """
+        The changes (status, pageid, title) of the last update, optionally only those with the given `status`.
+        """
+        with open(self.changes_file, encoding="utf-8") as f:
+            for line in f:
+                change = tuple(line.rstrip("\n").split("\t"))
+                if status is None or change[0] == status:
+                    yield change
+
+    def report(self):
+        with open(self.report_file, encoding="utf-8") as f:
+            return json.load(f)
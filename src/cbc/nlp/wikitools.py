@@ -10,10 +10,19 @@ The parts extracting the (very big) wiki source files are taken from the
 gensim code (but had to be modified).
 """
 
+import bisect
 import bz2
+import itertools
+import json
+import locale
 import logging
 import multiprocessing
+import os
 import re
+import xml.etree.ElementTree as eT
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from xml.etree.cElementTree import iterparse  # LXML isn't faster, so let's go with the built-in solution
 
 import cbc.pipeline as tkns
@@ -22,7 +31,6 @@ from gensim import utils
 from gensim.corpora.dictionary import Dictionary
 from gensim.corpora.textcorpus import TextCorpus
 
-import codecs
 
 logger = logging.getLogger('de.cbc.nlp.wikitools')
 
@@ -47,17 +55,26 @@ RE_P14 = re.compile(r'\[\[Category:[^][]*\]\]', re.UNICODE)  # categories
 # Remove File and Image template
 RE_P15 = re.compile(r'\[\[([fF]ile:|[iI]mage)[^]]*(\]\])', re.UNICODE)
 
+DEFAULT_MARKUP_ENGINE = "regex"
+"""
+The engine removing the markup in `filter_wiki`, see `MARKUP_ENGINES` ("single_pass" is faster)
+"""
 
-def filter_wiki(raw):
+
+def filter_wiki(raw, markup_engine=None):
     """
     Filter out wiki mark-up from `raw`, leaving only text. `raw` is either unicode
     or utf-8 encoded string.
+
+    Kwargs:
+        :markup_engine (str, default=None): "single_pass" (`strip_markup`) or "regex" (`remove_markup`),
+            if None `DEFAULT_MARKUP_ENGINE`
     """
     # parsing of the wiki markup is not perfect, but sufficient for our purposes
     # contributions to improving this code are welcome :)
     text = utils.to_unicode(raw, 'utf8', errors='ignore')
     text = utils.decode_htmlentities(text)  # '&amp;nbsp;' --> '\xa0'
-    return remove_markup(text)
+    return MARKUP_ENGINES[markup_engine or DEFAULT_MARKUP_ENGINE](text)
 
 
 def remove_markup(text):
@@ -148,6 +165,231 @@ def remove_file(s):
     return s
 
 
+RE_SPECIAL = re.compile(r"\{\{|\[\[|\]\]|<|\[|\]|\|\||\||\n")  # tokens of the single pass markup stripper
+RE_TEMPLATE_BOUND = re.compile(r"{{|}}")
+RE_TAG_WITH_CONTENT = re.compile(r"<(ref|nowiki|math)[> ]")
+RE_TAG_CONTENT_END = {
+    "ref": re.compile(r"</ref>|/>"),
+    "nowiki": re.compile(r"</nowiki>|/>"),
+    "math": re.compile(r"</math>|/>")
+}
+RE_EXTERNAL_LINK = re.compile(r"\[\w+://")
+RE_FILE_LINK = re.compile(r"\[\[([fF]ile:|[iI]mage)")  # as RE_P15
+RE_FILE_LINK_OR_TEMPLATE = re.compile(r"{{|\[\[([fF]ile:|[iI]mage)")
+RE_FILE_LINK_END = re.compile(r"{{|\]")
+RE_LANGUAGE_LINK = re.compile(r"\[\[[a-z][a-z][\w-]*:[^:\]]+\]\]")
+MAX_LINK_DEPTH = 20
+TABLE_FORMAT_LINE_STARTS = ("{|", "|}", "|-")
+TABLE_CELL_LINE_STARTS = ("|", "!")
+
+
+def remove_language_links(text):
+    """
+    Remove the links to other languages at the end of an article (as RE_P2, scanning the lines from the end).
+    As with RE_P2 (`$`) the links may be followed by at most one newline.
+    """
+    stripped = text.rstrip("\n")
+    newlines = text[len(stripped):]
+    if len(newlines) > 1:
+        return text
+    end = len(stripped)
+    while True:
+        start = stripped.rfind("\n", 0, end)
+        if start < 0 or not RE_LANGUAGE_LINK.fullmatch(stripped, start + 1, end):
+            return stripped[:end] + newlines
+        end = start
+
+
+def _skip_template(s, pos):
+    """
+    The position after the template starting before `pos` (templates are nested), the end of `s` if it is not closed.
+    """
+    depth = 1
+    for m in RE_TEMPLATE_BOUND.finditer(s, pos):
+        depth += 1 if m.group() == "{{" else -1
+        if depth == 0:
+            return m.end()
+    return len(s)
+
+
+def _skip_tag(s, start):
+    """
+    The position after the html tag (comment, or tag with content like <ref>) starting at `start`,
+    None if there is no tag.
+    """
+    if s.startswith("<!--", start):
+        end = s.find("-->", start + 4)
+        if end >= 0:
+            return end + 3
+    m = RE_TAG_WITH_CONTENT.match(s, start)
+    if m is not None:
+        end = RE_TAG_CONTENT_END[m.group(1)].search(s, m.end() - 1)
+        if end is not None:
+            return end.end()
+    end = s.find(">", start + 1)
+    return end + 1 if end >= 0 else None
+
+
+def _file_caption(s, pos):
+    """
+    The caption of the file link starting at `pos` (as `remove_file`: the text after the last "|" before the first
+    "]]", without templates) and the position after the link, None if the link is not closed by "]]".
+    """
+    chunks = []
+    while True:
+        m = RE_FILE_LINK_END.search(s, pos)
+        if m is None:
+            return None
+        chunks.append(s[pos:m.start()])
+        if m.group() == "{{":
+            pos = _skip_template(s, m.end())
+        elif s.startswith("]]", m.start()):
+            content = "".join(chunks)
+            return content[content.rfind("|") + 1:], m.start() + 2
+        else:
+            return None
+
+
+def remove_file_links(text):
+    """
+    Replace the 'File:' and 'Image:' links outside of templates by their caption (as `remove_file` after
+    `remove_template`).
+    """
+    if RE_FILE_LINK.search(text) is None:
+        return text
+    chunks = []
+    pos = scan = 0
+    while True:
+        m = RE_FILE_LINK_OR_TEMPLATE.search(text, scan)
+        if m is None:
+            break
+        if m.group() == "{{":
+            scan = _skip_template(text, m.end())
+            continue
+        file_link = _file_caption(text, m.start())
+        if file_link is None:
+            scan = m.end()
+            continue
+        chunks.append(text[pos:m.start()])
+        chunks.append(file_link[0])
+        pos = scan = file_link[1]
+    chunks.append(text[pos:])
+    return "".join(chunks)
+
+
+def _link_text(segments, closed, bracketed):
+    texts = ["".join(segment) for segment in segments]
+    # as RE_P6 the description is only kept if there are no brackets left in the link
+    if not closed or bracketed:
+        return "|".join(texts)
+    if texts[0].strip().startswith("Category:"):
+        return ""
+    return texts[-1]
+
+
+def _strip(s, pos, in_link, depth):
+    """
+    Scan `s` from `pos`. Returns (segments, position, closed, bracketed): the output chunks of the segments
+    (separated by "|" within links), the position after the scanned part, whether a link was closed by "]]" and
+    whether brackets are left in the text by `remove_markup` (of nested links, single brackets).
+    """
+    segments = [[]]
+    out = segments[0]
+    bracketed = False
+    cell_start = None  # index of the first output chunk of the current table cell
+    while True:
+        m = RE_SPECIAL.search(s, pos)
+        if m is None:
+            out.append(s[pos:])
+            return segments, len(s), False, bracketed
+        start = m.start()
+        token = m.group()
+        if start > pos:
+            out.append(s[pos:start])
+        pos = m.end()
+        if token == "{{":
+            pos = _skip_template(s, pos)
+        elif token == "[[":
+            if depth < MAX_LINK_DEPTH:
+                inner, pos, closed, inner_bracketed = _strip(s, pos, True, depth + 1)
+                text = _link_text(inner, closed, inner_bracketed)
+                out.append(text)
+                # the brackets of a nested link stay in the text, unless it is a category or empty
+                bracketed = bracketed or bool(text) or not closed
+            else:
+                bracketed = True
+        elif token == "]]":
+            if in_link:
+                return segments, pos, True, bracketed
+        elif token == "<":
+            end = _skip_tag(s, start)
+            if end is None:
+                out.append("<")
+            else:
+                pos = end
+        elif token == "[":
+            end = s.find("]", pos) if RE_EXTERNAL_LINK.match(s, start) else -1
+            if end >= 0:
+                # keep the description with its leading space (as RE_P5)
+                space = s.find(" ", pos, end)
+                if space >= 0:
+                    out.append(s[space:end])
+                pos = end + 1
+            else:
+                bracketed = True
+        elif token == "]":
+            bracketed = True
+        elif token == "|":
+            if in_link:
+                out = []
+                segments.append(out)
+            elif cell_start is not None:
+                del out[cell_start:]
+            else:
+                out.append("|")
+        elif token == "||":
+            if in_link:
+                segments.append([])
+                out = []
+                segments.append(out)
+            else:
+                out.append("\n")
+                cell_start = len(out)
+        elif token == "\n":
+            out.append("\n")
+            if not in_link:
+                cell_start = None
+                if s.startswith(TABLE_FORMAT_LINE_STARTS, pos):
+                    end = s.find("\n", pos)
+                    pos = end if end >= 0 else len(s)
+                elif s.startswith(TABLE_CELL_LINE_STARTS, pos):
+                    pos += 1
+                    cell_start = len(out)
+        # single "[", "]" and "]]" outside of links are dropped
+
+
+def strip_markup(text):
+    """
+    Remove wiki markup in a single pass over the text, an alternative to `remove_markup` (which applies
+    a cascade of regular expressions several times).
+
+    Removes templates (nested), comments, html tags (<ref>, <nowiki> and <math> with their content), categories,
+    links (keeping the description), urls (keeping the description), table markup (keeping the cell contents) and
+    the links to other languages at the end of the article. The files are replaced by their caption before the
+    pass (`remove_file_links`). Like `remove_markup` it keeps headings, bold and italic markup and the
+    "Kategorie:" links of the German Wikipedia, and all parts of links with nested links.
+    """
+    text = remove_file_links(remove_language_links(text))
+    segments, _, _, _ = _strip(text, 0, False, 0)
+    return "".join(segments[0])
+
+
+MARKUP_ENGINES = {
+    "single_pass": strip_markup,
+    "regex": remove_markup
+}
+
+
 def tokenize(content):
     """
     Tokenize a piece of text from wikipedia. The input string `content` is assumed
@@ -173,9 +415,100 @@ def get_namespace(tag):
 _get_namespace = get_namespace
 
 
-def extract_pages(f, filter_namespaces=False):
+RE_REDIRECT = re.compile(r"^\s*#\s*(REDIRECT|WEITERLEITUNG)", re.IGNORECASE)
+RE_DISAMBIGUATION_TITLE = re.compile(r"\((Begriffsklärung|disambiguation)\)$", re.IGNORECASE)
+RE_DISAMBIGUATION_TEMPLATE = re.compile(r"{{\s*(Begriffsklärung|disambiguation|disambig|dab)\s*[|}]", re.IGNORECASE)
+
+
+class PageFilter:
+    """
+    Predicates on the raw fields of a page (namespace, redirect, title, raw text), applied by `extract_pages`
+    (and `extract_pages_multistream`, `WikiCorpus`) before the markup is filtered, so that no work is spent
+    on pages which are dropped anyway. The pages dropped are counted per reason in `counts`.
+
+    Kwargs:
+        :namespaces (tuple of str, default=('0',)): only pages of these namespaces are kept, None keeps all
+        :skip_redirects (boolean, default=True): drop redirects (by the <redirect> element or the text)
+        :skip_disambiguation (boolean, default=True): drop disambiguation pages (by the title or a template)
+        :exclude_titles (str or regex, default=None): drop pages with a matching title (`re.search`)
+        :min_length (int, default=0): drop pages with a shorter raw text (in characters)
+        :max_length (int, default=None): drop pages with a longer raw text (in characters)
+        :min_words (int, default=ARTICLE_MIN_WORDS): drop pages with less words in the raw text, as the markup
+            adds words this never drops a page with `min_words` words of text
+    """
+
+    REASONS = ("namespace", "redirect", "disambiguation", "title", "too_short", "too_long", "too_few_words")
+
+    def __init__(self,
+                 namespaces=('0',),
+                 skip_redirects=True,
+                 skip_disambiguation=True,
+                 exclude_titles=None,
+                 min_length=0,
+                 max_length=None,
+                 min_words=ARTICLE_MIN_WORDS
+                 ):
+        self.namespaces = namespaces
+        self.skip_redirects = skip_redirects
+        self.skip_disambiguation = skip_disambiguation
+        if isinstance(exclude_titles, str):
+            exclude_titles = re.compile(exclude_titles)
+        self.exclude_titles = exclude_titles
+        self.min_length = min_length
+        self.max_length = max_length
+        self.min_words = min_words
+        self.counts = dict.fromkeys(("kept",) + self.REASONS, 0)
+
+    def reason(self, title, text, ns, redirect=False):
+        """
+        The reason to drop a page, None if the page is kept.
+        """
+        if self.namespaces is not None and ns not in self.namespaces:
+            return "namespace"
+        if self.skip_redirects and (redirect or RE_REDIRECT.match(text)):
+            return "redirect"
+        if self.skip_disambiguation and (
+                RE_DISAMBIGUATION_TITLE.search(title) or RE_DISAMBIGUATION_TEMPLATE.search(text)
+        ):
+            return "disambiguation"
+        if self.exclude_titles is not None and self.exclude_titles.search(title):
+            return "title"
+        if len(text) < self.min_length:
+            return "too_short"
+        if self.max_length is not None and len(text) > self.max_length:
+            return "too_long"
+        if self.min_words and len(text.split(None, self.min_words)) < self.min_words:
+            return "too_few_words"
+        return None
+
+    def __call__(self, title, text, ns, redirect=False):
+        """
+        True if the page is kept, counts the page.
+        """
+        reason = self.reason(title or "", text or "", ns, redirect)
+        self.counts[reason or "kept"] += 1
+        return reason is None
+
+    def add_counts(self, counts):
+        for reason, n in counts.items():
+            self.counts[reason] += n
+
+    def report(self):
+        total = sum(self.counts.values())
+        return "kept %i of %i pages, dropped: %s" % (
+            self.counts["kept"], total,
+            ", ".join("%s=%i" % (reason, self.counts[reason]) for reason in self.REASONS if self.counts[reason])
+        )
+
+
+def extract_pages(f, filter_namespaces=False, page_filter=None):
     """
     Extract pages from MediaWiki database dump.
+
+    Kwargs:
+        :filter_namespaces (tuple of str, default=False): pages of other namespaces are returned with empty text
+        :page_filter (PageFilter, default=None): pages dropped by the filter are not returned
+
     Returns
     -------
     pages : iterable over (str, str)
@@ -195,6 +528,7 @@ def extract_pages(f, filter_namespaces=False):
     title_path = "./{%(ns)s}title" % ns_mapping
     ns_path = "./{%(ns)s}ns" % ns_mapping
     pageid_path = "./{%(ns)s}id" % ns_mapping
+    redirect_path = "./{%(ns)s}redirect" % ns_mapping
 
     for elem in elems:
         if elem.tag == page_tag:
@@ -202,6 +536,9 @@ def extract_pages(f, filter_namespaces=False):
             text = elem.find(text_path).text
 
             ns = elem.find(ns_path).text
+            if page_filter is not None and not page_filter(title, text, ns, elem.find(redirect_path) is not None):
+                elem.clear()
+                continue
             if filter_namespaces and ns not in filter_namespaces:
                 text = None
 
@@ -221,6 +558,163 @@ def extract_pages(f, filter_namespaces=False):
 _extract_pages = extract_pages  # for backward compatibility
 
 
+def read_multistream_index(index_fname):
+    """
+    Read the index of a multistream dump (`*-multistream-index.txt.bz2`, lines "offset:pageid:title").
+
+    Returns:
+        :list of int: the sorted start offsets of the bz2 streams containing pages
+    """
+    opener = bz2.open if str(index_fname).endswith(".bz2") else open
+    offsets = set()
+    with opener(index_fname, "rt", encoding="utf-8") as f:
+        for line in f:
+            offset, _, _ = line.partition(":")
+            if offset:
+                offsets.add(int(offset))
+    return sorted(offsets)
+
+
+def multistream_ranges(fname, offsets, streams_per_task=1):
+    """
+    The byte ranges (start, end) of the dump `fname` read by one task, each range contains
+    `streams_per_task` streams (the last range extends to the end of the file).
+    """
+    size = os.path.getsize(fname)
+    bounds = offsets[::streams_per_task] + [size]
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+
+def parse_multistream_pages(data, filter_namespaces=False, page_filter=None):
+    """
+    Parse the pages of decompressed streams of a multistream dump, returns a list of (title, text, pageid)
+    as `extract_pages`. Within the streams the elements have no namespace (it is declared by the root
+    element in the first stream).
+    """
+    start = data.find(b"<page>")
+    end = data.rfind(b"</page>")
+    if start < 0 or end < 0:
+        return []
+    root = eT.fromstring(b"<pages>" + data[start:end + len(b"</page>")] + b"</pages>")
+    result = []
+    for elem in root.iterfind("page"):
+        text = elem.findtext("revision/text")
+        if page_filter is not None and not page_filter(
+                elem.findtext("title"), text, elem.findtext("ns"), elem.find("redirect") is not None
+        ):
+            continue
+        if filter_namespaces and elem.findtext("ns") not in filter_namespaces:
+            text = None
+        result.append((elem.findtext("title"), text or "", elem.findtext("id")))
+    return result
+
+
+def read_multistream_range(args):
+    """
+    Decompress and parse a byte range of a multistream dump (in a worker process).
+
+    Args:
+        :args (tuple): (fname, start, end, filter_namespaces, process_function, page_filter), `process_function`
+            is applied to each (title, text, pageid) if not None
+
+    Returns:
+        :(list, dict): the (processed) pages of the range, the counts of the page filter (None without filter)
+    """
+    fname, start, end, filter_namespaces, process_function, page_filter = args
+    if page_filter is not None:
+        # a copy of the filter of the parent, which sums up the counts of all tasks
+        page_filter.counts = dict.fromkeys(page_filter.counts, 0)
+    with open(fname, "rb") as f:
+        f.seek(start)
+        compressed = f.read(end - start)
+    pages = parse_multistream_pages(bz2.decompress(compressed), filter_namespaces, page_filter)
+    if process_function is not None:
+        pages = [process_function(p) for p in pages]
+    return pages, page_filter.counts if page_filter is not None else None
+
+
+END_OF_TASKS = object()
+
+
+def iterate_tasks(function, tasks, processes, ordered=True, max_pending=None, mp_context=None, initializer=None,
+                  initargs=()):
+    """
+    Apply `function` to all `tasks` in `processes` worker processes, yield the results in the order of the
+    tasks (`ordered`) or of their completion. At most `max_pending` (default 2 * processes) tasks are
+    submitted at once, so that results do not pile up if the consumer is slow. The tasks not started are
+    cancelled when the iteration ends or is abandoned, the workers exit after their current task.
+    """
+    if max_pending is None:
+        max_pending = 2 * processes
+    executor = ProcessPoolExecutor(max_workers=processes, mp_context=mp_context, initializer=initializer,
+                                   initargs=initargs)
+    try:
+        tasks = iter(tasks)
+        pending = deque()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                task = next(tasks, END_OF_TASKS)
+                if task is END_OF_TASKS:
+                    exhausted = True
+                else:
+                    pending.append(executor.submit(function, task))
+            if not pending:
+                break
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_pages_multistream(fname, index_fname, filter_namespaces=False, processes=None, ordered=True,
+                              process_function=None, streams_per_task=1, max_pending=None, mp_context=None,
+                              initializer=None, initargs=(), page_filter=None):
+    """
+    Extract pages from a multistream dump (`*-pages-articles-multistream.xml.bz2`) using its index. The bz2
+    streams (of 100 pages each) are decompressed and parsed in parallel by worker processes.
+
+    Args:
+        :fname (str): the multistream dump
+        :index_fname (str): its index (`*-multistream-index.txt.bz2`)
+
+    Kwargs:
+        :filter_namespaces (tuple of str, default=False): pages of other namespaces are returned with empty text
+        :processes (int, default=None): number of worker processes, if None the number of cpus - 1
+        :ordered (boolean, default=True): yield the pages in the order of the dump, otherwise in the order
+            in which the streams are finished
+        :process_function (function, default=None): a (picklable) function applied to each (title, text, pageid)
+            within the workers, e.g. `process_article`
+        :streams_per_task (int, default=1): number of streams decompressed by one task
+        :max_pending (int, default=None): maximal number of tasks submitted at once, see `iterate_tasks`
+        :mp_context, initializer, initargs: passed to the `ProcessPoolExecutor` of the workers
+        :page_filter (PageFilter, default=None): pages dropped by the filter are not returned, the filter is
+            applied within the workers, its counts are summed up in `page_filter`
+
+    Returns:
+        iterable over (title, text, pageid), or the results of `process_function`
+    """
+    if processes is None:
+        processes = max(1, multiprocessing.cpu_count() - 1)
+    offsets = read_multistream_index(index_fname)
+    tasks = (
+        (fname, start, end, filter_namespaces, process_function, page_filter)
+        for start, end in multistream_ranges(fname, offsets, streams_per_task)
+    )
+    for pages, counts in iterate_tasks(read_multistream_range, tasks, processes, ordered=ordered,
+                                       max_pending=max_pending, mp_context=mp_context, initializer=initializer,
+                                       initargs=initargs):
+        if counts is not None:
+            page_filter.add_counts(counts)
+        for page in pages:
+            yield page
+
+
 def process_article(args):
     """
     Parse a wikipedia article, returning its content as a list of tokens
@@ -231,22 +725,90 @@ def process_article(args):
     return text, title, pageid
 
 
+def process_page(page):
+    """
+    `process_article` for a page (title, text, pageid) as yielded by `extract_pages`.
+    """
+    title, text, pageid = page
+    return process_article((text, title, pageid))
+
+
+def process_pages(pages):
+    return [process_page(page) for page in pages]
+
+
+_worker_item_modifier = None
+"""
+The item modifier of a worker process of `WikiCorpus.get_tagged_tokens`, set by `init_tokenize_worker`
+"""
+
+
+def init_tokenize_worker(item_modifier):
+    global _worker_item_modifier
+    _worker_item_modifier = item_modifier
+
+
+def tokenize_page(page):
+    """
+    Filter the markup of a page (title, text, pageid) and apply the item modifier of the worker process.
+
+    Returns:
+        :(tokens, [pageid, title]): None if the page has no text or the item modifier drops it
+    """
+    title, text, pageid = page
+    if not text:
+        return None
+    tokens = _worker_item_modifier(filter_wiki(text))
+    if tokens is None:
+        return None
+    return tokens, [pageid, title]
+
+
+def tokenize_pages(pages):
+    return [page for page in map(tokenize_page, pages) if page is not None]
+
+
+def fork_context():
+    """
+    The "fork" multiprocessing context if the platform supports it, otherwise None (the default context).
+    Forked workers inherit their initializer arguments, which need not be picklable then.
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
 class WikiCorpus(TextCorpus):
     """
     Treat a wikipedia articles dump (\\*articles.xml.bz2) as a (read-only) corpus.
     The documents are extracted on-the-fly, so that the whole (massive) dump
     can stay compressed on disk.
+
+    For a multistream dump (\\*pages-articles-multistream.xml.bz2) with its index (`index_fname`) the
+    streams are decompressed, parsed and filtered in parallel by the worker processes, see
+    `extract_pages_multistream`.
     """
 
-    def __init__(self, fname, processes=None, dictionary=None, filter_namespaces=('0',)):
+    def __init__(self, fname, processes=None, dictionary=None, filter_namespaces=('0',), index_fname=None,
+                 ordered=True, page_filter=None):
         """
         Initialize the corpus. Unless a dictionary is provided, this scans the
         corpus once, to determine its vocabulary.
         If `pattern` package is installed, use fancier shallow parsing to get
         token lemmas. Otherwise, use simple regexp tokenization. You can override
         this automatic logic by forcing the `lemmatize` parameter explicitly.
+
+        Kwargs:
+            :index_fname (str, default=None): the index of a multistream dump `fname`
+            :ordered (boolean, default=True): for multistream dumps: yield the articles in the order of the dump,
+                otherwise in the order they are processed
+            :page_filter (PageFilter, default=None): drops pages (e.g. redirects and stubs) before their markup is
+                filtered, see `PageFilter`
         """
         self.fname = fname
+        self.index_fname = index_fname
+        self.ordered = ordered
+        self.page_filter = page_filter
         self.filter_namespaces = filter_namespaces
         self.metadata = False
         if processes is None:
@@ -269,27 +831,112 @@ class WikiCorpus(TextCorpus):
         >>>	 print(vec)
         """
         articles, articles_all = 0, 0
-        texts = ((text, title, pageid) for title, text, pageid in
-                 extract_pages(bz2.BZ2File(self.fname), self.filter_namespaces))
-        pool = multiprocessing.Pool(self.processes)
-        # process the corpus in smaller chunks of docs, because multiprocessing.Pool
-        # is dumb and would load the entire input into RAM at once...
-        ignore_namespaces = 'Wikipedia Category File Portal Template MediaWiki User Help Book Draft'.split()
-        for group in utils.chunkize(texts, chunksize=10 * self.processes, maxsize=1):
-            for text, title, pageid in pool.imap(process_article, group):  # chunksize=10):
+        if self.index_fname is not None:
+            for text, title, pageid in extract_pages_multistream(
+                    self.fname, self.index_fname, self.filter_namespaces, processes=self.processes,
+                    ordered=self.ordered, process_function=process_page, page_filter=self.page_filter
+            ):
+                articles += 1
+                yield text, title, pageid
+            self.length = articles
+            self.log_page_filter()
+            return
+        pages = extract_pages(bz2.BZ2File(self.fname), self.filter_namespaces, self.page_filter)
+        # the pages are parsed (and filtered by the page filter) in this process, in chunks of 10 pages
+        # while the workers filter the markup of the chunks submitted before
+        chunks = iter(lambda: list(itertools.islice(pages, 10)), [])
+        for group in iterate_tasks(process_pages, chunks, self.processes):
+            for text, title, pageid in group:
                 articles_all += 1
                 # article redirects and short stubs are pruned here
                 articles += 1
                 yield text, title, pageid
-        pool.terminate()
 
         # logger.info("finished iterating over Wikipedia corpus of %i documents (all : %i)" % (articles, articles_all))
         self.length = articles  # cache corpus length
+        self.log_page_filter()
+
+    def log_page_filter(self):
+        if self.page_filter is not None:
+            logger.info("%s: %s" % (self.fname, self.page_filter.report()))
+
+    def get_tagged_tokens(self, item_modifier, chunksize=10, max_pending=None):
+        """
+        Iterate over the dump, returning the tagged items (tokens, [pageid, title]) of the articles.
+
+        Markup filtering and `item_modifier` (e.g. `LemmaTokenizeText()` or a composition of modifiers) both
+        run in the worker processes, the parent only reads the dump (or, for multistream dumps, only collects
+        the results). Pages without text and pages for which `item_modifier` returns None are skipped.
+        The workers are forked where possible, so `item_modifier` (e.g. holding a spacy model) is not pickled.
+        At most `max_pending` tasks are in flight, the workers are terminated when the iteration ends or
+        is abandoned.
+
+        Args:
+            :item_modifier (ItemModifier): applied to the filtered text of each article
+
+        Kwargs:
+            :chunksize (int, default=10): number of articles per task (for dumps without index)
+            :max_pending (int, default=None): maximal number of tasks in flight, if None 2 * processes
+        """
+        articles = 0
+        kwargs = dict(max_pending=max_pending, mp_context=fork_context(), initializer=init_tokenize_worker,
+                      initargs=(item_modifier,))
+        if self.index_fname is not None:
+            results = (
+                item for item in extract_pages_multistream(
+                    self.fname, self.index_fname, self.filter_namespaces, processes=self.processes,
+                    ordered=self.ordered, process_function=tokenize_page, page_filter=self.page_filter, **kwargs
+                ) if item is not None
+            )
+        else:
+            pages = extract_pages(bz2.BZ2File(self.fname), self.filter_namespaces, self.page_filter)
+            chunks = iter(lambda: list(itertools.islice(pages, chunksize)), [])
+            results = (
+                item for items in iterate_tasks(tokenize_pages, chunks, self.processes, ordered=self.ordered, **kwargs)
+                for item in items
+            )
+        for item in results:
+            articles += 1
+            yield item
+        logger.info("finished tokenizing %i articles of %s" % (articles, self.fname))
+        self.log_page_filter()
 
 
 # endclass WikiCorpus
 
 
+class WikiTokenGenerator(tkns.BaseGenerator):
+    """
+    Tagged items (tokens, [pageid, title]) of the articles of a wiki dump, tokenized in parallel by
+    `WikiCorpus.get_tagged_tokens`.
+
+    Args:
+        :fname (str): the dump (\\*articles.xml.bz2 or \\*pages-articles-multistream.xml.bz2)
+        :item_modifier (ItemModifier): applied to the filtered text of each article within the workers
+
+    Kwargs:
+        :index_fname (str, default=None): the index of a multistream dump
+        :processes (int, default=None): number of worker processes, if None the number of cpus - 1
+        :filter_namespaces (tuple of str, default=('0',)): namespaces of the articles
+        :ordered (boolean, default=True): yield the articles in the order of the dump
+        :chunksize (int, default=10): number of articles per task (for dumps without index)
+        :max_pending (int, default=None): maximal number of tasks in flight
+    """
+
+    def __init__(self, fname, item_modifier, index_fname=None, processes=None, filter_namespaces=('0',),
+                 ordered=True, chunksize=10, max_pending=None):
+        self.corpus = WikiCorpus(fname, processes=processes, dictionary={}, filter_namespaces=filter_namespaces,
+                                 index_fname=index_fname, ordered=ordered)
+        self.itemModifier = item_modifier
+        self.chunksize = chunksize
+        self.maxPending = max_pending
+        super(WikiTokenGenerator, self).__init__(is_tagged=True)
+
+    def __call__(self):
+        for item in self.corpus.get_tagged_tokens(self.itemModifier, self.chunksize, self.maxPending):
+            yield item
+
+
 RE_START_ARTICLE = re.compile("^===== START")
 RE_END_ARTICLE = re.compile("^===== END")
 RE_ARTICLE_BOUND = re.compile("^=====")
@@ -297,6 +944,11 @@ RE_START_PARAGRAPH = re.compile("^=====")
 RE_IGNORE_LINE = re.compile(r"^(\*| |;|:|==|#|Kategorie\:)|^\s*[\d\w]{1,5}$")
 REPLACE_SPACE_CHARS = re.compile(r">|-|/|,")
 RE_REPLACE_DOUBLE_CR = re.compile(r"[ \t]*\n[ \t]*\n\s*")
+RE_START_LINE = re.compile(r"^===== START (\S+) : ?(.*)$")
+INDEX_SUFFIX = ".idx"
+RANGE_SIZE = 2 ** 24
+TEXT_SHARDS_FORMAT_NAME = "cbc-wiki-text-shards"
+TEXT_SHARDS_FORMAT_VERSION = 1
 MIN_TOKENS = 15
 MIN_LENGTH_LINE = 20
 
@@ -310,6 +962,29 @@ def ignore_line(line):
 
 
 class WikiFromTextIterator(tkns.BaseGenerator):
+    """
+    Articles of a text file in the format written by `wiki_to_simple_text`:
+
+    ::
+
+        ===== START <pageid> : <title>
+        <text>
+        ===== END <pageid>
+
+    The file is read as bytes, so that the byte offsets of the articles are known. With `index_file` a sidecar
+    index (pageid, title, byte offset, length) is written by the first complete pass (if it does not exist yet)
+    and used for random access (`get_article`) and for splitting the file into shards (`shards`) which can be
+    read concurrently, e.g. by `iterate_wiki_text_parallel`.
+
+    Args:
+        :input_file (str): the text file
+
+    Kwargs:
+        :index_file (str, default=None): the sidecar index, e.g. `input_file + INDEX_SUFFIX`
+        :byte_range (tuple, default=None): (start, end) only read the articles starting within this byte range
+            of the file (`end` None for the end of the file), see `shards`
+    """
+
     def __init__(self,
                  input_file,
                  log_freq=1000,
@@ -318,7 +993,9 @@ class WikiFromTextIterator(tkns.BaseGenerator):
                  re_start_article=RE_START_ARTICLE,
                  re_end_article=RE_END_ARTICLE,
                  re_ignore_line=RE_IGNORE_LINE,
-                 input_encoding='utf-8'
+                 input_encoding='utf-8',
+                 index_file=None,
+                 byte_range=None
                  ):
         self.inputFile = input_file
         self.logFreq = log_freq
@@ -328,68 +1005,424 @@ class WikiFromTextIterator(tkns.BaseGenerator):
         self.reEndArticle = re_end_article
         self.reIgnoreLine = re_ignore_line
         self.inputEncoding = input_encoding
+        self.indexFile = index_file
+        self.byteRange = byte_range
+        # one match per line tells start, end or neither
+        self.reArticleBound = re.compile(
+            "(?P<start>%s)|(?P<end>%s)" % (re_start_article.pattern, re_end_article.pattern),
+            re_start_article.flags
+        )
+        self.index = None
+        self.entries = None
         super(WikiFromTextIterator, self).__init__()
 
-    def __call__(self):
-        try:
-            if self.inputEncoding is None:
-                f = codecs.open(self.inputFile, 'r')
-            else:
-                f = codecs.open(self.inputFile, 'r', self.inputEncoding)
-            n_lines = 0
-            n_parsed_articles = 0
-            n_output_articles = 0
-            article_text = ""
-            article_start_line = ""
-            lines_in_article = 0
-            for line in f:
+    def encoding(self):
+        return self.inputEncoding if self.inputEncoding is not None else locale.getpreferredencoding(False)
+
+    def read_articles(self, f, start=0, end=None):
+        """
+        Split the file `f` (opened in binary mode) into articles.
+
+        Yields:
+            :(start_line, lines, n_lines, offset, length): the start line of an article, its lines which are not
+                ignored, the number of all its lines, its byte offset and its length in bytes (including the
+                start and end lines)
+        """
+        encoding = self.encoding()
+        f.seek(start)
+        offset = start
+        article_offset = start
+        start_line = ""
+        lines = []
+        n_lines = 0
+        in_article = False
+        for raw in f:
+            if end is not None and offset >= end and not in_article:
+                return
+            line = raw.decode(encoding)
+            line_offset = offset
+            offset += len(raw)
+            bound = self.reArticleBound.match(line)
+            if bound is None:
                 n_lines += 1
-                is_start_article = self.reStartArticle.match(line) is not None
-                is_end_article = self.reEndArticle.match(line) is not None
-                is_ignore_line = self.reIgnoreLine.match(line) is not None
-                if not is_ignore_line and not is_start_article:
-                    article_text = article_text + line
-                if is_end_article:
-                    article_text = article_text.strip()
-                    if lines_in_article > 0:
-                        n_parsed_articles += 1
-                        article_text = RE_REPLACE_DOUBLE_CR.sub("\n\n", article_text)
-                        if len(article_text) >= self.minTextLength:
-                            if n_output_articles % self.logFreq == 0:
-                                logger.debug(
-                                    "lines read= %i, parsed articles= %i, "
-                                    "output articles= %i, article start line:%s" %
-                                    (n_lines, n_parsed_articles, n_output_articles+1, article_start_line)
-                                )
-                            if n_output_articles % self.outputFreq == 0:
-                                yield article_text
-                            n_output_articles += 1
-                    lines_in_article = 0
-                else:
-                    lines_in_article += 1
-                if is_start_article:
-                    lines_in_article = 0
-                    article_start_line = line.strip()
-                    if is_ignore_line:
-                        article_text = ""
-                    else:
-                        article_text = line
-            if lines_in_article > 0:
-                article_text = article_text.strip()
+                if self.reIgnoreLine.match(line) is None:
+                    lines.append(line)
+            elif bound.lastgroup == "start":
+                start_line = line.strip()
+                article_offset = line_offset
+                lines = [] if self.reIgnoreLine.match(line) is not None else [line]
+                n_lines = 0
+                in_article = True
+            else:
+                yield start_line, lines, n_lines, article_offset, offset - article_offset
+                start_line = ""
+                article_offset = offset
+                lines = []
+                n_lines = 0
+                in_article = False
+        if n_lines > 0:
+            yield start_line, lines, n_lines, article_offset, offset - article_offset
+
+    def article_text(self, lines):
+        return RE_REPLACE_DOUBLE_CR.sub("\n\n", "".join(lines).strip())
+
+    def __call__(self):
+        start, end = self.byteRange if self.byteRange is not None else (0, None)
+        build_index = (
+            self.indexFile is not None and self.byteRange is None and not os.path.exists(self.indexFile)
+        )
+        index = []
+        n_parsed_articles = 0
+        n_output_articles = 0
+        with open(self.inputFile, 'rb') as f:
+            for start_line, lines, n_lines, offset, length in self.read_articles(f, start, end):
+                if build_index:
+                    m = RE_START_LINE.match(start_line)
+                    if m is not None:
+                        index.append((m.group(1), m.group(2), offset, length))
+                if n_lines == 0:
+                    continue
                 n_parsed_articles += 1
+                article_text = self.article_text(lines)
                 if len(article_text) >= self.minTextLength:
-                    yield article_text
-            logger.debug("ready input file %s: lines read= %i, parsed article= %i, output articles= %i" % (
-                self.inputFile, n_lines, n_parsed_articles, n_output_articles))
-        finally:
-            f.close()
+                    if n_output_articles % self.logFreq == 0:
+                        logger.debug(
+                            "parsed articles= %i, output articles= %i, article start line:%s" %
+                            (n_parsed_articles, n_output_articles + 1, start_line)
+                        )
+                    if n_output_articles % self.outputFreq == 0:
+                        yield article_text
+                    n_output_articles += 1
+        logger.debug("ready input file %s: parsed article= %i, output articles= %i" % (
+            self.inputFile, n_parsed_articles, n_output_articles))
+        if build_index:
+            write_article_index(self.indexFile, index)
+            self.index = index
+
+    def load_index(self):
+        """
+        The entries (pageid, title, offset, length) of the sidecar index, which is built by a complete pass
+        over the file if it does not exist yet.
+        """
+        if self.index is None:
+            if self.indexFile is None:
+                raise Exception("WikiFromTextIterator: no 'index_file' given")
+            if not os.path.exists(self.indexFile):
+                for _ in WikiFromTextIterator(self.inputFile, index_file=self.indexFile,
+                                              re_start_article=self.reStartArticle, re_end_article=self.reEndArticle,
+                                              input_encoding=self.inputEncoding):
+                    pass
+            self.index = read_article_index(self.indexFile)
+        return self.index
+
+    def get_article(self, pageid=None, title=None):
+        """
+        The text of the article with `pageid` (or `title`), using the sidecar index.
+        Raises KeyError if there is no such article.
+        """
+        if pageid is None and title is None:
+            raise ValueError("WikiFromTextIterator.get_article: 'pageid' or 'title' required")
+        if self.entries is None:
+            self.entries = {}
+            for entry in self.load_index():
+                self.entries[("pageid", entry[0])] = entry
+                self.entries.setdefault(("title", entry[1]), entry)
+        key = ("pageid", str(pageid)) if pageid is not None else ("title", title)
+        if key not in self.entries:
+            raise KeyError(key[1])
+        entry = self.entries[key]
+        with open(self.inputFile, 'rb') as f:
+            for _, lines, _, _, _ in self.read_articles(f, entry[2], entry[2] + entry[3]):
+                return self.article_text(lines)
+        return ""
+
+    def shard_ranges(self, n):
+        """
+        Split the file into (at most) `n` byte ranges of about the same size at article boundaries.
+        Without an index file the boundaries are found by seeking and scanning for the next start line.
+
+        Returns:
+            :list of (start, end): `end` is None for the last range
+        """
+        size = os.path.getsize(self.inputFile)
+        if self.indexFile is not None:
+            offsets = [entry[2] for entry in self.load_index()]
+            bounds = [0] + [
+                offsets[bisect.bisect_left(offsets, size * k // n)] for k in range(1, n)
+                if bisect.bisect_left(offsets, size * k // n) < len(offsets)
+            ]
+        else:
+            bounds = [0]
+            with open(self.inputFile, 'rb') as f:
+                for k in range(1, n):
+                    f.seek(size * k // n)
+                    offset = f.tell() + len(f.readline())
+                    for raw in iter(f.readline, b''):
+                        if self.reStartArticle.match(raw.decode(self.encoding(), errors='ignore')):
+                            bounds.append(offset)
+                            break
+                        offset += len(raw)
+        bounds = sorted(set(bounds))
+        return list(zip(bounds, bounds[1:] + [None]))
+
+    def shards(self, n):
+        """
+        `n` iterators over disjoint parts of the file (see `shard_ranges`), which together yield all articles.
+        """
+        return [
+            WikiFromTextIterator(
+                self.inputFile, log_freq=self.logFreq, output_freq=self.outputFreq,
+                min_text_length=self.minTextLength, re_start_article=self.reStartArticle,
+                re_end_article=self.reEndArticle, re_ignore_line=self.reIgnoreLine,
+                input_encoding=self.inputEncoding, index_file=self.indexFile, byte_range=byte_range
+            )
+            for byte_range in self.shard_ranges(n)
+        ]
+
+
+def write_article_index(index_file, index):
+    """
+    Write the entries (pageid, title, offset, length) of an article index as tab separated lines.
+    """
+    tmp_file = index_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for pageid, title, offset, length in index:
+            f.write("%s\t%s\t%i\t%i\n" % (pageid, title, offset, length))
+    os.replace(tmp_file, index_file)
+
+
+def read_article_index(index_file):
+    with open(index_file, encoding='utf-8') as f:
+        return [
+            (pageid, title, int(offset), int(length))
+            for pageid, title, offset, length in (line.rstrip("\n").split("\t") for line in f)
+        ]
+
+
+def read_text_range(args):
+    """
+    The articles of a byte range of a text file (in a worker process of `iterate_wiki_text_parallel`),
+    modified by the item modifier of the worker if there is one.
+    """
+    input_file, byte_range, kwargs = args
+    texts = WikiFromTextIterator(input_file, byte_range=byte_range, **kwargs)
+    if _worker_item_modifier is None:
+        return list(texts)
+    return [x for x in map(_worker_item_modifier, texts) if x is not None]
+
+
+def iterate_wiki_text_parallel(input_file, processes=None, range_size=RANGE_SIZE, item_modifier=None, ordered=True,
+                               index_file=None, **kwargs):
+    """
+    Read the articles of a text file (see `WikiFromTextIterator`) in parallel: the file is split into ranges of
+    about `range_size` bytes which are read (and modified by `item_modifier`) by worker processes.
+
+    Args:
+        :input_file (str or list of str): the text file, or the files of a sharded corpus (see `text_shards`)
+
+    Kwargs:
+        :processes (int, default=None): number of worker processes, if None the number of cpus - 1
+        :range_size (int, default=RANGE_SIZE): approximate size in bytes of the part of the file read by one task
+        :item_modifier (ItemModifier, default=None): applied to each article within the workers, articles for
+            which it returns None are dropped
+        :ordered (boolean, default=True): yield the articles in the order of the file
+        :index_file (str or list of str, default=None): the sidecar index of the file(s), used to split the file
+        :kwargs: further arguments of `WikiFromTextIterator`
+    """
+    if processes is None:
+        processes = max(1, multiprocessing.cpu_count() - 1)
+    if isinstance(input_file, str):
+        input_file, index_file = [input_file], [index_file]
+    elif index_file is None:
+        index_file = [None] * len(input_file)
+    tasks = (
+        (f, byte_range, kwargs)
+        for f, i in zip(input_file, index_file)
+        for byte_range in WikiFromTextIterator(f, index_file=i, **kwargs).shard_ranges(
+            max(1, -(-os.path.getsize(f) // range_size))
+        )
+    )
+    for texts in iterate_tasks(read_text_range, tasks, processes, ordered=ordered, mp_context=fork_context(),
+                               initializer=init_tokenize_worker, initargs=(item_modifier,)):
+        for text in texts:
+            yield text
+
+
+def format_article(pageid, title, text):
+    """
+    An article in the format read by `WikiFromTextIterator`.
+    """
+    return "===== START %s : %s\n%s\n===== END %s\n" % (pageid, title, text, pageid)
 
 
 def wiki_to_simple_text(input_filename, output_filename):
     wiki_corpus = WikiCorpus(input_filename)
-    file = open(output_filename, 'w')
-    for (text, title, pageid) in wiki_corpus.get_texts():
-        file.write("===== START %s : \n" % (pageid, title))
-        file.write(text)
-        file.write("\n===== END %s\n" % (pageid))
-    file.close
+    with open(output_filename, 'w', encoding='utf-8') as file:
+        for (text, title, pageid) in wiki_corpus.get_texts():
+            file.write(format_article(pageid, title, text))
+
+
+def text_shard_file(key, n):
+    return "%s.%05i.txt" % (key, n)
+
+
+def shard_articles(pages, shards, assignment):
+    """
+    Filter the markup of the pages (title, text, pageid) of a task and format them as articles grouped by their
+    shard (in a worker process of `wiki_to_simple_text_sharded`). With "round_robin" the articles are grouped
+    by their position within the task, the parent rotates the groups by the number of articles before the task.
+
+    Returns:
+        :list of (bytes, list): for each group the articles and their index entries (pageid, title, offset, length),
+            the offsets relative to the start of the group
+    """
+    groups = [([], []) for _ in range(shards)]
+    sizes = [0] * shards
+    for number, page in enumerate(pages):
+        text, title, pageid = process_page(page)
+        if assignment == "hash":
+            n = zlib.crc32(str(pageid).encode('utf-8')) % shards
+        else:
+            n = number % shards
+        article = format_article(pageid, title, text).encode('utf-8')
+        groups[n][0].append(article)
+        groups[n][1].append((pageid, title, sizes[n], len(article)))
+        sizes[n] += len(article)
+    return [(b"".join(articles), index) for articles, index in groups]
+
+
+def shard_pages(args):
+    """
+    `shard_articles` for a chunk of pages read by the parent (dumps without index).
+    """
+    pages, shards, assignment = args
+    return shard_articles(pages, shards, assignment), None
+
+
+def shard_multistream_range(args):
+    """
+    `shard_articles` for the pages of a byte range of a multistream dump, see `read_multistream_range`.
+    """
+    pages, counts = read_multistream_range(args[:6])
+    return shard_articles(pages, *args[6:]), counts
+
+
+def wiki_to_simple_text_sharded(input_filename, key, shards=8, assignment="hash", processes=None, index_fname=None,
+                                filter_namespaces=('0',), page_filter=None, chunksize=10):
+    """
+    `wiki_to_simple_text` writing the articles into `shards` files `<key>.<n>.txt`, each with its sidecar index
+    (see `WikiFromTextIterator`), and a manifest `<key>.json` with the number of articles and bytes of
+    each shard. The shards can be read concurrently (`text_shards`, `iterate_wiki_text_parallel`).
+
+    The worker processes filter the markup, format the articles and group them by shard, the parent only appends
+    the group of each shard of a task with one write (so that the shards are the same for any number of
+    processes). For a multistream dump with index the workers also decompress and parse the dump.
+
+    Args:
+        :input_filename (str): the dump
+        :key (str): the path of the files without suffix, e.g. "wiki/dewiki"
+
+    Kwargs:
+        :shards (int, default=8): number of output files
+        :assignment (str, default="hash"): "hash" assigns an article by the hash of its pageid (the shard of an
+            article is the same for all dumps), "round_robin" by its position (shards of equal size)
+        :processes (int, default=None): number of worker processes, if None the number of cpus - 1
+        :index_fname (str, default=None): the index of a multistream dump
+        :filter_namespaces (tuple of str, default=('0',)): pages of other namespaces are written with empty text
+        :page_filter (PageFilter, default=None): pages dropped by the filter are not written
+        :chunksize (int, default=10): number of pages per task (for dumps without index)
+
+    Returns:
+        :dict: the manifest
+    """
+    if assignment not in ("hash", "round_robin"):
+        raise Exception("wiki_to_simple_text_sharded: 'assignment' must be 'hash' or 'round_robin', not '%s'"
+                        % assignment)
+    if processes is None:
+        processes = max(1, multiprocessing.cpu_count() - 1)
+    if os.path.dirname(key):
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+    if index_fname is not None:
+        tasks = (
+            (input_filename, start, end, filter_namespaces, None, page_filter, shards, assignment)
+            for start, end in multistream_ranges(input_filename, read_multistream_index(index_fname))
+        )
+        results = iterate_tasks(shard_multistream_range, tasks, processes)
+    else:
+        pages = extract_pages(bz2.BZ2File(input_filename), filter_namespaces, page_filter)
+        tasks = ((chunk, shards, assignment) for chunk in iter(lambda: list(itertools.islice(pages, chunksize)), []))
+        results = iterate_tasks(shard_pages, tasks, processes)
+    files = [open(text_shard_file(key, n), 'wb') for n in range(shards)]
+    indices = [[] for _ in range(shards)]
+    number = 0
+    try:
+        for groups, counts in results:
+            if counts is not None:
+                page_filter.add_counts(counts)
+            for k, (data, index) in enumerate(groups):
+                n = (number + k) % shards if assignment == "round_robin" else k
+                offset = files[n].tell()
+                indices[n].extend((pageid, title, offset + o, length) for pageid, title, o, length in index)
+                files[n].write(data)
+            number += sum(len(index) for _, index in groups)
+    finally:
+        for f in files:
+            f.close()
+    if page_filter is not None:
+        logger.info("%s: %s" % (input_filename, page_filter.report()))
+    manifest = {
+        "format": TEXT_SHARDS_FORMAT_NAME,
+        "version": TEXT_SHARDS_FORMAT_VERSION,
+        "source": os.path.basename(input_filename),
+        "assignment": assignment,
+        "articles": number,
+        "bytes": 0,
+        "shards": []
+    }
+    for n, index in enumerate(indices):
+        shard_file = text_shard_file(key, n)
+        write_article_index(shard_file + INDEX_SUFFIX, index)
+        size = os.path.getsize(shard_file)
+        manifest["bytes"] += size
+        manifest["shards"].append({
+            "file": os.path.basename(shard_file),
+            "index": os.path.basename(shard_file) + INDEX_SUFFIX,
+            "articles": len(index),
+            "bytes": size
+        })
+    with open(key + ".json", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    logger.info("written %i articles (%i bytes) of %s into %i shards %s" % (
+        manifest["articles"], manifest["bytes"], input_filename, shards, key))
+    return manifest
+
+
+def text_shard_files(key):
+    """
+    The text files and their index files of a corpus written by `wiki_to_simple_text_sharded`.
+
+    Returns:
+        :(list of str, list of str): text files, index files
+    """
+    with open(key + ".json", encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format") != TEXT_SHARDS_FORMAT_NAME:
+        raise Exception("'%s.json' is not written by wiki_to_simple_text_sharded" % key)
+    folder = os.path.dirname(key)
+    return (
+        [os.path.join(folder, shard["file"]) for shard in manifest["shards"]],
+        [os.path.join(folder, shard["index"]) for shard in manifest["shards"]]
+    )
+
+
+def text_shards(key, **kwargs):
+    """
+    One `WikiFromTextIterator` per shard of a corpus written by `wiki_to_simple_text_sharded`, e.g. for
+    `Merge() ** text_shards(key)` or for separate jobs.
+
+    Kwargs:
+        :kwargs: further arguments of `WikiFromTextIterator`
+    """
+    return [
+        WikiFromTextIterator(f, index_file=i, **kwargs) for f, i in zip(*text_shard_files(key))
+    ]
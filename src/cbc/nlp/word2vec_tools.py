@@ -4,16 +4,43 @@ cbc.nlp.word2vec_tools
 
 Tools and classes for integrating "cbc.nlp.pipeline" und for
 easing the training of word2vec/doc2vec models
+
+The wrappers train either from the iterator (one python thread feeds all gensim workers, throughput is limited
+by the GIL and the pipeline) or, with `corpus_file`, from a file in gensim's `LineSentence` format to which
+the iterator is written once. In `corpus_file` mode each gensim worker reads its own part of the file, so
+training scales with the number of `workers`.
+
+Example:
+
+    ::
+
+        >>> w2v = Word2VecWrap("w2v_model", corpus_file="corpus.txt", base_folder="/tmp", workers=8)
+        >>> w2v ** tokens_iterator
+        >>> w2v.stats["words_per_second"]
+
+The parameters of the wrappers are those of gensim 4 (`vector_size`, `epochs`, `workers`, ...), the gensim 3
+names `size` and `iter` are still accepted. With `workers="auto"` the number of workers is chosen by short
+training runs on the first documents. During the training the words per second, the learning rate, the loss
+(with `compute_loss=True`) and the time of each epoch are logged to the model log and written to the metrics
+file `<model_filename>.metrics.json`.
 """
 
+import itertools
+import json
 import logging
+import multiprocessing
+import os
+import tempfile
 import time
 from os.path import basename
 from time import strftime
 
+import cbc.content as content
 import cbc.pipeline as pipeline
+from cbc.nlp.token_counts import load_counts
 import numpy as np
 from gensim.models import Word2Vec
+from gensim.models.callbacks import CallbackAny2Vec
 from gensim.models.doc2vec import Doc2Vec, TaggedDocument
 from numpy import dot
 from numpy.linalg import norm as l2
@@ -46,18 +73,223 @@ class TaggedDocuments(pipeline.IteratorModifier):
         return pipeline.Iterator(generator, is_tagged=False)
 
 
+LEGACY_MODEL_KEYS = {'size': 'vector_size', 'iter': 'epochs', 'cbox_mean': 'cbow_mean'}
+"""
+Names of model arguments of gensim 3 (and a misspelling accepted before) and their gensim 4 names
+"""
+
+DEFAULT_CALIBRATION_DOCUMENTS = 10000
+CALIBRATION_TOLERANCE = 0.05
+
+
+def tags_key(corpus_file):
+    return corpus_file + ".tags"
+
+
+def calibration_workers(max_workers=None):
+    """
+    The numbers of workers tried by the calibration: powers of 2 up to the number of cpus and the number of cpus.
+    """
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    return sorted({2 ** i for i in range(max_workers.bit_length()) if 2 ** i <= max_workers} | {max_workers})
+
+
+class TrainingMetrics(CallbackAny2Vec):
+    """
+    Gensim callback logging the words per second, the learning rate reached, the loss (if the model computes
+    it) and the wall time of each epoch to a logger and writing them to a json file (rewritten after each
+    epoch, so that a running training can be watched).
+
+    Args:
+        :model_logger (Logger): the logger of the model
+        :metrics_file (str): the json file, None for logging only
+    """
+
+    def __init__(self, model_logger, metrics_file):
+        self.model_logger = model_logger
+        self.metrics_file = metrics_file
+        self.epochs = []
+        self.summary = {}
+        self.epoch_start = None
+        self.previous_loss = 0.0
+
+    def on_train_begin(self, model):
+        self.epochs = []
+        self.previous_loss = 0.0
+
+    def on_epoch_begin(self, model):
+        self.epoch_start = time.time()
+
+    def on_epoch_end(self, model):
+        seconds = time.time() - self.epoch_start
+        metrics = {
+            "epoch": len(self.epochs) + 1,
+            "seconds": round(seconds, 3),
+            "words_per_second": round(model.corpus_total_words / max(seconds, 1e-9)),
+            "alpha": model.min_alpha_yet_reached
+        }
+        if model.compute_loss:
+            loss = model.get_latest_training_loss()
+            metrics["loss"] = loss - self.previous_loss
+            self.previous_loss = loss
+        self.epochs.append(metrics)
+        self.model_logger.info("epoch %s" % " ".join("%s=%s" % kv for kv in metrics.items()))
+        self.write()
+
+    def write(self):
+        if self.metrics_file is not None:
+            with open(self.metrics_file, "w", encoding="utf-8") as f:
+                json.dump({"epochs": self.epochs, "summary": self.summary}, f, indent=1)
+
+
 class GensimBaseWrap(pipeline.IteratorConsumer):
+    """
+    Base class of `Word2VecWrap` and `Doc2VecWrap`: build the vocabulary, train and save a gensim model.
+
+    Kwargs:
+        :model_filename (str): the model file, the model log is written to `<model_filename>.log`
+        :append_time_str (boolean, default=True): append the time to `model_filename`
+        :corpus_file (str, default=None): if not None, the key of a file (in `LineSentence` format, one document
+            per line, tokens separated by spaces) to which the iterator is written before the training, the
+            vocabulary is built and the model trained from the file (gensim's `corpus_file` mode). For doc2vec the
+            tags of a document are its line number, the tags of the iterator are written to `<corpus_file>.tags`
+        :content_handler (ContentHandler, default=None): the storage of `corpus_file`, if None a
+            FileSystemContentHandler for `base_folder`. Gensim reads from local files, other storages are copied to
+            a temporary local file
+        :base_folder (str, default="."): see `content_handler`
+        :prefix (str, default=""): prefix used with the content handler
+        :reuse_corpus_file (boolean, default=False): if `corpus_file` exists, train from it without reading the
+            iterator (e.g. for training several models from the same corpus)
+        :telemetry (boolean, default=True): log metrics of each epoch (see `TrainingMetrics`)
+        :metrics_file (str, default=None): the metrics file, if None `<model_filename>.metrics.json`
+        :calibration_documents (int, default=10000): with `workers="auto"`: number of documents of the
+            calibration runs
+        :word_freq (Counter, CountTokens, str or list of str, default=None): precomputed token counts, or the
+            key(s) of counts files (see `cbc.nlp.token_counts`, stored with `content_handler`), the vocabulary is
+            built from the counts instead of a pass over the iterator. Only for word2vec, doc2vec needs the
+            document tags collected by the pass
+        :corpus_count (int, default=None): with `word_freq`: number of documents, if None the number stored
+            with the counts
+
+    After the training `stats` holds the time used by each step and the throughput. If the training fails, the
+    error is logged and stored in `stats["error"]`, the model is not saved.
+    """
+
+    write_tags = False
+    model_class = None
+
     def __init__(self,
                  model_filename=None,
-                 append_time_str=True
+                 append_time_str=True,
+                 corpus_file=None,
+                 content_handler=None,
+                 base_folder=".",
+                 prefix="",
+                 reuse_corpus_file=False,
+                 telemetry=True,
+                 metrics_file=None,
+                 calibration_documents=DEFAULT_CALIBRATION_DOCUMENTS,
+                 word_freq=None,
+                 corpus_count=None
                  ):
         if model_filename is None:
             raise Exception("'model_filename' must not be 'None'")
         self.model_filename = model_filename
         if append_time_str:
             self.model_filename = self.model_filename + "_" + strftime("%Y%m%d_%H%M%S")
+        self.corpus_file = corpus_file
+        if content_handler is None:
+            content_handler = content.FileSystemContentHandler(base_prefix=base_folder)
+        self.content_handler = content_handler
+        self.prefix = prefix
+        self.reuse_corpus_file = reuse_corpus_file
+        self.calibration_documents = calibration_documents
+        self.word_freq = word_freq
+        self.corpus_count = corpus_count
+        self.stats = {}
         self.model_logger = self.create_model_logger()
+        self.metrics = None
+        if telemetry:
+            self.metrics = TrainingMetrics(
+                self.model_logger, metrics_file if metrics_file is not None else self.model_filename + ".metrics.json"
+            )
         self.train_args = {}
+        self.model_args = {}
+        self.auto_workers = False
+
+    def split_args(self, kwargs, model_keys, train_keys):
+        """
+        Split the keyword arguments into the arguments of the model and of `train`, translating gensim 3 names.
+        Unknown arguments are logged and ignored.
+        """
+        kwargs = dict(kwargs)
+        for old, new in LEGACY_MODEL_KEYS.items():
+            if old in kwargs:
+                logger.warning("argument '%s' is deprecated, use '%s'" % (old, new))
+                kwargs.setdefault(new, kwargs.pop(old))
+        unknown = [k for k in kwargs if k not in model_keys and k not in train_keys]
+        if unknown:
+            logger.warning("ignoring unknown arguments %s" % unknown)
+        self.train_args = dict((k, kwargs[k]) for k in train_keys if k in kwargs)
+        self.model_args = dict((k, kwargs[k]) for k in model_keys if k in kwargs)
+        if self.model_args.get('workers') == "auto":
+            del self.model_args['workers']
+            return True
+        return False
+
+    def build_vocab_from_freq(self, model):
+        """
+        Build the vocabulary of the model from `word_freq`.
+        """
+        if isinstance(self.word_freq, (str, list, tuple)):
+            word_freq, document_count = load_counts(self.word_freq, prefix=self.prefix,
+                                                    content_handler=self.content_handler)
+        elif hasattr(self.word_freq, 'word_counter'):  # CountTokens
+            word_freq, document_count = self.word_freq.word_counter, self.word_freq.document_count
+        else:
+            word_freq, document_count = self.word_freq, None
+        corpus_count = self.corpus_count if self.corpus_count is not None else document_count
+        if corpus_count is None:
+            logger.warning("number of documents unknown, the progress of the training is estimated by words")
+        model.build_vocab_from_freq(word_freq, corpus_count=corpus_count, trim_rule=self.model_args.get('trim_rule'))
+        model.corpus_total_words = sum(word_freq.values())
+
+    def calibrate_workers(self, corpus_args, max_workers=None):
+        """
+        Train on the first `calibration_documents` documents with the numbers of workers of
+        `calibration_workers`, set the workers of the model to the smallest number reaching almost
+        (CALIBRATION_TOLERANCE) the maximal words per second.
+        """
+        n = self.calibration_documents
+        temporary_file = None
+        if "corpus_file" in corpus_args:
+            fd, temporary_file = tempfile.mkstemp(suffix=".txt")
+            with os.fdopen(fd, "w", encoding="utf-8") as f, open(corpus_args["corpus_file"], encoding="utf-8") as f_in:
+                f.writelines(itertools.islice(f_in, n))
+            sample_args = {"corpus_file": temporary_file}
+        else:
+            sample_args = {"corpus_iterable": list(itertools.islice(corpus_args["corpus_iterable"], n))}
+        try:
+            results = {}
+            for workers in calibration_workers(max_workers):
+                model = self.model_class(**dict(self.model_args, workers=workers, epochs=1))
+                model.build_vocab(**sample_args)
+                start = time.time()
+                model.train(total_examples=model.corpus_count, total_words=model.corpus_total_words, epochs=1,
+                            **sample_args)
+                results[workers] = model.corpus_total_words / max(time.time() - start, 1e-9)
+                self.log("calibration: workers=%i, %.0f words/s" % (workers, results[workers]))
+        finally:
+            if temporary_file is not None:
+                os.remove(temporary_file)
+        best = max(results.values())
+        workers = min(w for w, words_per_second in results.items()
+                      if words_per_second >= best * (1 - CALIBRATION_TOLERANCE))
+        self.model.workers = workers
+        self.stats["calibration"] = results
+        self.log("calibration: using %i workers" % workers)
+        return workers
 
     def create_model_logger(self):
         model_logger_fn = self.model_filename + ".log"
@@ -71,25 +303,108 @@ class GensimBaseWrap(pipeline.IteratorConsumer):
     def get_iterator(self, iterator):
         return iterator
 
+    def log(self, message):
+        self.model_logger.info(message)
+        logger.info(message)
+
+    def write_corpus_file(self, iterator):
+        """
+        Write the iterator to `corpus_file` (unless it is reused).
+        """
+        if self.reuse_corpus_file and self.content_handler.exists(self.corpus_file, prefix=self.prefix):
+            self.log("reusing corpus file %s" % self.corpus_file)
+            return
+        start = time.time()
+        tags = [] if self.write_tags and iterator.is_tagged else None
+
+        def to_bytes(x):
+            if iterator.is_tagged:
+                if tags is not None:
+                    tags.append(str(x[1]))
+                x = x[0]
+            return (" ".join(x) + "\n").encode("utf-8")
+
+        self.content_handler.write_iterator(iterator, self.corpus_file, prefix=self.prefix, to_bytes_function=to_bytes,
+                                            compression=None)
+        if tags is not None:
+            self.content_handler.save_text(tags_key(self.corpus_file), "\n".join(tags), prefix=self.prefix)
+        self.stats["spill_seconds"] = time.time() - start
+        self.log("written corpus file %s, time used = %i s" % (self.corpus_file, self.stats["spill_seconds"]))
+
+    def local_corpus_file(self):
+        """
+        The local path of `corpus_file` and whether it is a temporary copy.
+        """
+        if isinstance(self.content_handler, content.FileSystemContentHandler):
+            return str(self.content_handler.get_full_path(self.corpus_file, prefix=self.prefix)), False
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for line in self.content_handler.iterate_lines(self.corpus_file, prefix=self.prefix, compression=None):
+                f.write(line)
+        return path, True
+
+    def log_throughput(self, model, seconds, result):
+        """
+        Log the words per second of the training (raw words, i.e. before subsampling, of all epochs).
+        """
+        epochs = self.train_args.get('epochs') or model.epochs
+        raw_words = model.corpus_total_words * epochs
+        self.stats.update(
+            mode="corpus_file" if self.corpus_file is not None else "iterable",
+            train_seconds=seconds,
+            raw_words=raw_words,
+            words_per_second=raw_words / max(seconds, 1e-9)
+        )
+        if isinstance(result, tuple):
+            self.stats["trained_words"] = result[0]
+        self.log("trained %i words (%s mode, %i epochs, %i workers), time used = %.1f s, %.0f words/s" % (
+            raw_words, self.stats["mode"], epochs, model.workers, seconds, self.stats["words_per_second"]))
+
     def __call__(self, iterator):
+        temporary_file = None
+        self.stats.pop("error", None)
         try:
             model = self.model
             model_logger = self.model_logger
             model_logger.info("starting")
             logger.info("starting")
+            if self.corpus_file is not None:
+                self.write_corpus_file(iterator)
+                path, is_temporary = self.local_corpus_file()
+                if is_temporary:
+                    temporary_file = path
+                corpus_args = {"corpus_file": path}
+            else:
+                corpus_args = {"corpus_iterable": self.get_iterator(iterator)}
+            if self.auto_workers:
+                self.calibrate_workers(corpus_args)
             start = time.time()
             model_logger.info("build vocab")
             logger.info("build vocab")
             #
-            i = self.get_iterator(iterator)
-            model.build_vocab(i)
+            if self.word_freq is not None:
+                self.build_vocab_from_freq(model)
+            else:
+                model.build_vocab(**corpus_args)
             #
             time_used = time.time() - start
+            self.stats["vocab_seconds"] = time_used
             log = "built vocab, time used = %i s" % time_used
             model_logger.info(log)
             logger.info(log)
             #
-            model.train(i, total_examples=model.corpus_count, **self.train_args)
+            train_args = dict(self.train_args)
+            if self.metrics is not None:
+                train_args['callbacks'] = list(train_args.get('callbacks', ())) + [self.metrics]
+            start = time.time()
+            result = model.train(
+                total_examples=model.corpus_count or None, total_words=model.corpus_total_words, **corpus_args,
+                **train_args
+            )
+            self.log_throughput(model, time.time() - start, result)
+            if self.metrics is not None:
+                self.metrics.summary = dict(self.stats, model=self.model_filename, workers=model.workers)
+                self.metrics.write()
             #
             log = "saving model to file %s" % self.model_filename
             model_logger.info(log)
@@ -103,29 +418,54 @@ class GensimBaseWrap(pipeline.IteratorConsumer):
             self.model = model
             return self
         except Exception as e:
+            self.stats["error"] = "%s: %s" % (type(e).__name__, e)
+            self.model_logger.error("error creating model: %s" % self.stats["error"])
             logger.error("error creating model %s" % self.model_filename, exc_info=True)
+            return self
+        finally:
+            if temporary_file is not None:
+                os.remove(temporary_file)
 
 
 class Word2VecWrap(GensimBaseWrap):
+    model_class = Word2Vec
+
     def __init__(self,
                  model_filename="w2v_model",
                  append_time_str=True,
                  replace=True,
+                 corpus_file=None,
+                 content_handler=None,
+                 base_folder=".",
+                 prefix="",
+                 reuse_corpus_file=False,
+                 telemetry=True,
+                 metrics_file=None,
+                 calibration_documents=DEFAULT_CALIBRATION_DOCUMENTS,
+                 word_freq=None,
+                 corpus_count=None,
                  **kwargs
                  ):
+        # compute_loss is an argument of both: `Word2Vec.train` sets the model's compute_loss to its own argument
+        # (default False), so it is passed to `train`, too
         train_keys = [
-            'epochs', 'start_alpha', 'end_alpha', 'queue_factor', 'report_delay',
+            'epochs', 'start_alpha', 'end_alpha', 'word_count', 'queue_factor', 'report_delay',
             'compute_loss', 'callbacks'
         ]
-        self.train_args = dict((k, kwargs[k]) for k in train_keys if k in kwargs)
         model_keys = [
-            'size', 'window', 'min_count', 'sg', 'hs', 'negative',
-            'ns_exponent', 'cbox_mean', 'alpha', 'min_alpha', 'seed', 'max_vocab_size',
-            'max_final_vocab', 'sample', 'hashfxn', 'iter', 'trim_rule'
+            'vector_size', 'window', 'min_count', 'sg', 'hs', 'negative',
+            'ns_exponent', 'cbow_mean', 'alpha', 'min_alpha', 'seed', 'max_vocab_size',
+            'max_final_vocab', 'sample', 'hashfxn', 'epochs', 'trim_rule', 'workers', 'null_word',
+            'sorted_vocab', 'batch_words', 'shrink_windows', 'compute_loss'
         ]
-        self.model_args = dict((k, kwargs[k]) for k in model_keys if k in kwargs)
         self.replace = replace
-        super(Word2VecWrap, self).__init__(model_filename=model_filename, append_time_str=append_time_str)
+        super(Word2VecWrap, self).__init__(
+            model_filename=model_filename, append_time_str=append_time_str, corpus_file=corpus_file,
+            content_handler=content_handler, base_folder=base_folder, prefix=prefix,
+            reuse_corpus_file=reuse_corpus_file, telemetry=telemetry, metrics_file=metrics_file,
+            calibration_documents=calibration_documents, word_freq=word_freq, corpus_count=corpus_count
+        )
+        self.auto_workers = self.split_args(kwargs, model_keys, train_keys)
         self.model = Word2Vec(**self.model_args)
         if self.train_args.get('epochs') is None:
             self.train_args['epochs'] = self.model.epochs
@@ -135,25 +475,43 @@ class Word2VecWrap(GensimBaseWrap):
 
 
 class Doc2VecWrap(GensimBaseWrap):
+    write_tags = True
+    model_class = Doc2Vec
+
     def __init__(self,
                  model_filename="d2v_model",
                  append_time_str=True,
+                 corpus_file=None,
+                 content_handler=None,
+                 base_folder=".",
+                 prefix="",
+                 reuse_corpus_file=False,
+                 telemetry=True,
+                 metrics_file=None,
+                 calibration_documents=DEFAULT_CALIBRATION_DOCUMENTS,
                  **kwargs
                  ):
         train_keys = [
             'epochs', 'start_alpha', 'end_alpha', 'word_count', 'queue_factor', 'report_delay',
             'callbacks'
         ]
-        self.train_args = dict((k, kwargs[k]) for k in train_keys if k in kwargs)
         model_keys = [
             'dm', 'vector_size', 'window', 'alpha', 'min_alpha', 'seed', 'min_count', 'max_vocab_size',
             'sample', 'workers', 'epochs', 'hs', 'negative', 'ns_exponent', 'dm_mean', 'dm_concat',
-            'dm_tag_count', 'dbow_words', 'trim_rule'
+            'dm_tag_count', 'dbow_words', 'trim_rule', 'max_final_vocab', 'hashfxn', 'sorted_vocab',
+            'batch_words', 'shrink_windows'
         ]
-        self.model_args = dict((k, kwargs[k]) for k in model_keys if k in kwargs)
-        super(Doc2VecWrap, self).__init__(model_filename=model_filename, append_time_str=append_time_str)
+        super(Doc2VecWrap, self).__init__(
+            model_filename=model_filename, append_time_str=append_time_str, corpus_file=corpus_file,
+            content_handler=content_handler, base_folder=base_folder, prefix=prefix,
+            reuse_corpus_file=reuse_corpus_file, telemetry=telemetry, metrics_file=metrics_file,
+            calibration_documents=calibration_documents
+        )
+        self.auto_workers = self.split_args(kwargs, model_keys, train_keys)
         self.model_logger.info("input train args %s" % self.train_args)
         self.model = Doc2Vec(**self.model_args)
+        if self.train_args.get('epochs') is None:
+            self.train_args['epochs'] = self.model.epochs
         self.model_logger.info("model string %s" % self.model)
 
     def get_iterator(self, iterator):
@@ -60,7 +60,9 @@ import cbc.nlp.base        >>> import cbc.nlp.pipeline as pipeline
 Iterators may be used as *document input* for word2vec training.
 """
 import ast
+import hashlib
 import random
+import sqlite3
 import string
 import sys
 
@@ -70,6 +72,8 @@ import xml.etree.ElementTree as eT
 
 import logging
 import numbers
+import queue
+import threading
 from itertools import compress
 
 from . import content
@@ -78,6 +82,11 @@ STANDARD_SEPARATOR = ":-):-|:-("
 
 logger = logging.getLogger('cbc.pipeline')
 
+_instrumentation = None
+"""
+The active instrumentation of pipelines (see "cbc.instrumentation"), None if instrumentation is disabled.
+"""
+
 
 class Iterator:
     """
@@ -148,6 +157,8 @@ class IteratorModifier:
     """
 
     def __pow__(self, iterator):
+        if _instrumentation is not None:
+            return _instrumentation.apply(self, self.__call__, iterator)
         return self.__call__(iterator)
 
     def __call__(self, iterator):
@@ -166,6 +177,8 @@ class IteratorConsumer:
     """
 
     def __pow__(self, iterator):
+        if _instrumentation is not None:
+            return _instrumentation.apply(self, self.__call__, iterator)
         return self.__call__(iterator)
 
     def __call__(self, iterator):
@@ -246,6 +259,8 @@ import cbc.nlp.base        >>> import cbc.nlp.pipeline as pipeline
         return MulItemModifier(self, other)
 
     def __pow__(self, other):
+        if _instrumentation is not None:
+            return _instrumentation.apply(self, self.apply_to_iterator, other)
         return self.apply_to_iterator(other)
 
     def apply_to_iterator(self, iterator):
@@ -289,6 +304,8 @@ class MulItemModifier(ItemModifier):
         return MulItemModifier(self, other)
 
     def __pow__(self, other):
+        if _instrumentation is not None:
+            return _instrumentation.apply(self, self.apply_to_iterator, other)
         return self.apply_to_iterator(other)
 
 
@@ -545,6 +562,243 @@ class Flatten(IteratorModifier):
         return Iterator(generator, is_tagged=False)
 
 
+def workload_hash(workload, digest_size=8):
+    """
+    Hash (int) of a workload: a text, a list of tokens or any other object (hashed by its `repr`).
+    """
+    if isinstance(workload, str):
+        data = workload.encode("utf-8", errors="surrogatepass")
+    elif isinstance(workload, (list, tuple)) and all(isinstance(t, str) for t in workload):
+        data = b"\x00".join(t.encode("utf-8", errors="surrogatepass") for t in workload) + b"\x01"
+    else:
+        data = repr(workload).encode("utf-8", errors="backslashreplace")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=digest_size).digest(), 'little', signed=True)
+
+
+class HashSet:
+    """
+    Set of (64 bit) hashes with bounded memory: up to `max_memory_items` hashes are kept in a python set,
+    beyond that they are spilled to a temporary SQLite database on disk. A Bloom filter over the spilled
+    hashes avoids most disk lookups of new hashes.
+    """
+
+    def __init__(self, max_memory_items=10000000, bloom_bits=2 ** 27, bloom_hashes=4):
+        self.max_memory_items = max_memory_items
+        self.bloom_bits = bloom_bits
+        self.bloom_hashes = bloom_hashes
+        self.memory = set()
+        self.bloom = None
+        self.connection = None
+        self.spilled = 0
+
+    def _bloom_positions(self, h):
+        h &= 0xffffffffffffffff
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        return [(h1 + i * h2) % self.bloom_bits for i in range(self.bloom_hashes)]
+
+    def _spill(self):
+        if self.connection is None:
+            # an empty file name is a private temporary database on disk, deleted when closed
+            self.connection = sqlite3.connect("")
+            self.connection.execute("CREATE TABLE hashes (h INTEGER PRIMARY KEY)")
+            self.bloom = bytearray(self.bloom_bits // 8 + 1)
+        for h in self.memory:
+            for p in self._bloom_positions(h):
+                self.bloom[p >> 3] |= 1 << (p & 7)
+        self.connection.executemany("INSERT OR IGNORE INTO hashes (h) VALUES (?)", ((h,) for h in self.memory))
+        self.connection.commit()
+        self.spilled += len(self.memory)
+        logger.debug("HashSet: spilled %i hashes to disk, total %i" % (len(self.memory), self.spilled))
+        self.memory = set()
+
+    def __contains__(self, h):
+        if h in self.memory:
+            return True
+        if self.connection is None:
+            return False
+        for p in self._bloom_positions(h):
+            if not self.bloom[p >> 3] & (1 << (p & 7)):
+                return False
+        return self.connection.execute("SELECT 1 FROM hashes WHERE h = ?", (h,)).fetchone() is not None
+
+    def add(self, h):
+        self.memory.add(h)
+        if len(self.memory) >= self.max_memory_items:
+            self._spill()
+
+    def close(self):
+        self.memory = set()
+        self.bloom = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Deduplicate(IteratorModifier):
+    """
+    Drop items whose workload (text, list of tokens, ...) is an exact duplicate of an earlier item of the
+    same pass, e.g. boilerplate paragraphs in merged corpora. Tags are passed through unchanged, i.e. the
+    first occurrence of a workload is kept with its tags.
+
+    Workloads are compared by a 64 bit hash (blake2b). At most `max_memory_items` hashes are held in memory,
+    more are spilled to a temporary file (see `HashSet`). The counts of the last pass are in `stats`.
+
+    Kwargs:
+        :max_memory_items (int, default=10000000): hashes kept in memory before spilling to disk
+        :key (function, default=None): computes the compared value from the workload (e.g. `str.lower`),
+            if None the workload itself
+    """
+
+    def __init__(self, max_memory_items=10000000, key=None):
+        self.max_memory_items = max_memory_items
+        self.key = key
+        self.stats = {"items": 0, "duplicates": 0}
+        super(Deduplicate, self).__init__()
+
+    def __call__(self, iterator):
+        def generator():
+            seen = HashSet(max_memory_items=self.max_memory_items)
+            self.stats = {"items": 0, "duplicates": 0}
+            try:
+                for x in iterator:
+                    workload = x[0] if iterator.is_tagged else x
+                    h = workload_hash(workload if self.key is None else self.key(workload))
+                    self.stats["items"] += 1
+                    if h in seen:
+                        self.stats["duplicates"] += 1
+                        continue
+                    seen.add(h)
+                    yield x
+            finally:
+                seen.close()
+                logger.info("Deduplicate: dropped %i of %i items (%.1f%%)" % (
+                    self.stats["duplicates"], self.stats["items"], 100.0 * self.dedup_ratio
+                ))
+
+        return Iterator(generator, is_tagged=iterator.is_tagged)
+
+    @property
+    def dedup_ratio(self):
+        """
+        The share of dropped items of the last pass.
+        """
+        return self.stats["duplicates"] / max(1, self.stats["items"])
+
+
+class Broadcast(IteratorConsumer):
+    """
+    Feed several consumers from a single pass over an iterator.
+
+    Without Broadcast, each consumer iterates the pipeline on its own, so expensive stages
+    (e.g. lemmatization) run once per consumer. Broadcast iterates the pipeline once and
+    passes every item to all consumers. Each consumer runs in its own thread and reads its items
+    from a queue holding at most `buffer_size` items. One consumer may run `inline`, i.e. in the calling
+    thread, reading the items directly from the iterator (no queue and no thread switches, e.g. for a cheap
+    consumer or for a consumer which is not thread safe).
+
+    Tags are passed through, every consumer gets its own copy of the tag list.
+    A failing consumer does not stop the others, its exception is stored in `errors`.
+    Consumers which iterate their input more than once (e.g. the gensim wrappers) only see
+    the items in the first pass.
+
+    Example:
+
+    ::
+
+        >>> b = pipeline.Broadcast([base.CountTokens(), base.TokensToFile("tokens.txt")], inline=0) ** i
+        >>> counter, token_file = b.results
+
+    Args:
+        :consumers (list of IteratorConsumer): the consumers
+
+    Kwargs:
+        :buffer_size (int, default=100): maximum number of items buffered for each consumer
+        :inline (int, default=None): the index of the consumer running in the calling thread, if None all
+            consumers run in threads of their own
+    """
+    END = object()
+
+    def __init__(self, consumers, buffer_size=100, inline=None):
+        self.consumers = list(consumers)
+        self.buffer_size = buffer_size
+        if inline is not None and not 0 <= inline < len(self.consumers):
+            raise ValueError("Broadcast: 'inline' must be the index of a consumer, not %s" % inline)
+        self.inline = inline
+        self.results = []
+        self.errors = []
+
+    def __call__(self, iterator):
+        n = len(self.consumers)
+        threaded = [i for i in range(n) if i != self.inline]
+        queues = [queue.Queue(maxsize=self.buffer_size) for _ in range(n)]
+        done = [threading.Event() for _ in range(n)]
+        finished = [False] * n
+        self.results = [None] * n
+        self.errors = [None] * n
+
+        def consumer_input(i):
+            def generator():
+                while not finished[i]:
+                    x = queues[i].get()
+                    if x is Broadcast.END:
+                        finished[i] = True
+                    else:
+                        yield x
+
+            return Iterator(generator, is_tagged=iterator.is_tagged)
+
+        def consume(i, consumer_iterator):
+            try:
+                self.results[i] = self.consumers[i](consumer_iterator)
+            except Exception as e:
+                logger.error("Broadcast: consumer %i (%s) failed" % (i, type(self.consumers[i]).__name__),
+                             exc_info=True)
+                self.errors[i] = e
+            finally:
+                done[i].set()
+
+        def run(i):
+            consume(i, consumer_input(i))
+            # a consumer which stopped before the end (or failed) drains its queue until END, so that the
+            # blocking puts of the producer always return
+            while not finished[i]:
+                finished[i] = queues[i].get() is Broadcast.END
+
+        if iterator.is_tagged:
+            def copy_item(x):
+                return x[0], list(x[1])
+        else:
+            def copy_item(x):
+                return x
+
+        def items():
+            # feeds the threaded consumers, yields the items for the inline consumer
+            for x in iterator:
+                for i in threaded:
+                    if not done[i].is_set():
+                        queues[i].put(copy_item(x))
+                yield x
+                if all(done[i].is_set() for i in range(n)):
+                    return
+
+        threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in threaded]
+        for t in threads:
+            t.start()
+        try:
+            source = items()
+            if self.inline is not None:
+                consume(self.inline, Iterator(lambda: source, is_tagged=iterator.is_tagged))
+            # the rest of the items (all if no consumer is inline) for the threaded consumers
+            for _ in source:
+                pass
+        finally:
+            for i in threaded:
+                queues[i].put(Broadcast.END)
+            for t in threads:
+                t.join()
+        return self
+
+
 class RandomStringsGenerator(ListGenerator):
     def __init__(self, number_of_docs=10, length_of_words=5, number_of_words=15, is_tagged=False):
         def gen_word():
@@ -570,7 +824,9 @@ class LineSourceIterator(BaseGenerator):
             base_folder=".",
             input_encoding=None,
             log_freq=1000,
-            output_freq=1
+            output_freq=1,
+            compression="infer",
+            decompression_workers=1
     ):
         self.file_key = file_key
         if content_handler is None:
@@ -584,13 +840,22 @@ class LineSourceIterator(BaseGenerator):
         self.prefix = prefix
         self.log_freq = log_freq
         self.output_freq = output_freq
+        self.compression = compression
+        self.decompression_workers = decompression_workers
         self.get_line = lambda line: line
         super(LineSourceIterator, self).__init__()
 
+    def iterate_lines(self):
+        if self.decompression_workers > 1:
+            return self.content_handler.iterate_lines_parallel(
+                self.file_key, prefix=self.prefix, compression=self.compression, workers=self.decompression_workers
+            )
+        return self.content_handler.iterate_lines(self.file_key, prefix=self.prefix, compression=self.compression)
+
     def __call__(self):
         c_in = 0
         c_out = 0
-        for line in self.content_handler.iterate_lines(self.file_key, prefix=self.prefix):
+        for line in self.iterate_lines():
             if c_in % self.output_freq == 0:
                 if c_out % self.log_freq == 0:
                     logger.debug("read=%i, ouput=%i\n" % (c_in, c_out))
@@ -610,7 +875,9 @@ class TaggedLineSourceIterator(LineSourceIterator):
         self.tag_separator = tag_separator
         super(TaggedLineSourceIterator, self).__init__(input_file, **kwargs)
 
-        first_line = next(self.content_handler.iterate_lines(input_file, prefix=self.prefix))
+        first_line = next(
+            self.content_handler.iterate_lines(input_file, prefix=self.prefix, compression=self.compression)
+        )
         if first_line is not None:
             line_l = first_line.split(self.tag_separator)
             if len(line_l) > 1: